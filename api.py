@@ -1,15 +1,173 @@
-import cv2
 from flask import Flask
-from flask import request, jsonify
+from flask import request, jsonify, Response
 from flask_cors import CORS, cross_origin
 from pathlib import Path
-import json
+import math
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from imageProcess.cache import ContourCache
+from incremental import IncrementalPlanner
+from machine import DEFAULT_PROFILE, MachineProfile
 from maker import Maker, Preparer
+from jobs import JobQueue, QueueFull, DONE, FAILED
+import instrument
 
 ROOT = Path(__file__).parent
+PROFILE_DIR = ROOT / "profiles"  # <name>.json / <name>.toml, picked with "machine"
+RESULT_WAIT = 300  # (s) how long /submit waits for its job before giving up
+RETRY_AFTER = 5  # (s) sent back to clients when the queue is full
+MAX_DRAWINGS = 16  # drawings kept for editing, the least recently used go first
 app = Flask(__name__)
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 app.config["CORS_HEADERS"] = "Content-Type"
+jobs = JobQueue(workers=2, maxQueued=8)
+contourCache = ContourCache()  # shared by the image jobs, keyed by image content
+machines = {}  # name -> MachineProfile, loaded the first time they're used
+drawings = OrderedDict()  # id -> (lock, IncrementalPlanner)
+drawingsLock = threading.Lock()
+
+
+def getMachine(name=None):
+    """the MachineProfile called name from PROFILE_DIR, DEFAULT_PROFILE for None"""
+    if not name:
+        return DEFAULT_PROFILE
+    if name not in machines:
+        if not re.fullmatch(r"[\w-]+", name):
+            raise KeyError(name)
+        for suffix in (".json", ".toml"):
+            path = PROFILE_DIR / (name + suffix)
+            if path.exists():
+                machines[name] = MachineProfile.load(path)
+                break
+        else:
+            raise KeyError(name)
+    return machines[name]
+
+
+def renderStrokes(strokes, colors=None, machine=None):
+    return Preparer(strokes, colors=colors, profile=machine).make()
+
+
+def renderImage(imageBytes, filename, machine=None, resolution=None):
+    # every job gets its own directory, the contour finder writes next to the image
+    directory = tempfile.mkdtemp(prefix="painter-")
+    try:
+        path = Path(directory) / ("upload" + Path(filename or "").suffix)
+        path.write_bytes(imageBytes)
+        machine = machine or DEFAULT_PROFILE
+        return Preparer(
+            path,
+            profile=machine,
+            contourCache=contourCache,
+            imageResolution=resolution or machine.imageResolution,
+        ).make()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def queueJob():
+    """
+    Turn the request into a job: a JSON list of strokes (or {"strokes": [...], "colors": [...]}
+    with an optional pot color per stroke) or an image file uploaded as the "image" form field.
+    The machine profile is picked with ?machine=<name> or a "machine" key in the JSON.
+    Images are downscaled to the profile's imageResolution, or ?resolution=<mm>.
+    The job's result is (moves, machine).
+    Returns (job, None) or (None, error response).
+    """
+    profile = request.args.get("profile") == "1"
+    machineName = request.args.get("machine")
+    upload = request.files.get("image")
+    data = None if upload is not None else request.get_json(silent=True)
+    if isinstance(data, dict):
+        machineName = data.get("machine", machineName)
+    try:
+        machine = getMachine(machineName)
+    except KeyError:
+        return None, (jsonify({"error": f"unknown machine {machineName!r}"}), 400)
+    if upload is not None:
+        resolution = request.args.get("resolution")
+        if resolution is not None:
+            try:
+                resolution = float(resolution)
+            except ValueError:
+                resolution = math.nan
+            if not 0 < resolution < math.inf:
+                return None, (jsonify({"error": "resolution must be mm > 0"}), 400)
+        imageBytes, filename = upload.read(), upload.filename
+        work = lambda: (
+            renderImage(imageBytes, filename, machine, resolution),
+            machine,
+        )
+    else:
+        colors = None
+        if isinstance(data, dict):
+            data, colors = data.get("strokes"), data.get("colors")
+        if not isinstance(data, list) or not data:
+            return None, (
+                jsonify({"error": "send a JSON list of strokes or an image file"}),
+                400,
+            )
+        work = lambda: (renderStrokes(data, colors, machine), machine)
+    try:
+        return jobs.submit(work, profile=profile), None
+    except QueueFull as e:
+        response = jsonify({"error": f"server busy, {e}"})
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return None, (response, 503)
+
+
+def streamProgram(moves, machine=None):
+    # the program is formatted block by block while it's sent
+    separator = ""
+    for block in Maker(profile=machine).iterBlocks(moves):
+        yield separator + block
+        separator = "\n"
+
+
+@app.route("/jobs", methods=["POST"])
+@cross_origin()
+def createJob():
+    """
+    Queue a render and return its id straight away (202).
+    Poll /jobs/<id> for the status and fetch /jobs/<id>/result once it is done.
+    Responds 503 with Retry-After when the queue is full.
+    """
+    job, error = queueJob()
+    if error:
+        return error
+    response = jsonify(job.toDict())
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+
+@app.route("/jobs/<jobId>", methods=["GET"])
+@cross_origin()
+def jobStatus(jobId):
+    job = jobs.get(jobId)
+    if job is None:
+        return jsonify({"error": "no such job"}), 404
+    info = job.toDict()
+    info["queued"] = jobs.queued()
+    return jsonify(info)
+
+
+@app.route("/jobs/<jobId>/result", methods=["GET"])
+@cross_origin()
+def jobResult(jobId):
+    """the G-code of a finished job, streamed as plain text"""
+    job = jobs.get(jobId)
+    if job is None:
+        return jsonify({"error": "no such job"}), 404
+    if job.status == FAILED:
+        return jsonify(job.toDict()), 422
+    if job.status != DONE:
+        return jsonify(job.toDict()), 409
+    return Response(streamProgram(*job.result), mimetype="text/plain")
 
 
 @app.route("/submit", methods=["POST"])
@@ -17,26 +175,133 @@ app.config["CORS_HEADERS"] = "Content-Type"
 def submit():
     """
     This function is called when the user submits a new program.
-    It returns the result of the program.
+    It returns the result of the program, and the per stage timings / counters for it.
+    Add ?profile=1 to also get a cProfile summary.
+
+    Runs as a job like /jobs but waits for it to finish.
+    """
+    job, error = queueJob()
+    if error:
+        return error
+    if not job.wait(RESULT_WAIT):
+        return jsonify({"error": "timed out", "id": job.id}), 504
+    if job.status == FAILED:
+        return jsonify(job.toDict()), 422
+    moves, machine = job.result
+    commandString = Maker(profile=machine).dump(moves)
+    return jsonify({"commands": commandString, "metrics": job.metrics})
+
+
+def getDrawing(drawingId):
+    with drawingsLock:
+        drawing = drawings.get(drawingId)
+        if drawing is not None:
+            drawings.move_to_end(drawingId)
+        return drawing
+
+
+@app.route("/drawings", methods=["POST"])
+@cross_origin()
+def createDrawing():
+    """
+    Plan a drawing that will be edited, from {"strokes": [...], "colors": [...], "machine": name}
+    (colors and machine are optional). Stroke i gets id i, edit it with PATCH /drawings/<id>.
     """
-    data = request.get_json()
-    maker = Maker()
-    maker.loadArrayJSON(data)
-    commandString = maker.dump()
-    with open(ROOT / "test.json", "w") as w:
-        json.dump(data, w)
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        data = {"strokes": data}
+    if not isinstance(data, dict) or not data.get("strokes"):
+        return jsonify({"error": "send a JSON list of strokes"}), 400
+    try:
+        machine = getMachine(data.get("machine"))
+        # the drawing keeps its place on the bed until it grows past its bounds
+        planner = IncrementalPlanner(
+            data["strokes"], colors=data.get("colors"), profile=machine, refit=False
+        )
+        planner.program()
+    except KeyError:
+        return jsonify({"error": f"unknown machine {data.get('machine')!r}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    drawingId = uuid.uuid4().hex
+    with drawingsLock:
+        drawings[drawingId] = (threading.Lock(), planner)
+        while len(drawings) > MAX_DRAWINGS:
+            drawings.popitem(last=False)
+    response = jsonify({"id": drawingId, "order": planner.order()})
+    response.status_code = 201
+    response.headers["Location"] = f"/drawings/{drawingId}"
+    return response
 
-    return jsonify({"commands": commandString})
 
+@app.route("/drawings/<drawingId>", methods=["PATCH"])
+@cross_origin()
+def editDrawing(drawingId):
+    """
+    Edit a drawing with {"add": [{"stroke": [...], "color": ..}], "remove": [ids],
+    "change": [{"id": id, "stroke": [...], "color": ..}]}, every key optional.
+
+    Returns the ids of the added strokes and the G-code of every stroke that changed
+    ("segments"). If "refit" is true the drawing moved on the bed (its bounds changed),
+    so all of the program changed, fetch it again from /drawings/<id>/program.
+    Edits are applied in order (removes, changes, adds) up to the first bad one.
+    """
+    drawing = getDrawing(drawingId)
+    if drawing is None:
+        return jsonify({"error": "no such drawing"}), 404
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "send a JSON object of edits"}), 400
+    lock, planner = drawing
+    with lock:
+        try:
+            for strokeId in data.get("remove", []):
+                planner.remove(strokeId)
+            for edit in data.get("change", []):
+                planner.change(edit["id"], edit.get("stroke"), edit.get("color"))
+            added = [
+                planner.add(edit["stroke"], edit.get("color"))
+                for edit in data.get("add", [])
+            ]
+            planner.program()
+        except KeyError as e:
+            return jsonify({"error": f"no stroke {e}"}), 400
+        except (TypeError, ValueError, IndexError) as e:
+            return jsonify({"error": str(e)}), 400
+        report = dict(planner.report)
+        segments = {
+            strokeId: planner.segment(strokeId) for strokeId in report["repainted"]
+        }
+        return jsonify(
+            {
+                "added": added,
+                "report": report,
+                "segments": segments,
+                "order": planner.order(),
+            }
+        )
+
+
+@app.route("/drawings/<drawingId>/program", methods=["GET"])
+@cross_origin()
+def drawingProgram(drawingId):
+    """the G-code of the drawing as it is now, as plain text"""
+    drawing = getDrawing(drawingId)
+    if drawing is None:
+        return jsonify({"error": "no such drawing"}), 404
+    lock, planner = drawing
+    with lock:
+        return Response(planner.program(), mimetype="text/plain")
+
+
+@app.route("/drawings/<drawingId>", methods=["DELETE"])
+@cross_origin()
+def deleteDrawing(drawingId):
+    with drawingsLock:
+        if drawings.pop(drawingId, None) is None:
+            return jsonify({"error": "no such drawing"}), 404
+    return "", 204
 
-img_path = ROOT / "imageProcess" / "stickman_me.png"
-maker = Maker()
-prep = Preparer(img_path)
-moves = prep.make()
 
-commandString = maker.dump(moves)
-with open(ROOT / "test.txt", "w") as w:
-    w.write(commandString)
-print("DONE")
-# if __name__ == "__main__":
-#     app.run(port=5000)
+if __name__ == "__main__":
+    app.run(port=5000)
@@ -0,0 +1,42 @@
+"""
+Size of the G-code with modal word compression and collinear point merging.
+
+    python benchmarks/bench_compress.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maker import Maker, Preparer  # noqa: E402
+
+from generators import STROKE_GENERATORS  # noqa: E402
+
+COUNT = 1000
+TOLERANCES = [None, 0.02, 0.05, 0.2]
+
+
+def main():
+    print(
+        f"{'strokes':<14} {'tolerance':>9} {'lines':>9} {'bytes':>10}"
+        f" {'lines saved':>11} {'bytes saved':>11} {'dump (s)':>9}"
+    )
+    for name, generate in STROKE_GENERATORS.items():
+        moves = Preparer(generate(COUNT)).make()
+        for tolerance in TOLERANCES:
+            maker = Maker(compress=True, tolerance=tolerance)
+            start = time.perf_counter()
+            maker.dump(moves)
+            seconds = time.perf_counter() - start
+            report = maker.reduction(moves)
+            print(
+                f"{name:<14} {str(tolerance):>9} {report['linesAfter']:>9}"
+                f" {report['bytesAfter']:>10} {report['linesSaved']:>11.1%}"
+                f" {report['bytesSaved']:>11.1%} {seconds:9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Throughput of estimate.estimate on large toolpaths.
+
+    python benchmarks/bench_estimate.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from estimate import estimate  # noqa: E402
+from maker import Preparer  # noqa: E402
+
+from generators import randomCurves  # noqa: E402
+
+COPIES = [1, 4, 16]
+
+
+def main():
+    moves = Preparer(randomCurves(1000)).make()
+    print(f"{'moves':>10} {'seconds':>9} {'moves/s':>12}  machine time (h)")
+    for copies in COPIES:
+        job = moves.take(np.tile(np.arange(len(moves)), copies))
+        start = time.perf_counter()
+        report = estimate(job)
+        seconds = time.perf_counter() - start
+        print(
+            f"{len(job):>10} {seconds:9.3f} {len(job) / seconds:12.0f}"
+            f"  {report['seconds'] / 3600:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Latency of editing a planned drawing with IncrementalPlanner against planning it again.
+
+    python benchmarks/bench_incremental.py
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from incremental import IncrementalPlanner  # noqa: E402
+from maker import Maker, Preparer  # noqa: E402
+
+from generators import randomCurves  # noqa: E402
+
+COUNTS = [1000, 5000]
+EDITS = 20
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    random.seed(0)
+    print(
+        f"{'strokes':>8} {'full (s)':>9} {'edit (s)':>9} {'refit edit (s)':>15}"
+        f" {'repainted':>10}"
+    )
+    for count in COUNTS:
+        strokes = randomCurves(count)
+        full = timed(lambda: Maker().dump(Preparer(strokes).make()))
+        results = {}
+        for refit in (False, True):
+            planner = IncrementalPlanner(strokes, refit=refit)
+            planner.program()
+            seconds, repainted = [], []
+            for _ in range(EDITS):
+                strokeId = random.choice(list(planner.strokes))
+                moved = planner.strokes[strokeId] + np.random.uniform(-2, 2, 2)
+                seconds.append(
+                    timed(lambda: (planner.change(strokeId, moved), planner.program()))
+                )
+                repainted.append(len(planner.report["repainted"]))
+            results[refit] = np.median(seconds), np.mean(repainted)
+        print(
+            f"{count:>8} {full:9.3f} {results[False][0]:9.4f} {results[True][0]:15.3f}"
+            f" {results[False][1]:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
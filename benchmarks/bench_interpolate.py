@@ -0,0 +1,61 @@
+"""
+Benchmark for ContourFinder.interpolateContours, serial against the process pool.
+
+    python benchmarks/bench_interpolate.py
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from imageProcess.processor import ContourFinder  # noqa: E402
+
+SIZES = [250, 1000, 4000]
+WORKERS = sorted({2, 4, os.cpu_count() or 1})
+
+
+def randomContours(count, seed=0):
+    """closed wobbly loops in the (n, 1, 2) int32 layout cv2.findContours returns"""
+    rnd = np.random.default_rng(seed)
+    contours = []
+    for _ in range(count):
+        points = rnd.integers(20, 200)
+        angle = np.linspace(0, 2 * np.pi, points, endpoint=False)
+        radius = rnd.uniform(10, 80) * (1 + 0.1 * rnd.standard_normal(points))
+        center = rnd.uniform(0, 2000, size=2)
+        loop = (
+            center + np.column_stack([np.cos(angle), np.sin(angle)]) * radius[:, None]
+        )
+        contours.append(loop.astype(np.int32).reshape(-1, 1, 2))
+    return contours
+
+
+def main():
+    finder = ContourFinder(img=None)
+    header = f"{'contours':>9} {'serial (s)':>11}"
+    for workers in WORKERS:
+        header += f" {f'{workers} procs (s)':>13}"
+    print(header)
+    for count in SIZES:
+        contours = randomContours(count)
+        start = time.perf_counter()
+        expected = finder.interpolateContours(contours)
+        row = f"{count:>9} {time.perf_counter() - start:11.3f}"
+        for workers in WORKERS:
+            start = time.perf_counter()
+            result = finder.interpolateContours(contours, workers=workers)
+            elapsed = time.perf_counter() - start
+            same = len(result) == len(expected) and all(
+                (a == b).all() for a, b in zip(result, expected)
+            )
+            row += f" {elapsed:12.3f}{'' if same else '!'}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
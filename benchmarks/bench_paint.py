@@ -0,0 +1,53 @@
+"""
+Preparer._paint (a whole color at once) against painting one stroke at a time with
+Preparer._paintStroke, on the synthetic stroke sets. Both make the same moves.
+
+    python benchmarks/bench_paint.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maker import Preparer  # noqa: E402
+
+from generators import STROKE_GENERATORS  # noqa: E402
+
+COUNT = 5000
+SIZES = [150, 2000]  # drawing size in input units, 150 is about the bed in mm
+
+
+def paintTime(preparer, plan, strokeAtATime):
+    preparer.moves = type(preparer.moves)()
+    start = time.perf_counter()
+    for color, strokes in plan:
+        if strokeAtATime:
+            travelLength = 0
+            for stroke in strokes:
+                travelLength = preparer._paintStroke(stroke.tolist(), travelLength)
+        else:
+            preparer._paint(strokes)
+    return time.perf_counter() - start, len(preparer.moves)
+
+
+def main():
+    print(
+        f"{'strokes':>14} {'size':>5} {'moves':>8}"
+        f" {'per stroke (s)':>15} {'per color (s)':>14} {'speedup':>8}"
+    )
+    for name, generator in STROKE_GENERATORS.items():
+        for size in SIZES:
+            preparer = Preparer(generator(COUNT, size=size))
+            plan = preparer.planStrokes()
+            loop, moves = paintTime(preparer, plan, True)
+            bulk, _ = paintTime(preparer, plan, False)
+            print(
+                f"{name:>14} {size:>5} {moves:>8}"
+                f" {loop:15.3f} {bulk:14.3f} {loop / bulk:7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
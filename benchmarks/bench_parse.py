@@ -0,0 +1,60 @@
+"""
+Reading G-code back with gcode.parseFile and checking it with validate.validate, on
+programs of growing size, with the peak memory of the process.
+
+    python benchmarks/bench_parse.py
+"""
+
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from gcode import parseFile  # noqa: E402
+from maker import Maker, Preparer  # noqa: E402
+from validate import validate  # noqa: E402
+
+from generators import randomCurves  # noqa: E402
+
+COPIES = [1, 4, 16]
+
+
+def peakMB():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    program = Maker().dump(Preparer(randomCurves(2000)).make())
+    start, _, rest = program.partition("G0 ")
+    body = "G0 " + rest + "\n"
+    print(
+        f"{'MB':>7} {'lines':>10} {'parse (s)':>10} {'lines/s':>10}"
+        f" {'validate (s)':>13} {'peak MB':>8}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "program.gcode"
+        for copies in COPIES:
+            with open(path, "w") as w:
+                w.write(start)
+                for _ in range(copies):
+                    w.write(body)
+            lines = 0
+            began = time.perf_counter()
+            for chunk in parseFile(path):
+                lines = chunk.lineCount
+            parseTime = time.perf_counter() - began
+            began = time.perf_counter()
+            report = validate(path)
+            validateTime = time.perf_counter() - began
+            assert report["ok"], report
+            print(
+                f"{path.stat().st_size / 1e6:7.1f} {lines:>10} {parseTime:10.2f}"
+                f" {lines / parseTime:10.0f} {validateTime:13.2f} {peakMB():8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+StrokeSet.resample on the synthetic stroke sets, and what it does to Preparer.make.
+
+    python benchmarks/bench_resample.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maker import Preparer  # noqa: E402
+
+from generators import STROKE_GENERATORS  # noqa: E402
+
+COUNT = 5000
+SPACINGS = [None, 0.5, 1, 2]  # (mm) on the bed
+
+
+def main():
+    print(
+        f"{'strokes':>14} {'spacing':>8} {'points':>9}"
+        f" {'resample (s)':>13} {'make (s)':>9}"
+    )
+    for name, generator in STROKE_GENERATORS.items():
+        strokes = generator(COUNT)
+        for spacing in SPACINGS:
+            start = time.perf_counter()
+            preparer = Preparer(strokes, strokeSpacing=spacing)
+            resampled = time.perf_counter() - start
+            start = time.perf_counter()
+            preparer.make()
+            made = time.perf_counter() - start
+            print(
+                f"{name:>14} {str(spacing):>8} {len(preparer.array.points):>9}"
+                f" {resampled:13.3f} {made:9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
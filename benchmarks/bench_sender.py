@@ -0,0 +1,47 @@
+"""
+Streaming throughput of sender.Sender against a simulated Marlin on a pty, character
+counting against sending one line at a time (ping pong), with and without line errors.
+
+    python benchmarks/bench_sender.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maker import Maker, Preparer  # noqa: E402
+from sender import FakeMarlin, Sender, openPort  # noqa: E402
+
+from generators import randomCurves  # noqa: E402
+
+STROKES = 3
+BAUDRATE = 115200
+TIME_SCALE = 0.0005  # run the machine faster than real time, so the link is the limit
+MODES = {"ping pong": 1, "char counting": 128}
+ERRORS = [None, 50]
+
+
+def main():
+    moves = Preparer(randomCurves(STROKES)).make()
+    lines = list(Maker().iterLines(moves))
+    print(
+        f"{'mode':<14} {'errors':>7} {'lines/s':>8} {'starvations':>12}"
+        f" {'resends':>8} {'seconds':>8}"
+    )
+    for errorEvery in ERRORS:
+        for mode, rxBufferSize in MODES.items():
+            with FakeMarlin(
+                baudrate=BAUDRATE, timeScale=TIME_SCALE, errorEvery=errorEvery
+            ) as marlin:
+                sender = Sender(openPort(marlin.device), rxBufferSize=rxBufferSize)
+                report = sender.stream(lines)
+            print(
+                f"{mode:<14} {str(errorEvery):>7} {report['linesPerSecond']:8.0f}"
+                f" {report['starvations']:>12} {report['resends']:>8}"
+                f" {report['seconds']:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
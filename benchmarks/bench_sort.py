@@ -0,0 +1,92 @@
+"""
+Benchmark for Optomise.sortStrokes against the old list scanning implementation.
+
+    python benchmarks/bench_sort.py
+"""
+
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maker import Optomise  # noqa: E402
+
+from generators import denseHatching  # noqa: E402
+
+SIZES = [500, 2000, 8000, 32000, 128000]
+NAIVE_LIMIT = 8000  # the quadratic version gets very slow past this
+
+
+def naiveSortStrokes(strokes):
+    """the original O(n^2) ordering, kept here as the reference"""
+    strokes = list(strokes)
+    first = strokes[0]
+    sortedStrokes = [first]
+    strokes.remove(first)
+    while len(strokes) != 0:
+        endX = sortedStrokes[-1][-1][0]
+        endY = sortedStrokes[-1][-1][1]
+        closestIdx = None
+        closestDist = None
+        for i, stroke in enumerate(strokes):
+            dist = math.sqrt((stroke[0][0] - endX) ** 2 + (stroke[0][1] - endY) ** 2)
+            if closestDist is None or dist < closestDist:
+                closestDist = dist
+                closestIdx = i
+        sortedStrokes.append(strokes[closestIdx])
+        strokes.remove(strokes[closestIdx])
+    return sortedStrokes
+
+
+def randomStrokes(count, size=4000, seed=0):
+    rnd = random.Random(seed)
+    strokes = []
+    for _ in range(count):
+        x, y = rnd.randint(0, size), rnd.randint(0, size)
+        stroke = []
+        for _ in range(rnd.randint(2, 12)):
+            stroke.append([x, y])
+            x += rnd.randint(-8, 8)
+            y += rnd.randint(-8, 8)
+        strokes.append(stroke)
+    return strokes
+
+
+def timeit(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    # load scipy before timing anything
+    Optomise.sortStrokes(randomStrokes(10))
+    print(
+        f"{'strokes':>18} {'naive (s)':>10} {'index (s)':>10} {'reverse (s)':>12}"
+        f" {'same':>5}"
+    )
+    for name in ("random", "hatching"):
+        for count in SIZES:
+            if name == "random":
+                strokes = randomStrokes(count)
+            else:
+                # every end is far from the next start
+                strokes = denseHatching(count, points=4)
+            indexTime, ordered = timeit(Optomise.sortStrokes, strokes)
+            reverseTime, _ = timeit(Optomise.sortStrokes, strokes, allowReverse=True)
+            if count <= NAIVE_LIMIT:
+                naiveTime, expected = timeit(naiveSortStrokes, strokes)
+                same = "yes" if expected == ordered else "NO"
+                naive = f"{naiveTime:10.3f}"
+            else:
+                same, naive = "-", f"{'-':>10}"
+            print(
+                f"{name:>9} {count:>8} {naive} {indexTime:10.3f} {reverseTime:12.3f} {same:>5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Startup time of the server modules, each import in a fresh interpreter.
+
+    python benchmarks/bench_startup.py
+
+Also checks that importing them doesn't pull in opencv / scipy, those should only
+be loaded once an image is processed.
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+MODULES = ["gcode", "maker", "jobs", "api"]
+HEAVY = ["cv2", "scipy", "tkinter"]
+TARGET = 1.0  # (s) for a worker that only serves JSON strokes
+REPEAT = 5
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def importTime(module):
+    """best of REPEAT fresh imports, and the heavy modules that came with it"""
+    best, heavy = None, []
+    for _ in range(REPEAT):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best = result["seconds"] if best is None else min(best, result["seconds"])
+        heavy = result["heavy"]
+    return best, heavy
+
+
+def main():
+    print(f"{'module':<8} {'import (s)':>11}  heavy modules loaded")
+    slow = False
+    for module in MODULES:
+        seconds, heavy = importTime(module)
+        print(f"{module:<8} {seconds:11.3f}  {', '.join(heavy) or '-'}")
+        slow = slow or seconds > TARGET or bool(heavy)
+    if slow:
+        print(f"startup over {TARGET}s or importing heavy modules")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
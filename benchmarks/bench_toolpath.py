@@ -0,0 +1,58 @@
+"""
+Getting the G-code for a planned job back from a saved toolpath file, against
+planning it again from the strokes saved as json.
+
+    python benchmarks/bench_toolpath.py
+"""
+
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maker import Maker, Preparer  # noqa: E402
+
+from generators import randomCurves  # noqa: E402
+
+SIZES = [1000, 5000, 20000]
+
+
+def timed(work):
+    start = time.perf_counter()
+    result = work()
+    return time.perf_counter() - start, result
+
+
+def main():
+    print(
+        f"{'strokes':>8} {'moves':>8} {'json+plan (s)':>14} {'save (s)':>9}"
+        f" {'load (s)':>9} {'dump (s)':>9} {'MB':>6}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            jsonPath = Path(directory) / "strokes.json"
+            with open(jsonPath, "w") as w:
+                json.dump(randomCurves(size), w)
+
+            def plan():
+                with open(jsonPath) as r:
+                    preparer = Preparer(json.load(r))
+                preparer.make()
+                return preparer
+
+            planTime, preparer = timed(plan)
+            path = Path(directory) / "job.toolpath"
+            saveTime, _ = timed(lambda: preparer.save(path))
+            loadTime, (maker, moves) = timed(lambda: Maker.load(path))
+            dumpTime, _ = timed(lambda: maker.dump(moves))
+            print(
+                f"{size:>8} {len(moves):>8} {planTime:14.3f} {saveTime:9.3f}"
+                f" {loadTime:9.4f} {dumpTime:9.3f} {path.stat().st_size / 1e6:6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Synthetic inputs for the benchmarks.
+
+Stroke sets come back in the [[[x, y], [x, y]], ...] list format Preparer takes,
+images are written to png files so they go through the same path as uploads.
+"""
+
+import math
+from pathlib import Path
+
+import numpy as np
+
+
+def randomCurves(count, points=50, size=2000, seed=0):
+    """smooth random walks, like contours traced from a line drawing"""
+    rnd = np.random.default_rng(seed)
+    start = rnd.uniform(0, size, size=(count, 1, 2))
+    heading = rnd.uniform(0, 2 * math.pi, size=(count, 1))
+    turn = np.cumsum(rnd.normal(0, 0.25, size=(count, points)), axis=1)
+    angle = heading + turn
+    step = np.stack([np.cos(angle), np.sin(angle)], axis=2) * 6
+    curves = start + np.cumsum(step, axis=1)
+    return np.round(curves).astype(int).tolist()
+
+
+def denseHatching(count, points=50, size=2000, spacing=3, seed=0):
+    """parallel diagonal lines packed closely together, like shading"""
+    rnd = np.random.default_rng(seed)
+    offsets = np.arange(count) * spacing
+    t = np.arange(points) * (size / points)
+    xs = (t[None, :] + rnd.uniform(0, 1, size=(count, 1))).round()
+    ys = (offsets[:, None] + t[None, :] * 0.5) % size
+    return np.stack([xs, ys.round()], axis=2).astype(int).tolist()
+
+
+def photoEdges(count, points=50, size=2000, seed=0):
+    """short jittery fragments scattered everywhere, like Canny edges of a photo"""
+    rnd = np.random.default_rng(seed)
+    start = rnd.uniform(0, size, size=(count, 1, 2))
+    step = rnd.integers(-3, 4, size=(count, points, 2))
+    step[..., 0] = np.where(step[..., 0] == 0, 1, step[..., 0])
+    return (start.round().astype(int) + np.cumsum(step, axis=1)).tolist()
+
+
+STROKE_GENERATORS = {
+    "randomCurves": randomCurves,
+    "denseHatching": denseHatching,
+    "photoEdges": photoEdges,
+}
+
+
+def lineImage(path, size, seed=0):
+    """white image with random dark curves, few clean edges"""
+    import cv2
+
+    img = np.full((size, size, 3), 255, np.uint8)
+    for curve in randomCurves(max(size // 40, 1), points=40, size=size, seed=seed):
+        cv2.polylines(img, [np.array(curve, np.int32)], False, (0, 0, 0), 3)
+    cv2.imwrite(str(path), img)
+    return Path(path)
+
+
+def photoImage(path, size, seed=0):
+    """smooth gradients with noise and blobs, lots of small edges like a photo"""
+    import cv2
+
+    rnd = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    base = 127 + 60 * np.sin(6 * x + 3 * y) * np.cos(5 * y)
+    noise = cv2.GaussianBlur(rnd.normal(0, 40, size=(size, size)), (0, 0), 3)
+    gray = np.clip(base + noise, 0, 255).astype(np.uint8)
+    for _ in range(size // 20):
+        center = tuple(int(v) for v in rnd.integers(0, size, size=2))
+        cv2.circle(
+            gray,
+            center,
+            int(rnd.integers(5, size // 10)),
+            int(rnd.integers(0, 255)),
+            -1,
+        )
+    cv2.imwrite(str(path), cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+    return Path(path)
+
+
+IMAGE_GENERATORS = {
+    "lineImage": lineImage,
+    "photoImage": photoImage,
+}
@@ -0,0 +1,146 @@
+"""
+Benchmark suite for the painter pipeline.
+
+Runs every synthetic stroke set and image at increasing sizes and times
+Optomise.sortStrokes, Preparer.make, Preparer._manipulate and Maker.dump
+separately (plus the image stages for image inputs).
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json
+
+With --baseline every stage is compared against the saved run and the exit
+code is 1 if any of them got slower than --threshold times the baseline.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import instrument  # noqa: E402
+from maker import Maker, Preparer  # noqa: E402
+
+from generators import IMAGE_GENERATORS, STROKE_GENERATORS  # noqa: E402
+
+STROKE_SIZES = {
+    "small": [200, 1000],
+    "full": [200, 1000, 5000, 20000],
+}
+IMAGE_SIZES = {
+    "small": [512],
+    "full": [512, 1024, 2048],
+}
+STAGES = [
+    "Optomise.sortStrokes",
+    "Preparer.make",
+    "Preparer._manipulate",
+    "Maker.dump",
+]
+
+
+def runJob(inputItem):
+    """one full pipeline run, returns the stage timings and counters"""
+    # Preparer prints warnings, keep them out of the JSON on stdout
+    with instrument.collect() as metrics, contextlib.redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        moves = Preparer(inputItem).make()
+        Maker().writeTo(io.StringIO(), moves)
+        metrics.record("total", time.perf_counter() - start)
+    return metrics.toDict()
+
+
+def bestOf(inputItem, repeat):
+    """keep the fastest time for each stage over repeat runs"""
+    best = None
+    for _ in range(repeat):
+        result = runJob(inputItem)
+        if best is None:
+            best = result
+            continue
+        for stage, seconds in result["timings"].items():
+            best["timings"][stage] = min(best["timings"].get(stage, seconds), seconds)
+    return best
+
+
+def runSuite(preset="small", repeat=3):
+    cases = {}
+    for name, generate in STROKE_GENERATORS.items():
+        for count in STROKE_SIZES[preset]:
+            key = f"{name}/{count}"
+            print(f"running {key}", file=sys.stderr)
+            cases[key] = bestOf(generate(count), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, generate in IMAGE_GENERATORS.items():
+            for size in IMAGE_SIZES[preset]:
+                key = f"{name}/{size}px"
+                print(f"running {key}", file=sys.stderr)
+                path = generate(Path(tmp) / f"{name}_{size}.png", size)
+                cases[key] = bestOf(path, repeat)
+
+    return {
+        "meta": {
+            "preset": preset,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": cases,
+    }
+
+
+def compare(results, baseline, threshold):
+    """print a stage by stage comparison, returns the list of regressions"""
+    regressions = []
+    print(f"{'case':<28} {'stage':<24} {'base (s)':>9} {'now (s)':>9} {'ratio':>6}")
+    for key, case in results["cases"].items():
+        base = baseline["cases"].get(key)
+        if base is None:
+            continue
+        for stage in STAGES + ["total"]:
+            if stage not in case["timings"] or stage not in base["timings"]:
+                continue
+            now, then = case["timings"][stage], base["timings"][stage]
+            ratio = now / then if then else float("inf")
+            flag = ""
+            if ratio > threshold:
+                flag = " <-- slower"
+                regressions.append((key, stage, ratio))
+            print(f"{key:<28} {stage:<24} {then:9.4f} {now:9.4f} {ratio:6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--preset", choices=STROKE_SIZES, default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a saved results file")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = runSuite(args.preset, args.repeat)
+    if args.output:
+        with open(args.output, "w") as w:
+            json.dump(results, w, indent=2)
+    if args.baseline:
+        with open(args.baseline) as r:
+            regressions = compare(results, json.load(r), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than {args.threshold}x baseline")
+            return 1
+    elif not args.output:
+        json.dump(results, sys.stdout, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import re
+
+import numpy as np
+
+from gcode import KIND_MOVE, KIND_PAUSE, KIND_REFILL, KIND_WASH, MoveBuffer, SetupCNC
+from machine import DEFAULT_PROFILE
+
+AXES = "XYZ"
+_WORD = re.compile(r"([A-Z])(-?[\d.]+)")
+
+
+def machineLimits(setup=None):
+    """
+    Acceleration, feed rate and jerk limits from the M201/M203/M204/M205 lines of a SetupCNC.
+
+    Returns
+    -------
+    dict
+        maxAccel / maxFeed / jerk: {"X": .., "Y": .., "Z": ..} in mm/s^2, mm/s and mm/s,
+        printAccel / travelAccel: mm/s^2
+    """
+    setup = setup or SetupCNC()
+    words = {}
+    for command in setup.start_commands:
+        code, _, rest = command.split(";")[0].partition(" ")
+        words[code] = {name: float(value) for name, value in _WORD.findall(rest)}
+    return {
+        "maxAccel": {axis: words["M201"][axis] for axis in AXES},
+        "maxFeed": {axis: words["M203"][axis] for axis in AXES},
+        "printAccel": words["M204"]["P"],
+        "travelAccel": words["M204"]["T"],
+        "jerk": {axis: words["M205"][axis] for axis in AXES},
+    }
+
+
+def _fill(column, start):
+    # modal value of an axis at every row: the last one given, start before that
+    rows = np.arange(len(column))
+    last = np.maximum.accumulate(np.where(np.isnan(column), -1, rows))
+    return np.where(last >= 0, column[np.maximum(last, 0)], start)
+
+
+def _runs(mask):
+    # number of separate runs of True in mask
+    return int(np.count_nonzero(mask[1:] & ~mask[:-1]) + (len(mask) > 0 and mask[0]))
+
+
+def estimate(moves, profile=None, start=(0.0, 0.0, 0.0), drawHeight=None):
+    """
+    Distances, cycle counts and machine time for a toolpath, without running it.
+
+    Time follows a Marlin style planner: every move gets a trapezoid speed profile
+    limited by its feed rate and the M203 axis feed rates, accelerating at the M204
+    travel acceleration (nothing here extrudes) capped by M201 per axis. The speed
+    through each corner is limited by the M205 jerk, and the forward / backward
+    planner passes are done as prefix minimums over the whole job, so all of it is
+    numpy and scales to millions of moves. Pauses (M0) stop the machine and add no
+    time, the wait for the user is unknown.
+
+    Parameters
+    ----------
+    moves: MoveBuffer|list
+        the toolpath, e.g. Preparer.make() or Maker.optimise() output
+    profile: MachineProfile|None
+        the machine, its start G-code is where the limits come from. None for DEFAULT_PROFILE
+    start: (x, y, z)
+        where the machine is before the first move (home)
+    drawHeight: float|None
+        (mm) drawing moves at or below this z have the brush on the paper, the
+        profile's zHeight if None. Refills, washes and other moves immune to the bed
+        limits count as pen up
+
+    Returns
+    -------
+    dict
+        penDownDistance, penUpDistance, zDistance (mm), refills, washes, pauses,
+        seconds, penDownSeconds
+    """
+    if not isinstance(moves, MoveBuffer):
+        moves = MoveBuffer.fromMoves(list(moves))
+    if moves.blocks:
+        moves = moves.expand()
+    profile = profile or DEFAULT_PROFILE
+    limits = machineLimits(profile.cached("setup", lambda: SetupCNC(profile)))
+    if drawHeight is None:
+        drawHeight = profile.zHeight
+    kind = moves.kind
+    moving = kind != KIND_PAUSE
+    report = {
+        "moves": len(moves),
+        "refills": _runs(kind == KIND_REFILL),
+        "washes": _runs(kind == KIND_WASH),
+        "pauses": int(np.count_nonzero(~moving)),
+    }
+
+    # positions after each row, a pause row doesn't move the machine
+    index = np.flatnonzero(moving)
+    if len(index) == 0:
+        report.update(
+            penDownDistance=0.0,
+            penUpDistance=0.0,
+            zDistance=0.0,
+            seconds=0.0,
+            penDownSeconds=0.0,
+        )
+        return report
+    points = np.column_stack(
+        [
+            _fill(np.where(moving, column, np.nan), origin)[index]
+            for column, origin in zip((moves.x, moves.y, moves.z), start)
+        ]
+    )
+    feed = _fill(np.where(moving & (moves.f > 0), moves.f, np.nan), np.nan)[index] / 60
+    points = np.vstack([np.asarray(start, dtype=np.float64), points])
+    delta = np.diff(points, axis=0)
+    length = np.sqrt((delta**2).sum(axis=1))
+    planar = np.hypot(delta[:, 0], delta[:, 1])
+    # the brush also goes down in the pots and the wash, that isn't drawing
+    drawing = (kind[index] == KIND_MOVE) & ~moves.immune[index]
+    penDown = drawing & (points[:-1, 2] <= drawHeight) & (points[1:, 2] <= drawHeight)
+    report["penDownDistance"] = float(planar[penDown].sum())
+    report["penUpDistance"] = float(planar[~penDown].sum())
+    report["zDistance"] = float(np.abs(delta[:, 2]).sum())
+
+    # a pause before a move means it starts from rest
+    pausedBefore = np.zeros(len(index), dtype=bool)
+    pausedBefore[1:] = index[1:] - index[:-1] > 1
+    pausedBefore[0] = index[0] > 0
+    keep = length > 0
+    seconds = np.zeros(len(length))
+    if keep.any():
+        # a pause followed by moves that go nowhere still stops the machine
+        stops = np.cumsum(pausedBefore)
+        stopped = np.diff(np.concatenate([[0], stops[keep]])) > 0
+        seconds[keep] = _moveTimes(
+            delta[keep], length[keep], feed[keep], stopped, limits
+        )
+    report["seconds"] = float(seconds.sum())
+    report["penDownSeconds"] = float(seconds[penDown].sum())
+    return report
+
+
+def _moveTimes(delta, length, feed, stopped, limits):
+    # seconds for each (non zero) move, stopped marks moves that start from rest
+    unit = delta / length[:, None]
+    share = np.abs(unit)
+    with np.errstate(divide="ignore"):
+        maxFeed = np.array([limits["maxFeed"][axis] for axis in AXES]) / share
+        maxAccel = np.array([limits["maxAccel"][axis] for axis in AXES]) / share
+    cruise = np.minimum(np.nan_to_num(feed, nan=np.inf), maxFeed.min(axis=1))
+    accel = np.minimum(limits["travelAccel"], maxAccel.min(axis=1))
+
+    # corner speeds (squared): junction k is before move k, junction n is the end.
+    # with classic jerk each axis may change speed by at most its jerk instantly
+    jerk = np.array([limits["jerk"][axis] for axis in AXES])
+    previous = np.vstack([np.zeros(3), unit])
+    following = np.vstack([unit, np.zeros(3)])
+    change = np.abs(following - previous)
+    # stopping for a pause: coming to rest, then starting again
+    stop = np.append(stopped, False)
+    change[stop] = np.maximum(np.abs(previous[stop]), np.abs(following[stop]))
+    with np.errstate(divide="ignore"):
+        corner = (jerk / change).min(axis=1)
+    speeds = np.concatenate([[np.inf], cruise, [np.inf]])
+    corner = np.minimum(corner, np.minimum(speeds[:-1], speeds[1:])) ** 2
+
+    # planner passes: speed^2 can change by at most 2 * accel * length over a move.
+    # forward: w[k] = min(corner[k], w[k-1] + gain[k-1]) = S[k] + min_j<=k(corner[j] - S[j])
+    gain = 2 * accel * length
+    reach = np.concatenate([[0.0], np.cumsum(gain)])
+    entry = reach + np.minimum.accumulate(corner - reach)
+    # backward, the same from the end of the job
+    remaining = reach[-1] - reach
+    entry = np.minimum(
+        entry, remaining + np.minimum.accumulate((entry - remaining)[::-1])[::-1]
+    )
+    entry = np.sqrt(np.maximum(entry, 0))
+    v0, v1 = entry[:-1], entry[1:]
+
+    # trapezoid, or a triangle if the move is too short to reach the cruise speed
+    accelDistance = (cruise**2 - v0**2) / (2 * accel)
+    decelDistance = (cruise**2 - v1**2) / (2 * accel)
+    flat = length - accelDistance - decelDistance
+    peak = np.where(
+        flat >= 0,
+        cruise,
+        np.sqrt(np.maximum((2 * accel * length + v0**2 + v1**2) / 2, 0)),
+    )
+    ramps = (2 * peak - v0 - v1) / accel
+    return ramps + np.maximum(flat, 0) / cruise
@@ -1,5 +1,14 @@
-from re import X
-from tkinter import Y
+import functools
+import itertools
+import re
+import numpy as np
+
+# what emitted a row of a MoveBuffer
+KIND_MOVE = 0
+KIND_PAUSE = 1
+KIND_REFILL = 2
+KIND_WASH = 3
+KIND_BLOCK = 4  # a whole GcodeBlock, see MoveBuffer.addBlock
 
 
 class CommandBuffer:
@@ -36,14 +45,12 @@ class Move:
         self.f = f
         self.rapid = rapid
         self.__command = ""
-        self.command = self._setCommand()
         self.immuneToLimits = immuneToLimits  # sets whether the move should be constrained by the X_MIN, X_MAX, Y_MIN, Y_MAX, Z_MIN, Z_MAX limits set in maker.py
 
-    def __getattr__(self, name):
-        if name == "command":
-            return self._setCommand()
-        else:
-            return super().__getattribute__(name)
+    @property
+    def command(self):
+        # built on demand, use formatMoves for whole blocks of moves
+        return self.getCommand()
 
     def getCommand(self):
         self.__command = ""
@@ -81,7 +88,6 @@ class Pause(Move):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.__command = ""
-        self.command = self._setCommand()
 
     def getCommand(self):
         self.__command = ""
@@ -93,13 +99,572 @@ class Pause(Move):
         return self.__command
 
 
+class MoveBuffer:
+    """
+    Struct of arrays store for a toolpath, one typed column per Move attribute.
+
+    Rows are added with add() (same arguments as Move) or append()/extend() for
+    existing Move objects and other buffers. Indexing a row gives back a Move (or a
+    Pause) built from the columns, changing that object does not change the buffer.
+    Missing axes (None) are stored as NaN. e and f come back as ints when they hold
+    whole numbers, since that is what the rest of the code passes in.
+
+    A row can also stand for a whole GcodeBlock (addBlock), the block is referenced
+    from the row not copied in, and indexing that row gives the block back.
+    """
+
+    COLUMNS = {
+        "x": np.float64,
+        "y": np.float64,
+        "z": np.float64,
+        "e": np.float64,
+        "f": np.float64,
+        "rapid": np.bool_,
+        "immune": np.bool_,
+        "kind": np.uint8,
+        "block": np.int32,  # index into blocks for KIND_BLOCK rows, -1 otherwise
+    }
+
+    def __init__(self, capacity=256):
+        self._size = 0
+        self._columns = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, dtype in self.COLUMNS.items()
+        }
+        self.blocks = []
+        self._blockIds = {}
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take(np.arange(self._size)[idx])
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError("MoveBuffer index out of range")
+        row = {name: column[idx] for name, column in self._columns.items()}
+        if row["kind"] == KIND_BLOCK:
+            return self.blocks[row["block"]]
+        kwargs = dict(
+            x=_fromColumn(row["x"]),
+            y=_fromColumn(row["y"]),
+            z=_fromColumn(row["z"]),
+            e=_fromColumn(row["e"], whole=True),
+            f=_fromColumn(row["f"], whole=True),
+            rapid=bool(row["rapid"]),
+            immuneToLimits=bool(row["immune"]),
+        )
+        if row["kind"] == KIND_PAUSE:
+            return Pause(**kwargs)
+        return Move(**kwargs)
+
+    def __getattr__(self, name):
+        # column views, e.g. buffer.x
+        columns = self.__dict__.get("_columns")
+        if columns is not None and name in columns:
+            return columns[name][: self._size]
+        raise AttributeError(name)
+
+    @property
+    def nbytes(self):
+        return sum(column[: self._size].nbytes for column in self._columns.values())
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._columns["x"])
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: self._size] = column[: self._size]
+            self._columns[name] = grown
+
+    def add(
+        self,
+        x=None,
+        y=None,
+        z=None,
+        e=None,
+        f=None,
+        rapid=False,
+        immuneToLimits=False,
+        kind=KIND_MOVE,
+    ):
+        """add one row, the arguments match Move"""
+        self._reserve(1)
+        i = self._size
+        columns = self._columns
+        columns["x"][i] = np.nan if x is None else x
+        columns["y"][i] = np.nan if y is None else y
+        columns["z"][i] = np.nan if z is None else z
+        columns["e"][i] = np.nan if e is None else e
+        columns["f"][i] = np.nan if f is None else f
+        columns["rapid"][i] = rapid
+        columns["immune"][i] = immuneToLimits
+        columns["kind"][i] = kind
+        columns["block"][i] = -1
+        self._size += 1
+
+    @classmethod
+    def fromColumns(cls, columns, blocks=()):
+        """
+        Buffer over existing column arrays (one for every name in COLUMNS, all the same
+        length) without copying them, e.g. np.memmap arrays from toolpath.load.
+
+        Columns of another dtype are converted (copied). Adding rows moves the buffer to
+        new arrays first, so read only columns are fine until rows are changed in place.
+        """
+        size = len(columns["x"])
+        buffer = cls(capacity=0)
+        for name, dtype in cls.COLUMNS.items():
+            column = np.asarray(columns[name], dtype=dtype)
+            if column.shape != (size,):
+                raise ValueError(f"column {name} doesn't have {size} rows")
+            buffer._columns[name] = column
+        buffer._size = size
+        for block in blocks:
+            buffer._blockId(block)
+        return buffer
+
+    def _blockId(self, block):
+        blockId = self._blockIds.get(id(block))
+        if blockId is None:
+            blockId = self._blockIds[id(block)] = len(self.blocks)
+            self.blocks.append(block)
+        return blockId
+
+    def addBlock(self, block):
+        """
+        add a GcodeBlock as a single row, the row holds where the block leaves the machine
+        """
+        self.add(block.x, block.y, block.z, block.e, block.f, False, True, KIND_BLOCK)
+        self._columns["block"][self._size - 1] = self._blockId(block)
+
+    def addColumns(self, **columns):
+        """
+        add many rows at once from arrays (or scalars that apply to every row)
+
+        e.g. buffer.addColumns(x=xs, y=ys, z=Z_HEIGHT, e=0, f=FEED_RATE, rapid=True)
+        """
+        lengths = [np.size(value) for value in columns.values() if np.ndim(value) > 0]
+        count = max(lengths) if lengths else 1
+        self._reserve(count)
+        start, end = self._size, self._size + count
+        for name in self.COLUMNS:
+            value = columns.get(name, _DEFAULTS[name])
+            self._columns[name][start:end] = np.nan if value is None else value
+        self._size = end
+
+    def append(self, move):
+        """add a Move, Pause or GcodeBlock object"""
+        if isinstance(move, GcodeBlock):
+            self.addBlock(move)
+            return
+        self.add(
+            move.x,
+            move.y,
+            move.z,
+            move.e,
+            move.f,
+            move.rapid,
+            move.immuneToLimits,
+            KIND_PAUSE if isinstance(move, Pause) else KIND_MOVE,
+        )
+
+    def extend(self, moves):
+        """add every row of another MoveBuffer, or a list of Move objects"""
+        if isinstance(moves, MoveBuffer):
+            count = len(moves)
+            self._reserve(count)
+            for name, column in self._columns.items():
+                column[self._size : self._size + count] = getattr(moves, name)
+            added = self._columns["block"][self._size : self._size + count]
+            if moves.blocks:
+                # the other buffer numbers its blocks its own way
+                ids = np.full(len(moves.blocks) + 1, -1)
+                for blockId in np.unique(added[added >= 0]).tolist():
+                    ids[blockId] = self._blockId(moves.blocks[blockId])
+                added[:] = ids[added]
+            self._size += count
+            return
+        for move in moves:
+            self.append(move)
+
+    @classmethod
+    def concatenate(cls, buffers):
+        """new buffer with the rows of every buffer in turn, one copy per column"""
+        buffers = list(buffers)
+        sizes = [len(buffer) for buffer in buffers]
+        joined = cls(capacity=max(sum(sizes), 1))
+        for name, column in joined._columns.items():
+            parts = [
+                buffer._columns[name][:size] for buffer, size in zip(buffers, sizes)
+            ]
+            if parts:
+                np.concatenate(parts, out=column[: sum(sizes)])
+        joined._size = sum(sizes)
+        # every buffer numbers its blocks its own way, number them across all of them
+        # then keep the ones rows refer to
+        firsts, blocks = [], []
+        for buffer in buffers:
+            firsts.append(len(blocks))
+            blocks.extend(buffer.blocks)
+        if blocks:
+            column = joined.block
+            used = column >= 0
+            column[used] += np.repeat(firsts, sizes)[used]
+            ids = np.full(len(blocks), -1, dtype=np.int32)
+            for blockId in np.unique(column[used]).tolist():
+                ids[blockId] = joined._blockId(blocks[blockId])
+            column[used] = ids[column[used]]
+        return joined
+
+    def take(self, indices):
+        """new buffer with the given rows"""
+        taken = MoveBuffer(capacity=max(len(indices), 1))
+        for name, column in self._columns.items():
+            taken._columns[name][: len(indices)] = column[: self._size][indices]
+        taken._size = len(indices)
+        taken.blocks = list(self.blocks)
+        taken._blockIds = dict(self._blockIds)
+        return taken
+
+    def expand(self):
+        """new buffer with every GcodeBlock row replaced by the moves in the block"""
+        if not self.blocks:
+            return self[:]
+        # one gather from this buffer followed by the moves of every block
+        isBlock = self.kind == KIND_BLOCK
+        blockIds = np.where(isBlock, self.block, 0)
+        sizes = np.array([len(block.moves) for block in self.blocks])
+        firsts = len(self) + np.cumsum(sizes) - sizes
+        rows = np.where(isBlock, sizes[blockIds], 1)
+        starts = np.where(isBlock, firsts[blockIds], np.arange(len(self)))
+        within = np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+        joined = MoveBuffer.concatenate([self] + [block.moves for block in self.blocks])
+        expanded = joined.take(np.repeat(starts, rows) + within)
+        expanded.blocks, expanded._blockIds = [], {}
+        return expanded
+
+    def toMoves(self):
+        return list(self)
+
+    @classmethod
+    def fromMoves(cls, moves):
+        buffer = cls(capacity=max(len(moves), 1))
+        buffer.extend(moves)
+        return buffer
+
+
+_DEFAULTS = {
+    "x": None,
+    "y": None,
+    "z": None,
+    "e": None,
+    "f": None,
+    "rapid": False,
+    "immune": False,
+    "kind": KIND_MOVE,
+    "block": -1,
+}
+
+
+def _fromColumn(value, whole=False):
+    # turn a stored float back into what Move expects
+    if np.isnan(value):
+        return None
+    value = float(value)
+    if whole and value.is_integer():
+        return int(value)
+    return value
+
+
+PAUSE_COMMAND = "M0; stop and wait for user input"
+_PAUSE_CODE = 255
+_BLOCK_CODE = 256
+
+
+def _wordModes(column, floats=None):
+    # 0 = no word, 1 = whole number (printed like an int), 2 = anything else, floats
+    # marks rows that were float objects, str() keeps the ".0" of those
+    present = ~np.isnan(column)
+    whole = present & (column == np.floor(column))
+    if floats is not None:
+        whole &= ~floats
+    return np.where(whole, 1, np.where(present, 2, 0))
+
+
+@functools.lru_cache(maxsize=None)
+def _template(code):
+    if code == _PAUSE_CODE:
+        return PAUSE_COMMAND, ()
+    words = ["G0 " if code & 1 else "G1 "]
+    names = []
+    for bit, name in ((1, "x"), (2, "y"), (3, "z")):
+        if code >> bit & 1:
+            words.append(name.upper() + "%.2f ")
+            names.append(name)
+    for shift, name in ((4, "e"), (6, "f")):
+        mode = code >> shift & 3
+        if mode:
+            words.append(name.upper() + ("%d " if mode == 1 else "%r "))
+            names.append(name)
+    return "".join(words), tuple(names)
+
+
+def formatMoves(moves):
+    """
+    Format a block of moves as G-code text in one pass, lines joined with newlines.
+
+    Gives the same text as joining Move.getCommand() for every move, but all rows
+    that share a set of words are formatted together with a single % operation
+    rather than one call per move. A MoveBuffer doesn't keep whether e and f were
+    ints or floats, its rows are formatted like the Moves it gives back (whole
+    numbers as ints, F1500 for 1500.0).
+
+    Parameters
+    ----------
+    moves: MoveBuffer|list
+        the moves to format, lists of Move objects are packed into a MoveBuffer first
+    """
+    return "\n".join(formatLines(moves).tolist())
+
+
+def formatLines(moves):
+    """
+    The text of every row of formatMoves, as an object array with one entry per row.
+
+    A GcodeBlock row's entry is the whole block, so it can hold several lines.
+    """
+    floatE = floatF = None
+    if not isinstance(moves, MoveBuffer):
+        moves = list(moves)
+        floatE = np.array([isinstance(move.e, float) for move in moves], dtype=bool)
+        floatF = np.array([isinstance(move.f, float) for move in moves], dtype=bool)
+        moves = MoveBuffer.fromMoves(moves)
+    if len(moves) == 0:
+        return np.empty(0, dtype=object)
+    x, y, z, e, f = moves.x, moves.y, moves.z, moves.e, moves.f
+    codes = (
+        moves.rapid.astype(np.int64)
+        | (~np.isnan(x)).astype(np.int64) << 1
+        | (~np.isnan(y)).astype(np.int64) << 2
+        | (~np.isnan(z)).astype(np.int64) << 3
+        | _wordModes(e, floatE) << 4
+        | _wordModes(f, floatF) << 6
+    )
+    codes[moves.kind == KIND_PAUSE] = _PAUSE_CODE
+    codes[moves.kind == KIND_BLOCK] = _BLOCK_CODE
+
+    # format every row that shares a set of words in one go, then put the lines
+    # back in order
+    columns = {"x": x, "y": y, "z": z, "e": e, "f": f}
+    lines = np.empty(len(codes), dtype=object)
+    for code in np.unique(codes).tolist():
+        rows = np.flatnonzero(codes == code)
+        if code == _BLOCK_CODE:
+            # already formatted
+            lines[rows] = [moves.blocks[i].text for i in moves.block[rows].tolist()]
+            continue
+        template, names = _template(code)
+        text = "\n".join([template] * len(rows))
+        if names:
+            values = np.column_stack([columns[name][rows] for name in names])
+            text %= tuple(values.ravel().tolist())
+        lines[rows] = text.split("\n")
+    return lines
+
+
+def _runStarts(moves):
+    # rows that can't be merged with the row before them: another kind of move,
+    # a change of height, speed or G0/G1, or a missing x/y
+    z, e, f = moves.z, moves.e, moves.f
+    mergeable = (
+        (moves.kind == KIND_MOVE)
+        & ~moves.immune
+        & ~np.isnan(moves.x)
+        & ~np.isnan(moves.y)
+    )
+
+    def same(column):
+        return (column[1:] == column[:-1]) | (
+            np.isnan(column[1:]) & np.isnan(column[:-1])
+        )
+
+    joined = (
+        mergeable[1:]
+        & mergeable[:-1]
+        & same(z)
+        & same(e)
+        & same(f)
+        & (moves.rapid[1:] == moves.rapid[:-1])
+    )
+    return np.concatenate([[0], np.flatnonzero(~joined) + 1])
+
+
+def _douglasPeucker(xs, ys, tolerance):
+    # indices of the points kept by Ramer-Douglas-Peucker, always the first and last
+    keep = np.zeros(len(xs), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xs) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        px, py = xs[first + 1 : last], ys[first + 1 : last]
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        # distance to the segment, not the line through it, so a stroke that doubles
+        # back past its end keeps the point where it turned
+        length = dx * dx + dy * dy
+        if length == 0:
+            along = np.zeros(len(px))
+        else:
+            along = np.clip(
+                ((px - xs[first]) * dx + (py - ys[first]) * dy) / length, 0, 1
+            )
+        dist = np.hypot(px - xs[first] - along * dx, py - ys[first] - along * dy)
+        worst = int(np.argmax(dist))
+        if dist[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def simplifyMoves(moves, tolerance):
+    """
+    Drop points that lie within tolerance (mm) of a straight line through their neighbours.
+
+    Ramer-Douglas-Peucker is run over every run of consecutive plain moves that share
+    z, e, f and G0/G1. The first and last point of each run, pauses and moves immune
+    to the bed limits (pots, wash) are always kept. Returns a new MoveBuffer.
+    """
+    count = len(moves)
+    if count < 3 or tolerance is None or tolerance < 0:
+        return moves[:]
+    starts = _runStarts(moves)
+    ends = np.append(starts[1:], count)
+    long = ends - starts >= 3
+    keep = np.ones(count, dtype=bool)
+    xs, ys = moves.x, moves.y
+    for start, end in zip(starts[long].tolist(), ends[long].tolist()):
+        kept = _douglasPeucker(xs[start:end], ys[start:end], tolerance)
+        keep[start:end] = False
+        keep[start + kept] = True
+    return moves.take(np.flatnonzero(keep))
+
+
+def modalMoves(moves):
+    """
+    Copy of moves with every axis, extrusion and feed word that repeats the machine's
+    current value removed (set to NaN), so formatMoves only writes the words that change.
+
+    Axes are rounded to the 0.01mm that gets written out first. Moves left with no
+    words at all don't move the machine and are dropped, pauses and GcodeBlocks are
+    always kept (as they are, blocks are already formatted).
+    """
+    moves = moves[:]
+    if len(moves) == 0:
+        return moves
+    moving = moves.kind != KIND_PAUSE
+    # blocks write their own words, their row only says where they leave the machine
+    block = moves.kind == KIND_BLOCK
+    rows = np.arange(len(moves))
+    for name in ("x", "y", "z", "e", "f"):
+        column = getattr(moves, name)
+        if name in ("x", "y", "z"):
+            np.round(column, 2, out=column)
+        present = moving & ~np.isnan(column)
+        # the value the machine holds before each row: the last one written
+        lastSet = np.maximum.accumulate(np.where(present, rows, -1))
+        before = np.concatenate([[-1], lastSet[:-1]])
+        previous = np.where(before >= 0, column[np.maximum(before, 0)], np.nan)
+        column[moving & ~block & (column == previous)] = np.nan
+    empty = (
+        moving
+        & ~block
+        & np.isnan(moves.x)
+        & np.isnan(moves.y)
+        & np.isnan(moves.z)
+        & np.isnan(moves.e)
+        & np.isnan(moves.f)
+    )
+    if empty.any():
+        moves = moves.take(np.flatnonzero(~empty))
+    return moves
+
+
+class GcodeBlock:
+    """
+    Fixed run of moves (a pot refill, a wash) formatted to G-code once.
+
+    Add it to a MoveBuffer with addBlock, every use then shares this object and
+    formatMoves writes the stored text instead of formatting the moves again. It
+    looks like a Move that ends where the block leaves the machine.
+
+    Parameters
+    ----------
+    moves: MoveBuffer
+        the moves, copied and made read only
+    name: str
+        what the block is, for debugging
+    """
+
+    rapid = False
+    immuneToLimits = True
+
+    def __init__(self, moves, name=""):
+        if len(moves) == 0:
+            raise ValueError("a GcodeBlock needs at least one move")
+        self.moves = moves.expand()
+        for column in self.moves._columns.values():
+            column.flags.writeable = False
+        self.name = name
+        self.text = formatMoves(self.moves)
+        # modal values the machine holds once the block is done
+        moving = self.moves.kind != KIND_PAUSE
+        self.x, self.y, self.z = (
+            _lastValue(getattr(self.moves, axis)[moving]) for axis in "xyz"
+        )
+        self.e, self.f = (
+            _lastValue(getattr(self.moves, axis)[moving], whole=True) for axis in "ef"
+        )
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __repr__(self):
+        return f"GcodeBlock({self.name!r}, {len(self)} moves)"
+
+    @property
+    def command(self):
+        return self.text
+
+
+def _lastValue(column, whole=False):
+    # last value given for an axis, as _fromColumn would give it
+    given = column[~np.isnan(column)]
+    if len(given) == 0:
+        return None
+    return _fromColumn(given[-1], whole)
+
+
 class SetupCNC:
     """
     THIS IS A DEMO SETUP INSTRUCTION CREATOR FOR USE ON THE CURA CR20
 
+    A MachineProfile with its own startCommands / endCommands replaces these.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, profile=None) -> None:
         self.start_commands = [
             "M201 X800.00 Y800.00 Z300.00 E5000.00 ;Setup machine max acceleration",
             "M203 X1500.00 Y1500.00 Z80.00 E50.00 ;Setup machine max feedrate",
@@ -125,6 +690,10 @@ class SetupCNC:
             "M140 S0 ;Turn-off bed",
             "M84 X Y E ;Disable all steppers but Z",
         ]
+        if profile is not None and profile.startCommands:
+            self.start_commands = list(profile.startCommands)
+        if profile is not None and profile.endCommands:
+            self.end_commands = list(profile.endCommands)
 
     def dump(self, type_):
         if type_ == "start":
@@ -133,3 +702,452 @@ class SetupCNC:
             return "\n".join(self.end_commands)
         else:
             raise ValueError("Invalid type")
+
+
+PARSE_CHUNK = 16384  # lines read for each ParsedMoves that parseLines yields
+_PARSE_WORD = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))?")
+_PARSE_COMMENT = re.compile(r"\([^)]*\)")
+_FAST_LETTERS = b"XYZEFG"  # the letters of a line the vectorized path reads
+_POWERS = 10.0 ** np.arange(23)  # all exact
+
+
+class ParsedMoves:
+    """
+    A chunk of the moves read back from G-code text by parseLines.
+
+    moves holds the G0 / G1 rows and the M0 / M1 pauses as they were written, an axis
+    that was left out is NaN, so formatLines(moves) gives back the lines formatMoves
+    wrote. An axis given in relative mode (G91) is stored as where it ends up. The
+    modal state comes with the rows, one entry per row.
+
+    Attributes
+    ----------
+    moves: MoveBuffer
+    lines: np.ndarray
+        line number (from 1) of every row
+    text: np.ndarray
+        every row's line as it was in the file, an object array of str
+    origin, position: np.ndarray
+        (n, 3) x, y, z before / after every row, NaN while it isn't known (before the
+        program has set it, after G28)
+    feed: np.ndarray
+        the F in force for every row, NaN before the first
+    relative: np.ndarray
+        rows written in relative mode
+    other: dict
+        code -> count of the commands in this chunk that aren't rows (M203, G28, ...)
+    lineCount: int
+        lines read so far, including this chunk
+    """
+
+    def __init__(
+        self, moves, lines, text, origin, position, feed, relative, other, lineCount
+    ):
+        self.moves = moves
+        self.lines = lines
+        self.text = text
+        self.origin = origin
+        self.position = position
+        self.feed = feed
+        self.relative = relative
+        self.other = other
+        self.lineCount = lineCount
+
+    def __len__(self):
+        return len(self.moves)
+
+
+@functools.lru_cache(maxsize=None)
+def _codeName(letter, value):
+    # G01 -> G1, G92.10 -> G92.1
+    if not value:
+        return letter
+    number = float(value)
+    return letter + (str(int(number)) if number.is_integer() else repr(number))
+
+
+def _lineWords(code):
+    # [(letter, value)] of a line without its comment, value is "" for a bare letter
+    words = []
+    for word in code.split():
+        value = word[1:]
+        if word[0].isalpha() and (not value or value[-1].isdigit()):
+            try:
+                if value:
+                    float(value)
+                words.append((word[0], value))
+                continue
+            except ValueError:
+                pass
+        # words run together (G1X10) or a space after the letter
+        return _PARSE_WORD.findall(code)
+    return words
+
+
+def _fillRows(values, start):
+    # modal value of every column at every row: the last one given, start before that
+    rows = np.arange(len(values))[:, None]
+    last = np.maximum.accumulate(np.where(np.isnan(values), -1, rows), axis=0)
+    filled = values[np.maximum(last, 0), np.arange(values.shape[1])]
+    return np.where(last >= 0, filled, start)
+
+
+class _ParseState:
+    # the modal state parseLines carries from line to line, and chunk to chunk
+
+    def __init__(self):
+        self.x = self.y = self.z = self.feed = np.nan
+        self.motion = None  # "G0" / "G1" once one has been given
+        self.relative = False
+        self.other = {}
+
+    def parseLine(self, line):
+        """
+        Follow one line, returns its row if it is a move or a pause (x, y, z, e, f,
+        rapid, kind, then x, y, z before and after it), None otherwise.
+        """
+        code = line.partition(";")[0]
+        if "(" in code:
+            code = _PARSE_COMMENT.sub(" ", code)
+        if "*" in code:
+            code = code.partition("*")[0]
+        code = code.strip().upper()
+        if not code:
+            return None
+        move = pause = False
+        codes = []
+        axes = {}
+        for letter, value in _lineWords(code):
+            if letter == "G" or letter == "M":
+                codes.append(_codeName(letter, value))
+            elif letter != "N":
+                axes[letter] = float(value) if value else None
+        for name in codes:
+            if name == "G0" or name == "G1":
+                self.motion = name
+                move = True
+            elif name == "G90":
+                self.relative = False
+            elif name == "G91":
+                self.relative = True
+            elif name == "M0" or name == "M1":
+                pause = True
+            else:
+                self.other[name] = self.other.get(name, 0) + 1
+                self._setPosition(name, axes)
+        if not codes and self.motion and axes:
+            move = True
+
+        x, y, z = origin = (self.x, self.y, self.z)
+        if pause:
+            return (np.nan,) * 5 + (False, KIND_PAUSE) + origin + origin
+        if not move:
+            return None
+        values = []
+        for letter, current in (("X", x), ("Y", y), ("Z", z)):
+            value = axes.get(letter)
+            if value is None:
+                values.append(np.nan)
+            elif self.relative:
+                values.append(current + value)
+            else:
+                values.append(value)
+        # a relative move from an unknown position leaves it unknown
+        self.x, self.y, self.z = (
+            current if value != value else value
+            for value, current in zip(values, origin)
+        )
+        e = axes.get("E")
+        f = axes.get("F")
+        if f is not None:
+            self.feed = f
+        return (
+            *values,
+            np.nan if e is None else e,
+            np.nan if f is None else f,
+            self.motion == "G0",
+            KIND_MOVE,
+            *origin,
+            self.x,
+            self.y,
+            self.z,
+        )
+
+    def _setPosition(self, name, axes):
+        # what a command other than a move does to the position
+        if name == "G92":
+            if not axes:
+                # a bare G92 sets every axis to 0
+                self.x = self.y = self.z = 0.0
+            self.x = self.x if axes.get("X") is None else axes["X"]
+            self.y = self.y if axes.get("Y") is None else axes["Y"]
+            self.z = self.z if axes.get("Z") is None else axes["Z"]
+        elif name == "G28" and not any(axis in axes for axis in "XYZ"):
+            self.x = self.y = self.z = np.nan
+        elif name[0] == "G":
+            # homing some axes, arcs, probing ...
+            self.x = np.nan if "X" in axes else self.x
+            self.y = np.nan if "Y" in axes else self.y
+            self.z = np.nan if "Z" in axes else self.z
+
+    def fastRows(self, values, rapid):
+        """
+        The rows of a run of plain G0 / G1 lines at once, values is (n, 5) x, y, z, e, f
+        with NaN for the words that aren't there.
+        """
+        start = np.array([self.x, self.y, self.z])
+        axes = values[:, :3]
+        if self.relative:
+            # summed from the start one move at a time, like parseLine does, -0.0 is
+            # the step that leaves every position as it is
+            steps = np.vstack([start, np.where(np.isnan(axes), -0.0, axes)])
+            position = np.cumsum(steps, axis=0)[1:]
+            axes = np.where(np.isnan(axes), np.nan, position)
+        else:
+            position = _fillRows(axes, start)
+        feed = _fillRows(values[:, 4:], self.feed)[:, 0]
+        origin = np.vstack([start, position[:-1]])
+        self.x, self.y, self.z = position[-1].tolist()
+        self.feed = feed[-1].item()
+        self.motion = "G0" if rapid[-1] else "G1"
+        return axes, origin, position, feed
+
+
+def _ranges(starts, ends):
+    # the indices in [starts[i], ends[i]) for every i, run after run
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+
+def _tokens(raw, newlines):
+    # the words of a block of G-code bytes outside of ; comments: where each starts,
+    # its letter, its number and whether it could be read, and the lines with
+    # something the bulk path doesn't read (lowercase, parentheses, checksums, numbers
+    # without a letter ...)
+    size = len(raw)
+    code = np.ones(size, dtype=bool)
+    semicolons = np.flatnonzero(raw == ord(";"))
+    if len(semicolons):
+        lineEnds = np.append(newlines, size)[np.searchsorted(newlines, semicolons)]
+        code[_ranges(semicolons, lineEnds)] = False
+    letter = code & (raw - np.uint8(ord("A")) < 26)
+    digit = code & (raw - np.uint8(ord("0")) < 10)
+    dot = code & (raw == ord("."))
+    sign = code & ((raw == ord("-")) | (raw == ord("+")))
+    numeric = digit | dot | sign
+    space = ~code | (raw == ord(" ")) | (raw == ord("\t")) | (raw == ord("\r"))
+    junk = np.flatnonzero(~(letter | numeric | space | (raw == ord("\n"))))
+
+    # every run of number bytes right after a letter is that word's number, in order
+    before = np.zeros(size + 1, dtype=bool)
+    before[1:] = numeric
+    runStarts = np.flatnonzero(numeric & ~before[:-1])
+    runEnds = np.flatnonzero(numeric & ~np.append(numeric[1:], False)) + 1
+    attached = letter[np.maximum(runStarts - 1, 0)] & (runStarts > 0)
+    junk = np.concatenate([junk, runStarts[~attached]])
+    runStarts, runEnds = runStarts[attached], runEnds[attached]
+    starts = np.flatnonzero(letter)
+    hasNumber = np.append(numeric, False)[starts + 1]
+    lengths = runEnds - runStarts
+    count = len(runStarts)
+
+    text = raw[_ranges(runStarts, runEnds)]
+    offsets = np.cumsum(lengths) - lengths
+    local = np.arange(len(text)) - np.repeat(offsets, lengths)
+    owner = np.repeat(np.arange(count), lengths)
+    isDigit = text - np.uint8(ord("0")) < 10
+    dotAt = np.flatnonzero(text == ord("."))
+    dots = np.bincount(owner[dotAt], minlength=count)
+    signs = np.bincount(owner[np.flatnonzero(~isDigit)], minlength=count) - dots
+    digits = lengths - dots - signs
+    point = lengths.copy()
+    point[owner[dotAt]] = local[dotAt]
+    signed = ~isDigit[offsets] & (text[offsets] != ord("."))
+    negative = signed & (text[offsets] == ord("-"))
+    readable = (digits >= 1) & (digits <= 15) & (dots <= 1) & (signs == signed)
+
+    # the number is its digits as an integer over a power of ten, both exact, so the
+    # division rounds like float() does
+    length, pointAt = lengths[owner], point[owner]
+    power = length - 1 - local - ((pointAt > local) & (pointAt < length))
+    place = np.where(
+        isDigit, (text - np.uint8(ord("0"))) * _POWERS[power.clip(0, 22)], 0.0
+    )
+    mantissa = np.add.reduceat(place, offsets) if count else place
+    fraction = np.where(point < lengths, lengths - 1 - point, 0).clip(0, 22)
+    number = np.where(negative, -mantissa, mantissa) / _POWERS[fraction]
+
+    values = np.full(len(starts), np.nan)
+    values[hasNumber] = number
+    valid = hasNumber.copy()
+    valid[hasNumber] = readable
+    return starts, raw[starts], values, valid, junk
+
+
+def _parseBlock(state, data, number):
+    # one ParsedMoves for the lines in data (bytes, joined with newlines), the first of
+    # them is line number
+    raw = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(raw == ord("\n"))
+    lineStarts = np.concatenate([[0], newlines + 1])
+    count = len(lineStarts)
+    starts, letters, values, valid, junk = _tokens(raw, newlines)
+    lineOf = np.searchsorted(lineStarts, starts, side="right") - 1
+
+    # a line is read in bulk if it is one G0 / G1 with at most one of each of X Y Z E F
+    slow = np.zeros(count, dtype=bool)
+    slow[np.searchsorted(lineStarts, junk, side="right") - 1] = True
+    column = np.full(len(starts), -1)
+    for i, letter in enumerate(_FAST_LETTERS):
+        column[letters == letter] = i
+    slow[lineOf[(column < 0) | ~valid]] = True
+    slow[lineOf[(column == 5) & (values != 0) & (values != 1)]] = True
+    column = np.maximum(column, 0)
+    perLine = np.bincount(lineOf * 6 + column, minlength=count * 6).reshape(count, 6)
+    slow |= (perLine > 1).any(axis=1)
+    slow |= (perLine.sum(axis=1) > 0) & (perLine[:, 5] == 0)
+    fast = ~slow & (perLine[:, 5] == 1)
+    table = np.full((count, 6), np.nan)
+    table[lineOf, column] = values
+
+    # runs of fast lines in bulk, the lines between them one at a time
+    text = np.array(data.decode("utf-8", "replace").split("\n"), dtype=object)
+    fastLines = np.flatnonzero(fast)
+    slowLines = np.flatnonzero(slow).tolist()
+    ends = np.searchsorted(fastLines, slowLines).tolist()
+    pieces = []
+    rows = []
+    begin = 0
+    for slowLine, end in zip(slowLines + [count], ends + [len(fastLines)]):
+        if end > begin:
+            if rows:
+                pieces.append(_rowPiece(rows))
+                rows = []
+            lines = fastLines[begin:end]
+            rapid = table[lines, 5] == 0
+            axes, origin, position, feed = state.fastRows(table[lines, :5], rapid)
+            pieces.append(
+                (
+                    np.column_stack([axes, table[lines, 3:5]]),
+                    rapid,
+                    np.full(len(lines), KIND_MOVE),
+                    lines,
+                    origin,
+                    position,
+                    feed,
+                    np.full(len(lines), state.relative),
+                )
+            )
+            begin = end
+        if slowLine < count:
+            row = state.parseLine(text[slowLine])
+            if row is not None:
+                rows.append(row + (slowLine, state.feed, state.relative))
+    if rows or not pieces:
+        pieces.append(_rowPiece(rows))
+
+    columns, rapid, kind, lines, origin, position, feed, relative = (
+        np.concatenate(field) for field in zip(*pieces)
+    )
+    moves = MoveBuffer.fromColumns(
+        {
+            "x": columns[:, 0],
+            "y": columns[:, 1],
+            "z": columns[:, 2],
+            "e": columns[:, 3],
+            "f": columns[:, 4],
+            "rapid": rapid,
+            "immune": np.zeros(len(kind), dtype=np.bool_),
+            "kind": kind,
+            "block": np.full(len(kind), -1, dtype=np.int32),
+        }
+    )
+    parsed = ParsedMoves(
+        moves,
+        lines + number,
+        text[lines],
+        origin,
+        position,
+        feed,
+        relative,
+        state.other,
+        number + count - 1,
+    )
+    state.other = {}
+    return parsed
+
+
+def _rowPiece(rows):
+    # the rows _ParseState.parseLine returned, as the arrays _parseBlock puts together
+    rows = np.array(rows, dtype=np.float64).reshape(len(rows), 16)
+    return (
+        rows[:, :5],
+        rows[:, 5].astype(bool),
+        rows[:, 6],
+        rows[:, 13].astype(np.int64),
+        rows[:, 7:10],
+        rows[:, 10:13],
+        rows[:, 14],
+        rows[:, 15].astype(bool),
+    )
+
+
+def parseLines(lines, chunkRows=PARSE_CHUNK):
+    """
+    Read G-code back into MoveBuffers, chunkRows lines at a time, so a file of any size
+    is parsed in bounded memory.
+
+    The modal state is followed like a controller does: the motion mode (a line of
+    only axis / feed words repeats the last G0 / G1), absolute and relative
+    positioning (G90 / G91), G92 setting the position and G28 homing, after which the
+    homed axes count as unknown. Comments, line numbers and checksums are dropped.
+    Other commands don't make rows, they are counted in ParsedMoves.other, and their
+    axis words (arcs, probing ...) leave those axes unknown too.
+
+    Plain G0 / G1 lines (what formatMoves writes, in any word order) are tokenized and
+    read for a whole chunk at once with numpy, the other lines one at a time.
+
+    Parameters
+    ----------
+    lines: iterable of str|bytes
+        e.g. an open file or text.splitlines()
+    chunkRows: int
+        lines per chunk, a chunk has at most this many rows
+
+    Yields
+    ------
+    ParsedMoves
+    """
+    state = _ParseState()
+    lines = iter(lines)
+    number = 1
+    while True:
+        block = list(itertools.islice(lines, chunkRows))
+        if block or number == 1:
+            newline = b"\n" if block and isinstance(block[0], bytes) else "\n"
+            if block and block[0].endswith(newline):
+                # lines read from a file keep their line ends
+                data = newline[:0].join(block)
+                data = data[:-1] if data.endswith(newline) else data
+            else:
+                data = newline.join(block)
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            yield _parseBlock(state, data, number)
+            number += len(block)
+        if len(block) < chunkRows:
+            return
+
+
+def parseFile(path, chunkRows=PARSE_CHUNK):
+    """parseLines over a file, read a chunk at a time"""
+    with open(path, "rb") as r:
+        yield from parseLines(r, chunkRows)
+
+
+def parseMoves(text):
+    """all of the rows of a G-code program (str) in one MoveBuffer"""
+    return MoveBuffer.concatenate(
+        chunk.moves for chunk in parseLines(text.splitlines())
+    )
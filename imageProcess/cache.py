@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).parent
+DEFAULT_CACHE_DIR = ROOT.parent / ".contour_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ContourCache:
+    """
+    Disk cache for ContourFinder results.
+
+    Entries are keyed by a hash of the image file bytes plus the processing
+    parameters, and stored as npz files holding one flat (n, 2) int32 point
+    array and the offsets where each contour starts. When the directory grows
+    past maxBytes the least recently used entries are deleted.
+
+    Parameters
+    ----------
+    directory: path
+        where the npz files are kept, created if it doesn't exist
+    maxBytes: int
+        size limit for the whole cache directory
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, imageBytes, params):
+        digest = hashlib.sha256(imageBytes)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.directory / f"{key}.npz"
+
+    def get(self, key):
+        """the cached contours (a list of (n, 1, 2) int32 arrays) or None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                points, offsets = data["points"], data["offsets"]
+            os.utime(path)  # mark as recently used
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # missing, or a file that isn't a whole entry
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [
+            points[start:end].reshape(-1, 1, 2)
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+        ]
+
+    def put(self, key, contours):
+        lengths = [len(contour) for contour in contours]
+        offsets = np.zeros(len(contours) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if contours:
+            points = np.concatenate(
+                [
+                    np.asarray(contour, dtype=np.int32).reshape(-1, 2)
+                    for contour in contours
+                ]
+            )
+        else:
+            points = np.zeros((0, 2), dtype=np.int32)
+
+        # write to a temp file first so other workers never see a half written entry
+        handle, tmpPath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as w:
+                np.savez_compressed(w, points=points, offsets=offsets)
+            os.replace(tmpPath, self._path(key))
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "entries": len(list(self.directory.glob("*.npz"))),
+        }
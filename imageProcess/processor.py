@@ -2,7 +2,10 @@ import cv2
 from pathlib import Path
 import numpy as np
 from scipy.interpolate import splprep, splev
+import time
 import warnings
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
 ROOT = Path(__file__).parent
 
@@ -12,7 +15,56 @@ class Img:
         self.strpath = str(image_path)
         self.path = Path(image_path)
         self.image_name = str(self.path.stem)
+        start = time.perf_counter()
         self.array = cv2.imread(self.strpath)
+        self.timings = {"load": time.perf_counter() - start}
+        self.originalShape = None if self.array is None else self.array.shape
+        self.scale = 1.0
+        self.memorySaved = 0
+
+    def readBytes(self):
+        return self.path.read_bytes()
+
+    def fitToBed(self, bedWidth, bedHeight, resolution):
+        """
+        Downscale the image to the resolution the machine can actually draw.
+
+        The image gets scaled to fit the bed later on, this shrinks it now so that one
+        pixel ends up about resolution mm wide on the bed. Images that are already
+        small enough are left alone.
+
+        Parameters
+        ----------
+        bedWidth, bedHeight: float
+            (mm) drawable area of the bed
+        resolution: float
+            (mm) smallest detail worth keeping
+
+        Returns
+        -------
+        float
+            the scale factor applied to the image (1.0 if it wasn't resized)
+        """
+        start = time.perf_counter()
+        height, width = self.array.shape[:2]
+        factor = min(bedWidth / width, bedHeight / height) / resolution
+        if factor < 1:
+            before = self.array.nbytes
+            size = (max(1, round(width * factor)), max(1, round(height * factor)))
+            self.array = cv2.resize(self.array, size, interpolation=cv2.INTER_AREA)
+            self.scale = factor
+            self.memorySaved = before - self.array.nbytes
+        self.timings["fitToBed"] = time.perf_counter() - start
+        return self.scale
+
+    def report(self):
+        return {
+            "originalShape": self.originalShape,
+            "workingShape": self.array.shape,
+            "scale": self.scale,
+            "memorySaved": self.memorySaved,
+            "timings": dict(self.timings),
+        }
 
     def show(self):
         cv2.imshow(self.image_name, self.image_cv)
@@ -24,44 +76,165 @@ class Img:
 
 
 class ContourFinder:
-    def __init__(self, img: Img):
+    def __init__(
+        self,
+        img: Img,
+        cache=None,
+        blurKernel=7,
+        blurSigma=1,
+        cannyLow=100,
+        cannyHigh=150,
+        apertureSize=3,
+        smooth=False,
+        workers=None,
+    ):
+        """
+        Parameters
+        ----------
+        img: Img
+            the image to find contours in
+        cache: ContourCache|None
+            if given, results are looked up / stored by image content and the parameters below
+        smooth: bool
+            fit a spline through every contour and return those instead, see
+            interpolateContours
+        workers: int|None
+            processes used for the spline smoothing, see interpolateContours
+        """
         self.img = img
+        self.cache = cache
+        self.blurKernel = blurKernel
+        self.blurSigma = blurSigma
+        self.cannyLow = cannyLow
+        self.cannyHigh = cannyHigh
+        self.apertureSize = apertureSize
+        self.smooth = smooth
+        self.workers = workers
+        self.timings = {}
+
+    def params(self):
+        """everything that changes the output of find, used for the cache key"""
+        return {
+            "blurKernel": self.blurKernel,
+            "blurSigma": self.blurSigma,
+            "cannyLow": self.cannyLow,
+            "cannyHigh": self.cannyHigh,
+            "apertureSize": self.apertureSize,
+            "smooth": self.smooth,
+            "imageScale": getattr(self.img, "scale", 1.0),
+        }
 
     def find(self):
-        grayscale = cv2.cvtColor(self.img.array, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(grayscale, (7, 7), 1)
-        edges = cv2.Canny(blur, 100, 150, apertureSize=3)
-        contours, hierarchy = cv2.findContours(
-            edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
-        )
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)
-        contours_smooth = self.interpolateContours(contours)
-        img_contours = np.zeros(self.img.array.shape, np.uint8)
-        # img_contours = cv2.drawContours(
-        #     img_contours, contours_smooth, -1, (0, 255, 255), 1
-        # )
-        img_contours = cv2.drawContours(img_contours, contours, -1, (0, 255, 255), 1)
-        cv2.imwrite(str(self.img.path.parent / "contours.png"), img_contours)
+        if self.cache is None:
+            return self._find()
+        key = self.cache.key(self.img.readBytes(), self.params())
+        contours = self.cache.get(key)
+        if contours is None:
+            contours = self._find()
+            self.cache.put(key, contours)
         return contours
 
-    def interpolateContours(self, contours):
+    def _find(self):
+        stage = _StageTimer(self.timings)
+        with stage("grayscale"):
+            grayscale = cv2.cvtColor(self.img.array, cv2.COLOR_BGR2GRAY)
+        with stage("blur"):
+            blur = cv2.GaussianBlur(
+                grayscale, (self.blurKernel, self.blurKernel), self.blurSigma
+            )
+        with stage("canny"):
+            edges = cv2.Canny(
+                blur, self.cannyLow, self.cannyHigh, apertureSize=self.apertureSize
+            )
+        with stage("findContours"):
+            contours, hierarchy = cv2.findContours(
+                edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
+            )
+        with stage("sort"):
+            contours = sorted(contours, key=cv2.contourArea, reverse=True)
+        if self.smooth:
+            with stage("interpolate"):
+                contours = self.interpolateContours(contours, workers=self.workers)
+        with stage("drawContours"):
+            img_contours = np.zeros(self.img.array.shape, np.uint8)
+            img_contours = cv2.drawContours(
+                img_contours, contours, -1, (0, 255, 255), 1
+            )
+            cv2.imwrite(str(self.img.path.parent / "contours.png"), img_contours)
+        return contours
+
+    def interpolateContours(self, contours, workers=None, chunkSize=64, samples=25):
+        """
+        Fit a closed spline through every contour and resample it to samples points.
+
+        Contours the spline can't be fitted to are dropped. With workers > 1 the
+        contours are split into chunks of chunkSize and smoothed in a process pool,
+        the output order is the same as the serial path.
+
+        Parameters
+        ----------
+        workers: int|None
+            number of processes, None or 1 runs in this process
+        """
+        if not workers or workers <= 1 or len(contours) <= chunkSize:
+            return _smoothChunk(contours, samples)
+
+        chunks = [
+            contours[start : start + chunkSize]
+            for start in range(0, len(contours), chunkSize)
+        ]
         smoothened = []
-        warnings.filterwarnings("ignore")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in pool.map(_smoothChunk, chunks, [samples] * len(chunks)):
+                smoothened.extend(chunk)
+        return smoothened
+
+
+def _smoothChunk(contours, samples=25):
+    # module level so it can be sent to a process pool
+    smoothened = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
         for contour in contours:
-            try:
-                x, y = contour.T
-                x = x.tolist()[0]
-                y = y.tolist()[0]
-                tck, u = splprep([x, y], u=None, s=1.0, per=1, k=3)
-                u_new = np.linspace(u.min(), u.max(), 25)
-                x_new, y_new = splev(u_new, tck, der=0, ext=0)
-                res_array = [[[int(i[0]), int(i[1])]] for i in zip(x_new, y_new)]
-                smoothened.append(np.asarray(res_array, dtype=np.int32))
-            except Exception:  # this indirectly ends up removing contours that are duplicates (i think :? )
-
-                continue
+            smooth = _smoothContour(contour, samples)
+            if smooth is not None:
+                smoothened.append(smooth)
+    return smoothened
 
-        return smoothened
+
+def _smoothContour(contour, samples):
+    try:
+        x, y = contour.T
+        x = x.tolist()[0]
+        y = y.tolist()[0]
+        tck, u = splprep([x, y], u=None, s=1.0, per=1, k=3)
+        u_new = np.linspace(u.min(), u.max(), samples)
+        x_new, y_new = splev(u_new, tck, der=0, ext=0)
+    except Exception:
+        # this indirectly ends up removing contours that are duplicates (i think :? )
+        return None
+    points = np.column_stack([x_new, y_new])
+    if not np.isfinite(points).all():
+        return None
+    # astype truncates towards zero, same as int()
+    return points.astype(np.int32).reshape(-1, 1, 2)
+
+
+class _StageTimer:
+    """with stage("name"): ... adds the time taken to timings["name"]"""
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (
+                self.timings.get(name, 0.0) + time.perf_counter() - start
+            )
 
 
 class ShadeFinder:
@@ -85,4 +258,7 @@ class ShadeFinder:
         cv2.waitKey(0)
 
 
-ContourFinder(Img(ROOT / "mum.JPG")).find()
+if __name__ == "__main__":
+    import sys
+
+    ContourFinder(Img(sys.argv[1] if len(sys.argv) > 1 else ROOT / "mum.JPG")).find()
@@ -0,0 +1,360 @@
+import time
+
+import numpy as np
+
+import instrument
+from gcode import KIND_PAUSE, MoveBuffer, formatLines
+from maker import Maker, Preparer
+from strokes import StrokeSet
+
+
+class _Part:
+    """
+    A run of the job's moves before they are scaled to the bed (the start, the refill
+    before a color, or one stroke), with its G-code once it has been formatted.
+    """
+
+    def __init__(self, moves, travelIn=0.0, travelOut=0.0, color=None):
+        self.moves = moves
+        self.travelIn = travelIn
+        self.travelOut = travelOut
+        self.color = color
+        drawing = (moves.kind != KIND_PAUSE) & ~moves.immune
+        self.count = int(np.count_nonzero(drawing))
+        self.sumX = float(moves.x[drawing].sum())
+        self.sumY = float(moves.y[drawing].sum())
+        self.text = None
+        self.transform = None
+        self.clamped = 0
+
+
+class IncrementalPlanner(Preparer):
+    def __init__(self, input_item, colors=None, profile=None, refit=True, **kwargs):
+        """
+        A planned job that is kept up to date as strokes are added, removed or changed,
+        so editing a large drawing doesn't plan and format all of it again.
+
+        Every stroke keeps its own segment: its moves before scaling, the brush travel
+        since the last refill it starts and ends with, and its G-code. An edit puts the
+        new / changed strokes where they add the least pen up travel in their color's
+        order (the rest keep their places) and paints them again. The strokes after an
+        edit are only painted again while the travel they start with differs from before,
+        which stops at the next refill at the latest. The bed transform is worked out from
+        per stroke bounds and sums, and a segment is only formatted again when it was
+        painted again or the transform changed.
+
+        The first order is Preparer's, edits never re-sort the whole drawing, replan()
+        does that.
+
+        Parameters
+        ----------
+        input_item: image_path|array|list|StrokeSet
+            the first version of the drawing, stroke i gets id i (a StrokeSet's ids are kept)
+        colors: str|list|None
+            as for Preparer
+        profile: MachineProfile|None
+            the machine, None for DEFAULT_PROFILE
+        refit: bool
+            work the scale and offset to the bed out again after every edit, as make()
+            would. False keeps them while the drawing's bounds stay the same and no
+            edited stroke would be clamped to the bed, so an edit only changes the G-code
+            of the strokes it touched
+        **kwargs
+            passed on to Preparer (tourTimeLimit, tourIterations, strokeSpacing, ...),
+            with strokeSpacing added and changed strokes are resampled at the first version's scale
+        """
+        super().__init__(input_item, colors=colors, profile=profile, **kwargs)
+        self.refit = refit
+        self.maker = Maker(profile=self.profile)
+        self.multiColor = not (colors is None or isinstance(colors, str))
+        self.strokes = {}  # id -> points, in the direction they're painted
+        self.strokeColors = {}  # id -> pot color, None for the default
+        self.bounds = {}  # id -> (minX, minY, maxX, maxY)
+        self.groups = []  # [color, [ids in painting order]] in painting order
+        self.segments = {}  # id -> _Part
+        self.pending = []  # ids waiting for a place in the order
+        self.dirty = set()  # ids to paint again
+        self.transform = None
+        self.fitBounds = None  # the drawing's bounds when the transform was worked out
+        self.parts = None
+        self.report = None
+        self._setGroups(self.planStrokes())
+        self.nextId = max(self.strokes, default=-1) + 1
+        # make() starts over the first stroke of the input
+        self.firstId = self.array.ids[0].item()
+
+    def _setGroups(self, plan):
+        self.groups = []
+        for color, strokes in plan:
+            ids = strokes.ids.tolist()
+            for strokeId, stroke in zip(ids, strokes):
+                self._setStroke(strokeId, stroke, color)
+            self.groups.append([color, ids])
+
+    def _setStroke(self, strokeId, stroke, color):
+        stroke = np.array(stroke)[:, :2]
+        if len(stroke) == 0:
+            raise ValueError("strokes need at least one point")
+        if color is not None and color not in self.pots.pots:
+            raise ValueError(f"Color {color!r} not in pot list")
+        old = self.strokes.get(strokeId)
+        if old is None or not np.array_equal(old, stroke):
+            self.dirty.add(strokeId)
+        self.strokes[strokeId] = stroke
+        self.strokeColors[strokeId] = color
+        self.bounds[strokeId] = (
+            *stroke.min(axis=0).tolist(),
+            *stroke.max(axis=0).tolist(),
+        )
+        self.parts = None
+
+    def _group(self, color):
+        for group in self.groups:
+            if group[0] == color:
+                return group
+        return None
+
+    def _defaultColor(self, color):
+        if color is not None:
+            return color
+        return self.profile.defaultColor if self.multiColor else self.colors
+
+    def add(self, stroke, color=None):
+        """add a stroke ([[x, y], [x, y], ...]) painted in color, returns its id"""
+        strokeId = self.nextId
+        self.nextId += 1
+        self._setStroke(strokeId, self._resampled(stroke), self._defaultColor(color))
+        self.pending.append(strokeId)
+        return strokeId
+
+    def _resampled(self, stroke):
+        # edits are resampled like the first version, at its scale
+        if self.strokeSpacing is None:
+            return stroke
+        return self.resampleStrokes(StrokeSet.fromList([stroke]))[0]
+
+    def remove(self, strokeId):
+        """take a stroke out of the drawing"""
+        if strokeId not in self.strokes:
+            raise KeyError(strokeId)
+        self._unplace(strokeId)
+        for table in (self.strokes, self.strokeColors, self.bounds, self.segments):
+            table.pop(strokeId, None)
+        self.dirty.discard(strokeId)
+        self.parts = None
+
+    def change(self, strokeId, stroke=None, color=None):
+        """
+        Replace the points and / or the color of a stroke.
+
+        The first stroke of a color keeps its place, any other is placed again.
+        """
+        if strokeId not in self.strokes:
+            raise KeyError(strokeId)
+        color = self.strokeColors[strokeId] if color is None else color
+        stroke = self.strokes[strokeId] if stroke is None else self._resampled(stroke)
+        group = self._group(self.strokeColors[strokeId])
+        keepPlace = (
+            group is not None
+            and group[1][0] == strokeId
+            and color == self.strokeColors[strokeId]
+        )
+        if not keepPlace:
+            self._unplace(strokeId)
+            self.pending.append(strokeId)
+        self._setStroke(strokeId, stroke, color)
+
+    def _unplace(self, strokeId):
+        if strokeId in self.pending:
+            self.pending.remove(strokeId)
+            return
+        group = self._group(self.strokeColors[strokeId])
+        group[1].remove(strokeId)
+        if not group[1]:
+            self.groups.remove(group)
+
+    def replan(self):
+        """sort all of the strokes again like Preparer does, strokes that end up painted the same way keep their G-code"""
+        self._place()
+        ids = [strokeId for _, group in self.groups for strokeId in group]
+        array = StrokeSet.fromList([self.strokes[strokeId] for strokeId in ids])
+        self.array = StrokeSet(array.points, array.offsets, ids)
+        colors = [self.strokeColors[strokeId] for strokeId in ids]
+        self.colors = colors if self.multiColor or len(set(colors)) > 1 else colors[0]
+        self.multiColor = isinstance(self.colors, list)
+        self._setGroups(self.planStrokes())
+        self.firstId = ids[0]
+
+    def _place(self):
+        # put every pending stroke where it adds the least pen up travel to its color,
+        # after the first stroke of the color
+        byColor = {}
+        for strokeId in self.pending:
+            byColor.setdefault(self.strokeColors[strokeId], []).append(strokeId)
+        self.pending = []
+        for color, added in byColor.items():
+            group = self._group(color)
+            if group is None:
+                group = [color, [added.pop(0)]]
+                self.groups.append(group)
+            ids = group[1]
+            starts = np.array([self.strokes[i][0] for i in ids], dtype=np.float64)
+            ends = np.array([self.strokes[i][-1] for i in ids], dtype=np.float64)
+            for strokeId in added:
+                start = self.strokes[strokeId][0].astype(np.float64)
+                end = self.strokes[strokeId][-1].astype(np.float64)
+                # inserting after position p, the last one just adds the trip to it
+                cost = np.hypot(*(start - ends).T)
+                cost[:-1] += np.hypot(*(starts[1:] - end).T) - np.hypot(
+                    *(starts[1:] - ends[:-1]).T
+                )
+                position = int(np.argmin(cost)) + 1
+                ids.insert(position, strokeId)
+                starts = np.insert(starts, position, start, axis=0)
+                ends = np.insert(ends, position, end, axis=0)
+
+    def _paintPart(self, strokeId, travel, color):
+        self.moves = MoveBuffer()
+        travelOut = self._paintStroke(self.strokes[strokeId].tolist(), travel)
+        return _Part(self.moves, travel, travelOut, color)
+
+    def _refresh(self):
+        # bring the parts and their G-code up to date with the edits
+        if self.parts is not None:
+            return self.parts
+        startTime = time.perf_counter()
+        self._place()
+        if not self.groups:
+            raise ValueError("there are no strokes to plan")
+
+        if self.firstId not in self.strokes:
+            self.firstId = self.groups[0][1][0]
+        self.moves = MoveBuffer()
+        self._start(self.strokes[self.firstId].tolist())
+        parts = [_Part(self.moves)]
+        repainted = []
+        clampedBefore = {}  # id -> rows of a repainted stroke that were clamped
+        for group, (color, ids) in enumerate(self.groups):
+            self.moves = MoveBuffer()
+            self._startColor(group, color, self.strokes[ids[0]].tolist())
+            parts.append(_Part(self.moves))
+            travel = 0
+            for strokeId in ids:
+                segment = self.segments.get(strokeId)
+                if (
+                    segment is None
+                    or strokeId in self.dirty
+                    or segment.travelIn != travel
+                    or segment.color != color
+                ):
+                    if segment is not None:
+                        clampedBefore[strokeId] = segment.clamped
+                    segment = self._paintPart(strokeId, travel, color)
+                    self.segments[strokeId] = segment
+                    repainted.append(strokeId)
+                travel = segment.travelOut
+                parts.append(segment)
+        self.dirty.clear()
+        self.moves = MoveBuffer()
+
+        bounds = self._drawingBounds()
+        transform = self.transform
+        if self.refit or transform is None or bounds != self.fitBounds:
+            transform = self._fit(parts, bounds)
+        stale = self._format(parts, transform)
+        clamps = any(
+            self.segments[strokeId].clamped > clampedBefore.get(strokeId, 0)
+            for strokeId in repainted
+        )
+        if transform == self.transform and clamps:
+            # the kept transform would push an edit off the bed, fit it again
+            transform = self._fit(parts, bounds)
+            stale += [
+                part for part in self._format(parts, transform) if part not in stale
+            ]
+        refit = transform != self.transform
+        self.transform = transform
+        self.fitBounds = bounds
+        self.clampedMoves = sum(part.clamped for part in parts)
+
+        self.parts = parts
+        self.report = {
+            "strokes": len(self.strokes),
+            "repainted": repainted,
+            "reformatted": len(stale),
+            "refit": refit,
+            "seconds": time.perf_counter() - startTime,
+        }
+        instrument.count("strokesRepainted", len(repainted))
+        instrument.count("partsReformatted", len(stale))
+        return parts
+
+    def _format(self, parts, transform):
+        # scale and format the parts that aren't at transform yet, returns them
+        stale = [part for part in parts if part.transform != transform]
+        if stale:
+            batch = MoveBuffer.concatenate(part.moves for part in stale)
+            clamped = self._toBed(batch, *transform)
+            lines = formatLines(batch).tolist()
+            edges = np.cumsum([0] + [len(part.moves) for part in stale])
+            counts = np.add.reduceat(clamped, edges[:-1]).tolist()
+            for part, start, end, count in zip(stale, edges[:-1], edges[1:], counts):
+                part.text = "\n".join(lines[start:end])
+                part.transform = transform
+                part.clamped = count
+        return stale
+
+    def _drawingBounds(self):
+        # (minX, minY, maxX, maxY) of all of the strokes
+        bounds = np.array(list(self.bounds.values()))
+        return (
+            *bounds[:, :2].min(axis=0).tolist(),
+            *bounds[:, 2:].max(axis=0).tolist(),
+        )
+
+    def _fit(self, parts, bounds):
+        # the scale and offset _manipulate would use, from the kept bounds and sums
+        profile = self.profile
+        minX, minY, maxX, maxY = bounds
+        x_scale = (profile.maxX - profile.minX) / (maxX - minX)
+        y_scale = (profile.maxY - profile.minY) / (maxY - minY)
+        scale = min(x_scale, y_scale)
+        count = sum(part.count for part in parts)
+        centerX = sum(part.sumX for part in parts) / count
+        centerY = sum(part.sumY for part in parts) / count
+        return (
+            scale,
+            profile.centerX - centerX * scale,
+            profile.centerY - centerY * scale,
+        )
+
+    @instrument.timed()
+    def make(self):
+        """the moves for the drawing as it is now, like Preparer.make()"""
+        parts = self._refresh()
+        moves = MoveBuffer.concatenate(part.moves for part in parts)
+        self._toBed(moves, *self.transform)
+        return moves
+
+    def program(self):
+        """
+        The G-code for the drawing as it is now, the same as Maker(profile).dump(make()).
+
+        Only the segments changed since the last call are formatted, report["repainted"]
+        lists the strokes whose moves changed.
+        """
+        parts = self._refresh()
+        setup = self.maker.setup
+        return "\n".join(
+            [setup.dump("start")] + [part.text for part in parts] + [setup.dump("end")]
+        )
+
+    def segment(self, strokeId):
+        """the G-code of one stroke as it is in program()"""
+        self._refresh()
+        return self.segments[strokeId].text
+
+    def order(self):
+        """[(color, [ids])] in painting order"""
+        self._place()
+        return [(color, list(ids)) for color, ids in self.groups]
@@ -0,0 +1,130 @@
+import cProfile
+import contextvars
+import functools
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("painterMetrics", default=None)
+
+
+class JobMetrics:
+    """
+    Timings and counters for one image/strokes -> G-code job.
+
+    Use collect() to make it the active collector, the pipeline then reports into it
+    through timer()/count() without it being passed around.
+
+    Parameters
+    ----------
+    profile: bool
+        also run cProfile for the whole job, see profileStats()
+    """
+
+    def __init__(self, profile=False):
+        self.timings = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """add seconds to a stage, repeated stages are summed"""
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def profileStats(self, limit=30):
+        """the top functions by cumulative time as text, or None if not profiling"""
+        if self.profiler is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def toDict(self):
+        result = {"timings": dict(self.timings), "counters": dict(self.counters)}
+        if self.profiler is not None:
+            result["profile"] = self.profileStats()
+        return result
+
+    def dumpJSON(self, fileobj=None):
+        """write the metrics as JSON to an open file, or return the JSON string"""
+        if fileobj is None:
+            return json.dumps(self.toDict(), indent=2)
+        json.dump(self.toDict(), fileobj, indent=2)
+
+
+@contextmanager
+def collect(profile=False):
+    """
+    Collect metrics for everything run inside the block.
+
+        with collect() as metrics:
+            moves = Preparer(path).make()
+        metrics.toDict()
+    """
+    metrics = JobMetrics(profile=profile)
+    token = _current.set(metrics)
+    if metrics.profiler is not None:
+        metrics.profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if metrics.profiler is not None:
+            metrics.profiler.disable()
+        _current.reset(token)
+
+
+def current():
+    """the active JobMetrics or None"""
+    return _current.get()
+
+
+@contextmanager
+def timer(name):
+    """time a stage into the active collector, does nothing if there isn't one"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(name):
+        yield
+
+
+def record(name, seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record(name, seconds)
+
+
+def count(name, amount=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(name, amount)
+
+
+def timed(name=None):
+    """decorator version of timer, the stage name defaults to the function's qualified name"""
+
+    def decorator(func):
+        stage = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+import instrument
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    """raised by JobQueue.submit when there are already maxQueued jobs waiting"""
+
+
+class Job:
+    def __init__(self, work, profile=False):
+        self.id = uuid.uuid4().hex
+        self.work = work
+        self.profile = profile
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.metrics = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """block until the job has finished, returns False if it timed out first"""
+        return self._done.wait(timeout)
+
+    def run(self):
+        self.status = RUNNING
+        self.started = time.time()
+        try:
+            with instrument.collect(profile=self.profile) as metrics:
+                self.result = self.work()
+            self.metrics = metrics.toDict()
+            self.status = DONE
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.status = FAILED
+            traceback.print_exc()
+        finally:
+            self.work = None  # drop the input, it can be a whole image
+            self.finished = time.time()
+            self._done.set()
+
+    def toDict(self):
+        info = {"id": self.id, "status": self.status, "created": self.created}
+        if self.started is not None:
+            info["started"] = self.started
+        if self.finished is not None:
+            info["finished"] = self.finished
+            info["seconds"] = self.finished - self.started
+        if self.error is not None:
+            info["error"] = self.error
+        if self.metrics is not None:
+            info["metrics"] = self.metrics
+        return info
+
+
+class JobQueue:
+    """
+    Bounded background worker pool for render jobs.
+
+    Jobs wait in a queue of at most maxQueued entries and are run by a fixed
+    number of worker threads, submit raises QueueFull instead of letting the
+    backlog grow. Finished jobs are kept (for their results) until there are
+    more than keepFinished of them, then the oldest are dropped.
+
+    Parameters
+    ----------
+    workers: int
+        number of jobs run at the same time
+    maxQueued: int
+        jobs allowed to wait for a worker
+    keepFinished: int
+        finished jobs to remember
+    """
+
+    def __init__(self, workers=2, maxQueued=8, keepFinished=64):
+        self.workers = workers
+        self.keepFinished = keepFinished
+        self.pending = queue.Queue(maxsize=maxQueued)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"painter-job-{i}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, work, profile=False):
+        """
+        Queue work (a function taking no arguments) and return its Job straight away.
+
+        Raises QueueFull if the queue is at capacity.
+        """
+        self.start()
+        job = Job(work, profile=profile)
+        with self.lock:
+            try:
+                self.pending.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f"{self.pending.maxsize} jobs already waiting")
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, jobId):
+        with self.lock:
+            return self.jobs.get(jobId)
+
+    def queued(self):
+        return self.pending.qsize()
+
+    def _worker(self):
+        while True:
+            job = self.pending.get()
+            try:
+                job.run()
+            finally:
+                self.pending.task_done()
+            self._forgetOld()
+
+    def _forgetOld(self):
+        with self.lock:
+            finished = [job.id for job in self.jobs.values() if job.finished]
+            for jobId in finished[: max(len(finished) - self.keepFinished, 0)]:
+                del self.jobs[jobId]
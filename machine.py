@@ -0,0 +1,187 @@
+import json
+import threading
+from pathlib import Path
+
+MIN_BRUSH_WIDTH = (
+    5  # (mm) threhold for brush width, above which strokes are added to widen the lines
+)
+LENGTH_SCALE = 0.12  # scale factor for line length
+Z_HEIGHT = 40  # (mm) height of the z axis above the bed when instrument touches the bed
+BACKOFF_HEIGHT = 30  # (mm) height to back off when moving to start a new stroke
+POT_HEIGHT = 70  # (mm) height of the color / wash pots
+MAX_STROKE_LENGTH = 700
+MAX_X = 200  # (mm) max x coordinate of the bed
+MAX_Y = 230  # (mm) max y coordinate of the bed
+MIN_Y = 100
+MIN_X = 1
+MIN_STROKE_RESOLUTION = (
+    0.2  # (mm) smallest detail worth keeping when an image is downscaled to the bed
+)
+CENTER_Y = int((MAX_Y + MIN_Y) / 2)  # (mm) center y coordinate of the bed
+CENTER_X = int((MAX_X + MIN_X) / 2)  # (mm) center x coordinate of the bed
+
+FEED_RATE = 1200  # (mm/min) feed rate for the machine
+DEFAULT_COLOR = "green"
+
+
+class MachineProfile:
+    """
+    Everything that differs between machines: the bed, heights, speeds, where the
+    pots are and the start / end G-code.
+
+    The defaults are the module constants above. Pass a profile to Preparer, Maker,
+    ColorPots, WashCycle and SetupCNC, or None for DEFAULT_PROFILE. Treat a profile as
+    read only once it's in use, the derived values and the objects in cached() are
+    worked out from it once.
+
+    Parameters
+    ----------
+    name: str
+    minX, maxX, minY, maxY: float
+        (mm) drawable area of the bed
+    zHeight, backoffHeight, potHeight: float
+        (mm) see Z_HEIGHT, BACKOFF_HEIGHT, POT_HEIGHT
+    maxStrokeLength: float
+        distance painted before the brush goes back for more paint
+    feedRate: float
+        (mm/min)
+    defaultColor: str
+    pots: dict
+        color -> position of its pot in the row of pots
+    potSpacing, firstPotX, firstPotY: float
+        (mm) where the row of color pots is
+    washPotX, washPotY, dryX: float
+        (mm) where the wash pot and the drying area are
+    startCommands, endCommands: list|None
+        G-code lines before / after the job, None for the SetupCNC ones
+    imageResolution: float
+        (mm) images sent to the API are downscaled so a pixel is this wide on the bed,
+        see Preparer
+    """
+
+    FIELDS = (
+        "name",
+        "minX",
+        "maxX",
+        "minY",
+        "maxY",
+        "zHeight",
+        "backoffHeight",
+        "potHeight",
+        "maxStrokeLength",
+        "feedRate",
+        "defaultColor",
+        "pots",
+        "potSpacing",
+        "firstPotX",
+        "firstPotY",
+        "washPotX",
+        "washPotY",
+        "dryX",
+        "startCommands",
+        "endCommands",
+        "imageResolution",
+    )
+
+    def __init__(
+        self,
+        name="default",
+        minX=MIN_X,
+        maxX=MAX_X,
+        minY=MIN_Y,
+        maxY=MAX_Y,
+        zHeight=Z_HEIGHT,
+        backoffHeight=BACKOFF_HEIGHT,
+        potHeight=POT_HEIGHT,
+        maxStrokeLength=MAX_STROKE_LENGTH,
+        feedRate=FEED_RATE,
+        defaultColor=DEFAULT_COLOR,
+        pots=None,
+        potSpacing=30,
+        firstPotX=10,
+        firstPotY=55,
+        washPotX=70,
+        washPotY=55,
+        dryX=130,
+        startCommands=None,
+        endCommands=None,
+        imageResolution=MIN_STROKE_RESOLUTION,
+    ):
+        self.name = name
+        self.minX, self.maxX = minX, maxX
+        self.minY, self.maxY = minY, maxY
+        self.zHeight = zHeight
+        self.backoffHeight = backoffHeight
+        self.potHeight = potHeight
+        self.maxStrokeLength = maxStrokeLength
+        self.feedRate = feedRate
+        self.defaultColor = defaultColor
+        self.pots = (
+            dict(pots) if pots is not None else {"red": 0, "green": 1, "blue": 2}
+        )
+        self.potSpacing = potSpacing
+        self.firstPotX, self.firstPotY = firstPotX, firstPotY
+        self.washPotX, self.washPotY = washPotX, washPotY
+        self.dryX = dryX
+        self.startCommands = list(startCommands) if startCommands else None
+        self.endCommands = list(endCommands) if endCommands else None
+        self.imageResolution = imageResolution
+        if self.defaultColor not in self.pots:
+            raise ValueError(f"default color {defaultColor!r} has no pot")
+
+        # derived values
+        self.centerX = int((self.maxX + self.minX) / 2)
+        self.centerY = int((self.maxY + self.minY) / 2)
+        self.potEntryHeight = self.zHeight + self.potHeight + 10
+        self.potInnerHeight = self.zHeight + 2
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"MachineProfile({self.name!r})"
+
+    def toDict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def fromDict(cls, values):
+        unknown = set(values) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"unknown machine profile keys: {sorted(unknown)}")
+        return cls(**values)
+
+    @classmethod
+    def load(cls, path):
+        """read a profile from a .json or .toml file, missing keys keep their defaults"""
+        path = Path(path)
+        if path.suffix == ".toml":
+            try:
+                import tomllib
+            except ImportError:  # python < 3.11
+                import tomli as tomllib
+
+            with open(path, "rb") as r:
+                values = tomllib.load(r)
+        else:
+            with open(path) as r:
+                values = json.load(r)
+        values.setdefault("name", path.stem)
+        return cls.fromDict(values)
+
+    def cached(self, key, build):
+        """
+        build() the first time key is asked for, then the same object for this profile.
+
+        Used for the things worth making once per machine (SetupCNC, refill / wash blocks).
+        """
+        value = self._cache.get(key)
+        if value is None:
+            with self._lock:
+                value = self._cache.get(key)
+                if value is None:
+                    value = self._cache[key] = build()
+        return value
+
+
+DEFAULT_PROFILE = MachineProfile()
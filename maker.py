@@ -1,38 +1,82 @@
 from os import PathLike
-from typing import Set
-from imageProcess.processor import ContourFinder, Img
-import random
-import json
-from tkinter.ttk import Style
-from gcode import CommandBuffer, Move, SetupCNC, Pause
+from gcode import (
+    CommandBuffer,
+    Move,
+    MoveBuffer,
+    SetupCNC,
+    Pause,
+    formatMoves,
+    GcodeBlock,
+    modalMoves,
+    simplifyMoves,
+    KIND_PAUSE,
+    KIND_REFILL,
+    KIND_WASH,
+)
+from spatial import StrokeIndex
+from strokes import StrokeSet
+import instrument
+import toolpath
 from pathlib import Path
 import math
-import copy
+import itertools
+from itertools import repeat
+import time
 import numpy as np
-import cv2
 
 ROOT = Path(__file__).parent
-MIN_BRUSH_WIDTH = (
-    5  # (mm) threhold for brush width, above which strokes are added to widen the lines
+# the default machine, kept here too for code that imports them from maker
+from machine import (  # noqa: E402
+    MIN_BRUSH_WIDTH,
+    LENGTH_SCALE,
+    Z_HEIGHT,
+    BACKOFF_HEIGHT,
+    POT_HEIGHT,
+    MAX_STROKE_LENGTH,
+    MAX_X,
+    MAX_Y,
+    MIN_Y,
+    MIN_X,
+    MIN_STROKE_RESOLUTION,
+    CENTER_Y,
+    CENTER_X,
+    FEED_RATE,
+    DEFAULT_COLOR,
+    DEFAULT_PROFILE,
 )
-LENGTH_SCALE = 0.12  # scale factor for line length
-Z_HEIGHT = 40  # (mm) height of the z axis above the bed when instrument touches the bed
-BACKOFF_HEIGHT = 30  # (mm) height to back off when moving to start a new stroke
-POT_HEIGHT = 70  # (mm) height of the color / wash pots
-MAX_STROKE_LENGTH = 700
-MAX_X = 200  # (mm) max x coordinate of the bed
-MAX_Y = 230  # (mm) max y coordinate of the bed
-MIN_Y = 100
-MIN_X = 1
-CENTER_Y = int((MAX_Y + MIN_Y) / 2)  # (mm) center y coordinate of the bed
-CENTER_X = int((MAX_X + MIN_X) / 2)  # (mm) center x coordinate of the bed
-
-FEED_RATE = 1200  # (mm/min) feed rate for the machine
-DEFAULT_COLOR = "green"
+
+# back brush: the points (relative to the current one) the brush goes back over once it
+# has painted a quarter of a stroke, the second -5 was written -3 - 2 and is kept as it paints
+BACK_BRUSH = [-1, -2, -3, -4, -5, -6, -5, -4, -5, -1]
+# Preparer._paint checks the next BRUSH_PROBE points for a refill / back brush one by one,
+# then sums windows of points that start at BRUSH_WINDOW and double while there are none
+BRUSH_PROBE = 16
+BRUSH_WINDOW = 64
+BRUSH_WINDOW_MAX = 65536
+
+
+def _squares(values):
+    # values ** 2 rounded like python's (C pow), which now and then differs from
+    # values * values in the last bit. travelLength has to add up exactly like the loop
+    return np.fromiter(
+        map(math.pow, values.tolist(), repeat(2.0)), np.float64, len(values)
+    )
 
 
 class Preparer:
-    def __init__(self, input_item):
+    def __init__(
+        self,
+        input_item,
+        tourTimeLimit=None,
+        tourIterations=None,
+        contourCache=None,
+        imageResolution=None,
+        colors=None,
+        profile=None,
+        strokeSpacing=None,
+        strokeTolerance=None,
+        smoothContours=False,
+    ):
         """
         Class to manipulate the input to form an array in the format [[[x,y,z,f,e,rapid],[x,y,z,f,e,rapid]],[[x,y,z,f,e,rapid],[x,y,z,f,e,rapid]]]
         array_shape =
@@ -41,290 +85,828 @@ class Preparer:
         ----------
         input_item: image_path|array|list
             The input item to be processed
+        tourTimeLimit: float|None
+            seconds to spend shortening pen up travel after the greedy sort (Optomise.improveTour),
+            the pass is skipped if neither this nor tourIterations is set
+        tourIterations: int|None
+            max number of improving moves for the same pass
+        contourCache: ContourCache|None
+            cache for the image to contour step, only used for image paths
+        imageResolution: float|None
+            (mm) downscale images so a pixel is this wide on the bed before finding contours,
+            e.g. MIN_STROKE_RESOLUTION. None processes the image at full size
+        colors: str|list|None
+            pot color for every stroke (a list as long as the strokes) or one color for all of them.
+            With more than one color the strokes are painted one color at a time, washing the
+            brush in between, see Optomise.planColors. None paints everything in the default color
+        profile: MachineProfile|None
+            the machine to prepare the job for, None for DEFAULT_PROFILE
+        strokeSpacing: float|None
+            (mm) resample the strokes so their points are about this far apart on the bed,
+            closer on tight curves (see StrokeSet.resample). None keeps the points as they are
+        strokeTolerance: float|None
+            (mm) how far the resampled strokes may cut inside a curve, MIN_STROKE_RESOLUTION / 4 if None
+        smoothContours: bool
+            draw splines fitted through the contours of an image instead of the contours
 
         """
+        self.profile = profile or DEFAULT_PROFILE
         self.input_item = input_item
+        self.contourCache = contourCache
+        self.imageResolution = imageResolution
+        self.smoothContours = smoothContours
+        self.imageReport = None
+        self.strokeSpacing = strokeSpacing
+        self.strokeTolerance = strokeTolerance
         self.array = self.loadArray()
-        self.moves = []
-        self.pots = ColorPots()
+        if strokeSpacing is not None:
+            # bed mm per unit of the input, the scale is known before anything is planned
+            self.inputScale = self._bedTransform()[0]
+            self.array = self.resampleStrokes(self.array)
+        self.moves = MoveBuffer()
+        self.pots = ColorPots(self.profile)
+        self.washer = WashCycle(self.profile)
+        self.colors = colors
+        self.tourTimeLimit = tourTimeLimit
+        self.tourIterations = tourIterations
+        self.tourReport = None
+        self.clampedMoves = 0
 
     def build(self):
         return self.make()
 
+    def save(self, path, meta=None):
+        """
+        Write the strokes, and the planned moves once make() has run, to a toolpath file
+        (see toolpath.save). Preparer.load gives them back without planning again.
+        """
+        toolpath.save(
+            path,
+            moves=self.moves if len(self.moves) else None,
+            strokes=self.array,
+            profile=self.profile,
+            meta=meta,
+        )
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        A Preparer for the strokes of a toolpath file, memory mapped from it.
+
+        The planned moves, if the file has them, are in .moves so they can be written
+        with Maker without calling make(), make() plans them again from the strokes.
+        kwargs go to Preparer, the profile is the file's unless one is given.
+        """
+        saved = toolpath.load(path)
+        if saved.strokes is None:
+            raise ValueError(f"{path} has no strokes")
+        kwargs.setdefault("profile", saved.profile)
+        preparer = cls(saved.strokes, **kwargs)
+        if saved.moves is not None:
+            preparer.moves = saved.moves
+        return preparer
+
     def loadArray(self):
         if isinstance(self.input_item, (str, PathLike)):
+            # opencv / scipy are only loaded once an image actually needs processing
+            from imageProcess.processor import ContourFinder, Img
+
             img = Img(self.input_item)
             # resize the image to fit the bed
-            # img.array = cv2.resize(img.array, (MAX_X, MAX_Y))
+            if self.imageResolution is not None:
+                profile = self.profile
+                img.fitToBed(
+                    profile.maxX - profile.minX,
+                    profile.maxY - profile.minY,
+                    self.imageResolution,
+                )
             # cv2.imshow("image", img.array)
             # cv2.waitKey(0)
 
-            arr = ContourFinder(img).find()
+            finder = ContourFinder(
+                img, cache=self.contourCache, smooth=self.smoothContours
+            )
+            arr = finder.find()
+            self.imageReport = img.report()
+            self.imageReport["timings"].update(finder.timings)
+            for stage, seconds in self.imageReport["timings"].items():
+                instrument.record("image." + stage, seconds)
             arr = self.formatContourList(arr)
             #
             return arr
 
-        elif isinstance(self.input_item, np.array):
-            if len(self.input_item[0][0][0].tolist()) > 2:
+        elif isinstance(self.input_item, StrokeSet):
+            return self.input_item
+
+        elif isinstance(self.input_item, np.ndarray):
+            if self.input_item.dtype == object:
+                # ragged strokes that ended up in an object array
+                return StrokeSet.fromList(self.input_item.tolist())
+            if len(self.input_item.shape) != 3:
+                raise ValueError("Input array is not 2D")
+            if self.input_item.shape[2] > 2:
                 print(
                     "Warning: array points have more than 2 dimensions, taking first two dimensions"
                 )
-                return self.input_item[:, :, 0:2]
-            elif len(self.input_item.shape) == 3:
-                return self.input_item
-            else:
-                raise ValueError("Input array is not 2D")
+                return StrokeSet.fromList(list(self.input_item))
+            return StrokeSet.fromArray(self.input_item)
 
         elif isinstance(self.input_item, list):
             # check if the list is a list of lists of lists
             try:
                 if isinstance(self.input_item[0], list):
                     if isinstance(self.input_item[0][0], list):
-                        return np.array(self.input_item)
+                        return StrokeSet.fromList(self.input_item)
 
             except IndexError:
-                raise TypeError(
-                    "Input must be a list of lists\ne.g. [ [ [ x,y ],[ x,y ] ] , [ [ x,y ],[ x,y ] ] ]"
-                )
+                pass
+            raise TypeError(
+                "Input must be a list of lists\ne.g. [ [ [ x,y ],[ x,y ] ] , [ [ x,y ],[ x,y ] ] ]"
+            )
 
         else:
             raise TypeError("Input does not have a valid type")
 
-    def formatContourList(self, contourList):
-        new = []
-        for contour in contourList:
-            new_conts = []
-            contour = contour.flatten()
-            for i in range(0, len(contour) - 1, 2):
-                new_conts.append([contour[i], contour[i + 1]])
+    @instrument.timed()
+    def resampleStrokes(self, strokes):
+        """strokes resampled to strokeSpacing on the bed, with the scale of the input"""
+        scale = self.inputScale
+        tolerance = self.strokeTolerance
+        if tolerance is None:
+            tolerance = MIN_STROKE_RESOLUTION / 4
+        resampled = strokes.resample(
+            self.strokeSpacing / scale,
+            tolerance / scale,
+            minSpacing=MIN_STROKE_RESOLUTION / scale,
+        )
+        instrument.count("pointsResampled", len(resampled.points))
+        return resampled
 
-            new.append(new_conts)
-        return np.array(new)
+    @instrument.timed()
+    def formatContourList(self, contourList):
+        # (n, 1, 2) contours from opencv -> one flat StrokeSet
+        return StrokeSet.fromContours(contourList)
 
+    @instrument.timed()
     def make(self):
-        xVals = set()
-        yVals = set()
-
         # print(self.array.shape)
-        self.resetStroke(self.array[0][0][0], self.array[0][0][0])
-        strokes = Optomise.sortStrokes(self.array)
-        travelLength = 0
+        # plan from scratch, .moves may hold an earlier make() or moves from load()
+        self.moves = MoveBuffer()
+        self._start(self.array[0].tolist())
+        plan = self.planStrokes()
+        instrument.count("strokes", len(self.array))
+        instrument.count("points", len(self.array.points))
+        instrument.count("colors", len(plan))
+        for group, (color, strokes) in enumerate(plan):
+            self._startColor(group, color, strokes[0].tolist())
+            self._paint(strokes)
+
+        minX, minY = self.array.points.min(axis=0).tolist()
+        maxX, maxY = self.array.points.max(axis=0).tolist()
+
+        instrument.count("moves", len(self.moves))
+        return self._manipulate(maxX, maxY, minX, minY)
+
+    def _start(self, first):
+        # the moves before any painting, first is the first stroke in the input
+        profile = self.profile
+        self.resetStroke(first[0][0], first[0][0])
         # "G1 X40 Y40 Z40 F3000 ;Move Z Axis up",
         #     "M0; stop and wait for user input",
         #     "G1 X40 Y40 Z50 F3000 ;Move Z Axis up",
-        self.moves.append(
-            Move(
-                x=MAX_X - 20,
-                y=MIN_Y,
-                z=Z_HEIGHT,
-                e=0,
-                f=FEED_RATE,
-                rapid=True,
-                immuneToLimits=True,
-            )
+        self.moves.add(
+            x=profile.maxX - 20,
+            y=profile.minY,
+            z=profile.zHeight,
+            e=0,
+            f=profile.feedRate,
+            rapid=True,
+            immuneToLimits=True,
+        )
+        self.moves.add(
+            x=profile.maxX - 30,
+            y=profile.minY + 30,
+            z=profile.zHeight,
+            f=profile.feedRate,
+            kind=KIND_PAUSE,
         )
-        self.moves.append(Pause(x=MAX_X - 30, y=MIN_Y + 30, z=Z_HEIGHT, f=FEED_RATE))
 
-        self.moves.append(
-            Move(
-                MAX_X - 20,
-                MIN_Y,
-                Z_HEIGHT + BACKOFF_HEIGHT,
-                0,
-                FEED_RATE,
-                True,
-                immuneToLimits=True,
-            )
+        self.moves.add(
+            profile.maxX - 20,
+            profile.minY,
+            profile.zHeight + profile.backoffHeight,
+            0,
+            profile.feedRate,
+            True,
+            immuneToLimits=True,
         )
-        self.refillColor(self.array[0][0], self.array[0][1])
-        for stroke in strokes:
-            quarteredMaxStroke = int(MAX_STROKE_LENGTH / 4)
 
-            if len(stroke) >= 2:
-                self.leadIn(stroke[0], stroke[1])
-                firstAfterLeadIn = True
-            else:
-                self.moves.append(
-                    Move(
-                        x=stroke[0][0],
-                        y=stroke[0][1],
-                        z=Z_HEIGHT + BACKOFF_HEIGHT,
-                        f=FEED_RATE,
-                        e=0,
-                    )
+    def _startColor(self, group, color, first):
+        # before the strokes of the group'th color, first is its first stroke
+        if group:
+            # clean the last color off before dipping into the next pot
+            self.moves.addBlock(self.washer.getBlock("wash"))
+        self.refillColor(first[0], first[min(1, len(first) - 1)], color)
+
+    def planStrokes(self):
+        """
+        The strokes in drawing order, as a list of (color, StrokeSet) to paint one after the other.
+
+        With a single color that's one sorted group, the color is None for the default color.
+        """
+        colors = self.colors
+        if colors is None or isinstance(colors, str):
+            with instrument.timer("Optomise.sortStrokes"):
+                strokes = Optomise.sortStrokes(self.array)
+            plan = [(colors, strokes)]
+        else:
+            if len(colors) != len(self.array):
+                raise ValueError(
+                    f"got {len(colors)} colors for {len(self.array)} strokes"
                 )
-            for i, point in enumerate(stroke):
-                if (
-                    travelLength >= MAX_STROKE_LENGTH
-                    and len(stroke) > 1
-                    and 1 < i < len(stroke) - 1
-                ):
-                    # self.moves.extend(WashCycle().washCenterJiggle())
-                    self.refillColor(stroke[i], stroke[i + 1])
-                    travelLength = 0
-                    firstAfterLeadIn = True
-
-                elif (
-                    travelLength >= quarteredMaxStroke
-                    and i > int(len(stroke) / 4)
-                    and i >= 7
-                ):
-                    for prevNum in [-1, -2, -3, -4, -5, -6, -5, -4, -3 - 2, -1]:
-                        backMove = stroke[i + prevNum]
-                        self.moves.append(
-                            Move(
-                                x=backMove[0],
-                                y=backMove[1],
-                                z=Z_HEIGHT,
-                                f=FEED_RATE,
-                                e=0,
-                            )
-                        )
-                    quarteredMaxStroke += int(MAX_STROKE_LENGTH / 4)
-
-                # if the travel length is beyond the quarter of the max stroke length,
-                # find the previous point and move to it
-
-                move = Move(
-                    x=point[0], y=point[1], z=Z_HEIGHT, e=0, f=FEED_RATE, rapid=True
+            for color in set(colors):
+                if color not in self.pots.pots:
+                    raise ValueError(f"Color {color!r} not in pot list")
+            # planning happens before the strokes are scaled to the bed, so bring
+            # the pots into stroke coordinates
+            scale, offsetX, offsetY = self._bedTransform()
+
+            def toStrokes(x, y):
+                return (x - offsetX) / scale, (y - offsetY) / scale
+
+            pots = {
+                color: toStrokes(*self.pots._potPos(color)) for color in set(colors)
+            }
+            wash = toStrokes(self.washer.potX, self.washer.potY)
+            with instrument.timer("Optomise.sortStrokes"):
+                plan = Optomise.planColors(self.array, colors, pots, wash)
+
+        if self.tourTimeLimit is None and self.tourIterations is None:
+            return plan
+        improved = []
+        self.tourReport = None
+        with instrument.timer("Optomise.improveTour"):
+            for color, strokes in plan:
+                strokes, report = Optomise.improveTour(
+                    strokes,
+                    maxIterations=self.tourIterations,
+                    timeLimit=self.tourTimeLimit,
                 )
-                xVals.add(point[0])
-                yVals.add(point[1])
-                if not firstAfterLeadIn:
-                    travelLength += math.sqrt(
-                        (move.x - self.moves[-1].x) ** 2
-                        + (move.y - self.moves[-1].y) ** 2
+                improved.append((color, strokes))
+                if self.tourReport is None:
+                    self.tourReport = report
+                else:
+                    for key, value in report.items():
+                        self.tourReport[key] += value
+        return improved
+
+    def _bedTransform(self):
+        # roughly the scale and offset _manipulate will use, from the stroke points alone
+        profile = self.profile
+        points = self.array.points
+        minX, minY = points.min(axis=0).tolist()
+        maxX, maxY = points.max(axis=0).tolist()
+        scale = min(
+            (profile.maxX - profile.minX) / max(maxX - minX, 1e-9),
+            (profile.maxY - profile.minY) / max(maxY - minY, 1e-9),
+        )
+        centerX, centerY = points.mean(axis=0).tolist()
+        return (
+            scale,
+            profile.centerX - centerX * scale,
+            profile.centerY - centerY * scale,
+        )
+
+    def _paint(self, strokes):
+        """
+        The moves for every stroke of one color, refilling as the brush runs dry.
+
+        The same moves _paintStroke makes one point at a time, worked out for the whole
+        color at once. The distance painted up to every point is a running sum over the
+        flat points (added up in the same order and rounded the same way as the loop,
+        so refills and back brushes land on exactly the same points), the first point
+        past the refill or back brush distance is found with searchsorted, and the rows
+        are put together in one go at the end.
+        """
+        profile = self.profile
+        lengths = strokes.lengths
+        if len(lengths) == 0:
+            return
+        if (lengths == 0).any():
+            raise ValueError("strokes need at least one point")
+        points = strokes.points.astype(np.float64)
+        xs, ys = points[:, 0], points[:, 1]
+        count = len(points)
+        starts = strokes.offsets[:-1]
+        strokeOf = np.repeat(np.arange(len(lengths)), lengths)
+        n = lengths[strokeOf]
+        index = np.arange(count) - starts[strokeOf]
+        first = index == 0
+        long = lengths >= 2
+        leadIns = np.array(
+            [
+                self._leadInStart(a, b)
+                for a, b in zip(
+                    points[starts[long]].tolist(), points[starts[long] + 1].tolist()
+                )
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+
+        # distance painted by every point: from the point before, from the lead in for
+        # the second point of a stroke, nothing for the first
+        fromX = np.concatenate([[0.0], xs[:-1]])
+        fromY = np.concatenate([[0.0], ys[:-1]])
+        second = np.flatnonzero(index == 1)
+        fromX[second], fromY[second] = leadIns[:, 0], leadIns[:, 1]
+        step = np.sqrt(_squares(xs - fromX) + _squares(ys - fromY))
+        step[first] = 0.0
+
+        refills, brushes, refillLeadIns = self._brushPoints(
+            step, points, strokeOf, index, n, strokes.offsets[1:][strokeOf]
+        )
+        refillLeadIns = np.array(refillLeadIns, dtype=np.float64).reshape(-1, 2)
+
+        # the rows without refills or back brushes: a row before the first point of
+        # every stroke (its lead in, or above it for a single point), then a row for
+        # every point but the first of a long stroke
+        painted = ~first | (n == 1)
+        rowStart = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(first.astype(np.int64) + painted, out=rowStart[1:])
+        headRows = rowStart[:-1][first]
+        pointRows = rowStart[:-1][painted] + first[painted]
+        rowX = np.empty(rowStart[-1])
+        rowY = np.empty(rowStart[-1])
+        rowZ = np.full(rowStart[-1], float(profile.zHeight))
+        rowRapid = np.zeros(rowStart[-1], dtype=bool)
+        rowX[pointRows], rowY[pointRows] = xs[painted], ys[painted]
+        rowRapid[pointRows] = True
+        headX, headY = xs[starts].copy(), ys[starts].copy()
+        headX[long], headY[long] = leadIns[:, 0], leadIns[:, 1]
+        rowX[headRows], rowY[headRows] = headX, headY
+        rowZ[headRows] = np.where(
+            long,
+            profile.zHeight + profile.backoffHeight * 0.6,
+            profile.zHeight + profile.backoffHeight,
+        )
+        base = MoveBuffer(capacity=max(len(rowX), 1))
+        base.addColumns(x=rowX, y=rowY, z=rowZ, e=0, f=profile.feedRate, rapid=rowRapid)
+
+        # the refills and back brushes go in before the row of their point, a refill
+        # takes the place of it
+        refills = np.array(refills, dtype=np.int64)
+        brushes = np.array(brushes, dtype=np.int64)
+        refillBlock = MoveBuffer(capacity=1)
+        if len(refills):
+            refillBlock.addBlock(self.pots.getBlock())
+        refillMoves = MoveBuffer(capacity=max(2 * len(refills), 1))
+        refillMoves.addColumns(
+            x=np.column_stack([xs[refills], refillLeadIns[:, 0]]).ravel(),
+            y=np.column_stack([ys[refills], refillLeadIns[:, 1]]).ravel(),
+            z=np.tile(
+                [
+                    profile.zHeight + profile.backoffHeight,
+                    profile.zHeight + profile.backoffHeight * 0.6,
+                ],
+                len(refills),
+            ),
+            e=0,
+            f=profile.feedRate,
+        )
+        back = (brushes[:, None] + BACK_BRUSH).ravel()
+        brushMoves = MoveBuffer(capacity=max(len(back), 1))
+        brushMoves.addColumns(
+            x=xs[back], y=ys[back], z=profile.zHeight, e=0, f=profile.feedRate
+        )
+        extra = MoveBuffer.concatenate(
+            [
+                refillBlock.take(np.zeros(len(refills), dtype=np.int64)),
+                refillMoves,
+                brushMoves,
+            ]
+        )
+        # rows of extra for each refill (block, above the point, lead in) then each brush
+        eventRows = np.concatenate(
+            [
+                np.column_stack(
+                    [
+                        np.arange(len(refills)),
+                        len(refills) + 2 * np.arange(len(refills)),
+                        len(refills) + 2 * np.arange(len(refills)) + 1,
+                    ]
+                ).ravel(),
+                3 * len(refills) + np.arange(len(back)),
+            ]
+        ).astype(np.int64)
+
+        at = np.concatenate([rowStart[refills], rowStart[brushes]])
+        sizes = np.concatenate(
+            [np.full(len(refills), 3), np.full(len(brushes), len(BACK_BRUSH))]
+        ).astype(np.int64)
+        added = np.zeros(len(base) + 1, dtype=np.int64)
+        np.add.at(added, at, sizes)
+        removed = np.zeros(len(base) + 1, dtype=np.int64)
+        removed[rowStart[refills]] = 1
+        # where every base row ends up, the rows put in before it come just before
+        shift = np.cumsum(added) - np.concatenate([[0], np.cumsum(removed)[:-1]])
+        position = np.arange(len(base) + 1) + shift
+        source = np.empty(len(base) + len(extra) - len(refills), dtype=np.int64)
+        keep = removed[:-1] == 0
+        source[position[:-1][keep]] = np.flatnonzero(keep)
+        starts = np.cumsum(sizes) - sizes
+        within = np.arange(len(eventRows)) - np.repeat(starts, sizes)
+        source[np.repeat(position[at] - sizes, sizes) + within] = len(base) + eventRows
+        self.moves.extend(MoveBuffer.concatenate([base, extra]).take(source))
+
+    def _brushPoints(self, step, points, strokeOf, index, n, strokeEnd):
+        # the points that get a refill / a back brush, following travelLength and
+        # quarteredMaxStroke through the color like _paintStroke does. The next few
+        # points are checked one by one (events are often close together), past those
+        # the next event is found with searchsorted over a running sum
+        profile = self.profile
+        count = len(step)
+        canRefill = (index > 1) & (index < n - 1)
+        canBrush = (index > n // 4) & (index >= 7)
+        nextRefill = np.append(np.where(canRefill, np.arange(count), count), count)
+        nextBrush = np.append(np.where(canBrush, np.arange(count), count), count)
+        nextRefill = np.minimum.accumulate(nextRefill[::-1])[::-1].tolist()
+        nextBrush = np.minimum.accumulate(nextBrush[::-1])[::-1].tolist()
+        steps, pointList = step.tolist(), points.tolist()
+        strokeOf, strokeEnd = strokeOf.tolist(), strokeEnd.tolist()
+
+        maxStroke = profile.maxStrokeLength
+        quarter = int(maxStroke / 4)
+        refills, brushes, leadIns = [], [], []
+        brushStroke, quarteredMaxStroke = -1, quarter
+        travelLength = 0
+        firstStep = None  # what point g paints if it's not step[g]
+        g, window = 0, BRUSH_WINDOW
+        while g < count:
+            event = None
+            for g in range(g, min(count, g + BRUSH_PROBE)):
+                if strokeOf[g] != brushStroke:
+                    brushStroke, quarteredMaxStroke = strokeOf[g], quarter
+                if travelLength >= maxStroke and nextRefill[g] == g:
+                    event = g
+                    break
+                if travelLength >= quarteredMaxStroke and nextBrush[g] == g:
+                    event = g
+                    break
+                travelLength += steps[g] if firstStep is None else firstStep
+                firstStep = None
+            else:
+                # all of them checked without an event
+                g += 1
+            if event is None and g < count:
+                if strokeOf[g] != brushStroke:
+                    brushStroke, quarteredMaxStroke = strokeOf[g], quarter
+                end = min(count, g + window)
+                # travelLength before each point of the window, added up like the loop
+                before = np.empty(end - g + 1)
+                before[0] = travelLength
+                before[1:] = step[g:end]
+                np.cumsum(before, out=before)
+                pastRefill, pastBrush, pastQuarter = (
+                    g
+                    + np.searchsorted(
+                        before[:-1], (maxStroke, quarteredMaxStroke, quarter)
                     )
-                    self.moves.append(move)
-                firstAfterLeadIn = False
+                ).tolist()
+                refill = nextRefill[pastRefill]
+                brush = nextBrush[pastBrush]
+                if brush >= strokeEnd[g]:
+                    # later strokes start again from the first quarter
+                    brush = nextBrush[max(pastQuarter, strokeEnd[g])]
+                event = min(refill, brush)
+                if event >= end:
+                    travelLength = before[-1].item()
+                    g = end
+                    window = min(window * 2, BRUSH_WINDOW_MAX)
+                    continue
+                window = BRUSH_WINDOW
+                travelLength = before[event - g].item()
+                if strokeOf[event] != brushStroke:
+                    brushStroke, quarteredMaxStroke = strokeOf[event], quarter
+            if event is None:
+                break
 
-        maxX = max(xVals)
-        maxY = max(yVals)
-        minX = min(xVals)
-        minY = min(yVals)
+            if travelLength >= maxStroke and nextRefill[event] == event:
+                # the point isn't painted, the next one is painted from the lead in
+                a, b = pointList[event], pointList[event + 1]
+                x, y = self._leadInStart(a, b)
+                refills.append(event)
+                leadIns.append((x, y))
+                travelLength = 0
+                firstStep = math.sqrt((b[0] - x) ** 2 + (b[1] - y) ** 2)
+            else:
+                brushes.append(event)
+                quarteredMaxStroke += quarter
+                # the back brush ends on the point before, even right after a refill
+                travelLength += steps[event]
+                firstStep = None
+            g = event + 1
+        return refills, brushes, leadIns
 
-        return self._manipulate(maxX, maxY, minX, minY)
+    def _paintStroke(self, stroke, travelLength):
+        # the moves for one stroke, travelLength is how far the brush has painted since
+        # it was last refilled. Returns the travelLength after the stroke. _paint does
+        # the same for a whole color at once, IncrementalPlanner paints a stroke at a time
+        profile = self.profile
+        quarteredMaxStroke = int(profile.maxStrokeLength / 4)
 
+        if len(stroke) >= 2:
+            self.leadIn(stroke[0], stroke[1])
+            firstAfterLeadIn = True
+        else:
+            self.moves.add(
+                x=stroke[0][0],
+                y=stroke[0][1],
+                z=profile.zHeight + profile.backoffHeight,
+                f=profile.feedRate,
+                e=0,
+            )
+            firstAfterLeadIn = False
+        for i, point in enumerate(stroke):
+            if (
+                travelLength >= profile.maxStrokeLength
+                and len(stroke) > 1
+                and 1 < i < len(stroke) - 1
+            ):
+                # self.moves.extend(WashCycle().washCenterJiggle())
+                self.refillColor(stroke[i], stroke[i + 1])
+                travelLength = 0
+                firstAfterLeadIn = True
+
+            elif (
+                travelLength >= quarteredMaxStroke
+                and i > int(len(stroke) / 4)
+                and i >= 7
+            ):
+                for prevNum in BACK_BRUSH:
+                    backMove = stroke[i + prevNum]
+                    self.moves.add(
+                        x=backMove[0],
+                        y=backMove[1],
+                        z=profile.zHeight,
+                        f=profile.feedRate,
+                        e=0,
+                    )
+                quarteredMaxStroke += int(profile.maxStrokeLength / 4)
+
+            # if the travel length is beyond the quarter of the max stroke length,
+            # find the previous point and move to it
+
+            if not firstAfterLeadIn:
+                travelLength += math.sqrt(
+                    (point[0] - self.moves.x[-1]) ** 2
+                    + (point[1] - self.moves.y[-1]) ** 2
+                )
+                self.moves.add(
+                    x=point[0],
+                    y=point[1],
+                    z=profile.zHeight,
+                    e=0,
+                    f=profile.feedRate,
+                    rapid=True,
+                )
+            firstAfterLeadIn = False
+        return travelLength
+
+    @instrument.timed()
     def _manipulate(self, maxX, maxY, minX, minY):
+        profile = self.profile
         # scale the x and y coordinates to fit the bed
-        x_scale = (MAX_X - MIN_X) / (maxX - minX)
-        y_scale = (MAX_Y - MIN_Y) / (maxY - minY)
+        x_scale = (profile.maxX - profile.minX) / (maxX - minX)
+        y_scale = (profile.maxY - profile.minY) / (maxY - minY)
         scale = min(x_scale, y_scale)  # C: I've broken something here but idk what?
         # the image wont rotate so that its like on the sketchpad
         # i.e. vertical axis perperndicular to the longest edge of the sheet
-        actualMoves = []
-        for move in self.moves:
-            if any([isinstance(move, Pause), move.immuneToLimits]):
-                continue
-            actualMoves.append(move)
-
-        centerX = sum([c.x for c in actualMoves]) / len(actualMoves)
-        centerY = sum([c.y for c in actualMoves]) / len(actualMoves)
-        offsetX = CENTER_X - centerX * scale
-        offsetY = CENTER_Y - centerY * scale
-        newMoves = []
 
+        # pauses and pot / wash moves keep their own coordinates
+        moves = self.moves
+        drawing = (moves.kind != KIND_PAUSE) & ~moves.immune
+        xs = moves.x[drawing]
+        ys = moves.y[drawing]
+
+        centerX = xs.sum() / len(xs)
+        centerY = ys.sum() / len(ys)
+        offsetX = profile.centerX - centerX * scale
+        offsetY = profile.centerY - centerY * scale
+
+        self.clampedMoves = int(self._toBed(moves, scale, offsetX, offsetY).sum())
+        if self.clampedMoves:
+            print(f"{self.clampedMoves} moves outside of bounds, clamped to the bed")
+
+        return self.moves
+
+    def _toBed(self, moves, scale, offsetX, offsetY):
+        # scale and offset the drawing rows of moves in place, clamping any that end up
+        # off the bed. Returns a mask of the rows that were clamped
+        profile = self.profile
+        drawing = (moves.kind != KIND_PAUSE) & ~moves.immune
         # scale each value, and add the center offset
-        for move in self.moves:
-            if any([isinstance(move, Pause), move.immuneToLimits]):
-                newMoves.append(move)
-                continue
-            newX = (move.x * scale) + offsetX
-            newY = (move.y * scale) + offsetY
-            move.x = newX
-            move.y = newY
-            if not all([MIN_X <= move.x <= MAX_X, MIN_Y <= move.y <= MAX_Y]):
-                print("Move outside of bounds: " + str(move.x) + " " + str(move.y))
-                if move.x < MIN_X:
-                    move.x = MIN_X
-                if move.x > MAX_X:
-                    move.x = MAX_X
-                if move.y < MIN_Y:
-                    move.y = MIN_Y
-                if move.y > MAX_Y:
-                    move.y = MAX_Y
-
-            newMoves.append(move)
-
-        return newMoves
+        xs = moves.x[drawing] * scale + offsetX
+        ys = moves.y[drawing] * scale + offsetY
+        outside = (
+            (xs < profile.minX)
+            | (xs > profile.maxX)
+            | (ys < profile.minY)
+            | (ys > profile.maxY)
+        )
+        if outside.any():
+            np.clip(xs, profile.minX, profile.maxX, out=xs)
+            np.clip(ys, profile.minY, profile.maxY, out=ys)
+        moves.x[drawing] = xs
+        moves.y[drawing] = ys
+        clamped = np.zeros(len(moves), dtype=bool)
+        clamped[drawing] = outside
+        return clamped
 
     def resetStroke(self, next_x, next_y):
-        if not self.moves == []:
+        profile = self.profile
+        if len(self.moves):
             prevMove = self.moves[-1]
             if isinstance(prevMove, Pause):
                 pass
             else:
                 x, y, z = prevMove.x, prevMove.y, prevMove.z
-                self.moves.append(
-                    Move(x, y, Z_HEIGHT + BACKOFF_HEIGHT, 0, FEED_RATE, False)
+                self.moves.add(
+                    x,
+                    y,
+                    profile.zHeight + profile.backoffHeight,
+                    0,
+                    profile.feedRate,
+                    False,
                 )
-        self.moves.append(
-            Move(
-                x=next_x,
-                y=next_y,
-                z=Z_HEIGHT + BACKOFF_HEIGHT,
-                f=FEED_RATE,
-                e=0,
-                rapid=True,
-            )
+        self.moves.add(
+            x=next_x,
+            y=next_y,
+            z=profile.zHeight + profile.backoffHeight,
+            f=profile.feedRate,
+            e=0,
+            rapid=True,
         )
 
-    def leadIn(self, first_next, second_next):
+    def _leadInStart(self, first_next, second_next):
+        # where the lead in into first_next -> second_next starts
+        profile = self.profile
 
         x1, y1 = first_next
         x2, y2 = second_next
-        gradient = (y2 - y1) / (x2 - x1)
+        if x2 != x1:
+            angle = math.atan((y2 - y1) / (x2 - x1))
+        else:
+            # vertical (or repeated point), the gradient would be infinite
+            angle = math.copysign(math.pi / 2, y2 - y1) if y2 != y1 else 0.0
 
         # find the start point 20mm away from the last move in the opposite direction of the angle
         # so the line between start and first_next will lead into the first_next to second_next line
-        x_start = x1 + 20 * math.cos(math.atan(gradient))
-        y_start = y1 + 20 * math.sin(math.atan(gradient))
-        if x_start < MIN_X:
-            x_start = MIN_X + 2
-        if y_start < MIN_Y:
-            y_start = MIN_Y + 2
-        if x_start > MAX_X:
-            x_start = MAX_X - 2
-        if y_start > MAX_Y:
-            y_start = MAX_Y - 2
-
-        self.moves.append(
-            Move(
-                x=x_start,
-                y=y_start,
-                z=Z_HEIGHT + BACKOFF_HEIGHT * 0.6,
-                f=FEED_RATE,
-                e=0,
-                rapid=False,
-            )
+        x_start = x1 + 20 * math.cos(angle)
+        y_start = y1 + 20 * math.sin(angle)
+        if x_start < profile.minX:
+            x_start = profile.minX + 2
+        if y_start < profile.minY:
+            y_start = profile.minY + 2
+        if x_start > profile.maxX:
+            x_start = profile.maxX - 2
+        if y_start > profile.maxY:
+            y_start = profile.maxY - 2
+        return x_start, y_start
+
+    def leadIn(self, first_next, second_next):
+        profile = self.profile
+        x_start, y_start = self._leadInStart(first_next, second_next)
+
+        self.moves.add(
+            x=x_start,
+            y=y_start,
+            z=profile.zHeight + profile.backoffHeight * 0.6,
+            f=profile.feedRate,
+            e=0,
+            rapid=False,
         )
 
-    def refillColor(self, first_next, second_next):
+    def refillColor(self, first_next, second_next, color=None):
+        """dip the brush in a pot (the current color if color is None) and lead into first_next"""
+        profile = self.profile
         x1, y1 = first_next
-        self.moves.extend(self.pots.getColor(color=None))
-        self.moves.append(
-            Move(
-                x=x1,
-                y=y1,
-                z=Z_HEIGHT + BACKOFF_HEIGHT,
-                f=FEED_RATE,
-                e=0,
-            )
+        self.moves.addBlock(self.pots.getBlock(color=color))
+        self.moves.add(
+            x=x1,
+            y=y1,
+            z=profile.zHeight + profile.backoffHeight,
+            f=profile.feedRate,
+            e=0,
         )
         self.leadIn(first_next=first_next, second_next=second_next)
 
 
 class Maker:
-    def __init__(self):
-        self.setup = SetupCNC()
+    def __init__(self, compress=False, tolerance=None, profile=None):
+        """
+        Parameters
+        ----------
+        profile: MachineProfile|None
+            whose start / end G-code to write, None for DEFAULT_PROFILE
+        compress: bool
+            only write the axis / E / F words that change from one move to the next
+        tolerance: float|None
+            (mm) merge nearly collinear moves, dropping points closer than this to the
+            line through their neighbours (see gcode.simplifyMoves). None keeps every point
+        """
+        self.profile = profile or DEFAULT_PROFILE
+        self.setup = self.profile.cached("setup", lambda: SetupCNC(self.profile))
+        self.compress = compress
+        self.tolerance = tolerance
         self.posx = 0
         self.posy = 0
         self.posz = 0
 
+    def save(self, path, moves, meta=None):
+        """write moves to a toolpath file with this Maker's profile, see Maker.load"""
+        toolpath.save(path, moves=moves, profile=self.profile, meta=meta)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        The moves of a toolpath file, memory mapped, and a Maker for the machine they
+        were planned for (kwargs go to Maker), ready for dump() / writeTo().
+        """
+        saved = toolpath.load(path)
+        if saved.moves is None:
+            raise ValueError(f"{path} has no moves")
+        kwargs.setdefault("profile", saved.profile)
+        return cls(**kwargs), saved.moves
+
+    def optimise(self, moves):
+        """the moves as they get written out, after simplifying and compressing if enabled"""
+        before = len(moves)
+        if self.tolerance is not None:
+            moves = simplifyMoves(moves, self.tolerance)
+        if self.compress:
+            moves = modalMoves(moves)
+        instrument.count("movesRemoved", before - len(moves))
+        return moves
+
+    def reduction(self, moves):
+        """
+        Compare the program this Maker writes against the plain one.
+
+        Returns a dict with the lines and bytes of both and the fraction saved.
+        """
+        plain = "\n".join(Maker(profile=self.profile).iterBlocks(moves))
+        optimised = "\n".join(self.iterBlocks(moves))
+        linesBefore, linesAfter = plain.count("\n") + 1, optimised.count("\n") + 1
+        return {
+            "linesBefore": linesBefore,
+            "linesAfter": linesAfter,
+            "bytesBefore": len(plain),
+            "bytesAfter": len(optimised),
+            "linesSaved": 1 - linesAfter / linesBefore,
+            "bytesSaved": 1 - len(optimised) / len(plain),
+        }
+
     def dump(self, moves):
-        Gcode = "\n".join(move.getCommand() for move in moves)
+        with instrument.timer("Maker.dump"):
+            program = "\n".join(self.iterBlocks(moves))
+        instrument.count("bytes", len(program))
+        return program
+
+    def iterBlocks(self, moves, blockRows=4096):
+        """
+        yield the program as text blocks of up to blockRows lines (start block, moves, end block)
+
+        Blocks have no trailing newline, joining them with newlines gives dump().
+        """
+        if self.compress or self.tolerance is not None:
+            moves = self.optimise(moves)
+        yield self.setup.dump("start")
+        for start in range(0, len(moves), blockRows):
+            yield formatMoves(moves[start : start + blockRows])
+        yield self.setup.dump("end")
 
-        return self.setup.dump("start") + "\n" + Gcode + "\n" + self.setup.dump("end")
+    def iterLines(self, moves):
+        """yield the whole program (start block, moves, end block) one line at a time, without newlines"""
+        for block in self.iterBlocks(moves):
+            yield from block.split("\n")
+
+    def writeTo(self, fileobj, moves, blockRows=4096):
+        """
+        Stream the program into an open text file (or anything with a write method).
+
+        The moves are formatted blockRows at a time so the whole program is never held
+        in memory, the result matches dump(). Returns the number of characters written.
+        """
+        written = 0
+        separator = ""
+        with instrument.timer("Maker.dump"):
+            for block in self.iterBlocks(moves, blockRows):
+                text = separator + block
+                fileobj.write(text)
+                written += len(text)
+                separator = "\n"
+        instrument.count("bytes", written)
+        return written
 
     def makeArray(self):
         array = np.array(
@@ -337,48 +919,324 @@ class Maker:
 
 
 class Optomise:
-    def sortStrokes(strokes):
+    def sortStrokes(strokes, allowReverse=False, start=None):
         """
-        sort the strokes so that strokes[x][-1][0] is as close to strokes[x+1][-1][0] as possible
+        sort the strokes so that the end of strokes[x] is as close to the start of strokes[x+1] as possible
+
+        Greedy nearest neighbour ordering starting from the first stroke, ties go to
+        the stroke that came first in the input. The lookups go through a kd-tree
+        over the stroke endpoints so large contour sets don't scan every remaining stroke.
 
+        Parameters
+        ----------
+        strokes: StrokeSet|array|list
+            strokes in the format [[[x,y],[x,y]],[[x,y],[x,y]]], a StrokeSet comes back as a StrokeSet
+        allowReverse: bool
+            also consider drawing a stroke from its last point back to its first
+        start: (x, y)|None
+            begin with the stroke closest to this point instead of the first one
         """
         if isinstance(strokes, np.ndarray):
             strokes = strokes.tolist()
-        first = strokes[0]
-        sortedStrokes = [first]
-        strokes.remove(first)
-        while len(strokes) != 0:
-            endX = sortedStrokes[-1][-1][0]
-            endY = sortedStrokes[-1][-1][1]
-            closestIdx = None
-            closestDist = None
-
-            for i, stroke in enumerate(strokes):
-                startX = stroke[0][0]
-                startY = stroke[0][1]
-                dist = math.sqrt((startX - endX) ** 2 + (startY - endY) ** 2)
-                if closestDist is None or dist < closestDist:
-                    closestDist = dist
-                    closestIdx = i
-            sortedStrokes.append(strokes[closestIdx])
-            strokes.remove(strokes[closestIdx])
-        return sortedStrokes
+        if len(strokes) == 0:
+            return strokes if isinstance(strokes, StrokeSet) else []
+        if isinstance(strokes, StrokeSet):
+            starts = strokes.starts[:, :2].tolist()
+            ends = strokes.ends[:, :2].tolist()
+        else:
+            starts = [(stroke[0][0], stroke[0][1]) for stroke in strokes]
+            ends = [(stroke[-1][0], stroke[-1][1]) for stroke in strokes]
+        index = StrokeIndex(starts, ends if allowReverse else None)
 
+        first, reverse = 0, False
+        if start is not None:
+            first, reverse, _ = index.nearest(*start)
+        index.remove(first)
+        order = [first]
+        flipped = [reverse]
+        endX, endY = starts[first] if reverse else ends[first]
+        while len(index) != 0:
+            closestIdx, reverse, _ = index.nearest(endX, endY)
+            index.remove(closestIdx)
+            order.append(closestIdx)
+            flipped.append(reverse)
+            endX, endY = starts[closestIdx] if reverse else ends[closestIdx]
+        if isinstance(strokes, StrokeSet):
+            return strokes.take(order, flipped if allowReverse else None)
+        return [
+            strokes[idx][::-1] if flip else strokes[idx]
+            for idx, flip in zip(order, flipped)
+        ]
 
-class ColorPots:
-    def __init__(self):
-        self.pots = {
-            "red": 0,
-            "green": 1,
-            "blue": 2,
+    def planColors(strokes, colors, pots, wash, allowReverse=False):
+        """
+        Group strokes by color and order the groups and the strokes in them for the least travel.
+
+        Every color is painted in one go so the brush is washed once per color change. Each
+        group is sorted with sortStrokes starting from the stroke nearest its pot, then the
+        order of the groups is picked to make the trips from the end of one group to the wash
+        pot, on to the next pot and to its first stroke as short as possible (every order is
+        tried for up to 6 colors, after that it's greedy).
+
+        Parameters
+        ----------
+        strokes: StrokeSet
+        colors: list
+            pot color for every stroke
+        pots: dict
+            color -> (x, y) of its pot, in the same coordinates as the strokes
+        wash: (x, y)
+            the wash pot
+
+        Returns
+        -------
+        list of (color, StrokeSet) in painting order
+        """
+        colors = np.asarray(colors)
+        groups = {}
+        for color in dict.fromkeys(colors.tolist()):
+            group = strokes.take(np.flatnonzero(colors == color))
+            groups[color] = Optomise.sortStrokes(
+                group, allowReverse=allowReverse, start=pots[color]
+            )
+
+        def distance(a, b):
+            return math.hypot(a[0] - b[0], a[1] - b[1])
+
+        def enter(color):
+            # from the pot to the first stroke of the group
+            return distance(pots[color], groups[color][0][0].tolist())
+
+        def change(before, after):
+            # last stroke of one group -> wash -> next pot
+            end = groups[before][-1][-1].tolist()
+            return distance(end, wash) + distance(wash, pots[after])
+
+        def cost(order):
+            return sum(enter(color) for color in order) + sum(
+                change(a, b) for a, b in zip(order[:-1], order[1:])
+            )
+
+        names = list(groups)
+        if len(names) <= 6:
+            order = min(itertools.permutations(names), key=cost)
+        else:
+            order = [min(names, key=enter)]
+            while len(order) < len(names):
+                left = [color for color in names if color not in order]
+                order.append(
+                    min(left, key=lambda color: change(order[-1], color) + enter(color))
+                )
+        return [(color, groups[color]) for color in order]
+
+    def travelLength(strokes):
+        """total pen up distance between the end of each stroke and the start of the next"""
+        if len(strokes) < 2:
+            return 0.0
+        if isinstance(strokes, StrokeSet):
+            starts, ends = strokes.starts, strokes.ends
+            return float(np.hypot(*(starts[1:] - ends[:-1]).T).sum())
+        starts = np.array([stroke[0][:2] for stroke in strokes], dtype=np.float64)
+        ends = np.array([stroke[-1][:2] for stroke in strokes], dtype=np.float64)
+        return float(np.hypot(*(starts[1:] - ends[:-1]).T).sum())
+
+    def improveTour(strokes, maxIterations=None, timeLimit=None, allowReverse=True):
+        """
+        Shorten the pen up travel of an already ordered list of strokes with a 2-opt / Or-opt local search.
+
+        The first stroke stays where it is. 2-opt reverses a run of strokes (so each stroke in it
+        is drawn backwards), Or-opt moves a run of 1-3 strokes somewhere else in the order. The
+        search stops at a local optimum or when either budget runs out, whichever is first.
+
+        Parameters
+        ----------
+        strokes: StrokeSet|list
+            strokes in drawing order, e.g. the output of sortStrokes
+        maxIterations: int|None
+            max number of improving moves to apply
+        timeLimit: float|None
+            wall clock budget in seconds
+        allowReverse: bool
+            allow strokes to be drawn backwards, 2-opt is only used if this is set
+
+        Returns
+        -------
+        (strokes, report)
+            the reordered strokes and a dict with the pen up travel before and after
+        """
+        startTime = time.perf_counter()
+        tour = _Tour(strokes)
+        before = tour.length()
+        iterations = 0
+
+        def outOfBudget():
+            if maxIterations is not None and iterations >= maxIterations:
+                return True
+            return (
+                timeLimit is not None and time.perf_counter() - startTime >= timeLimit
+            )
+
+        improved = tour.n > 2
+        while improved and not outOfBudget():
+            improved = False
+            for i in range(tour.n - 1):
+                if outOfBudget():
+                    break
+                if allowReverse and tour.twoOpt(i):
+                    iterations += 1
+                    improved = True
+                for segLength in (1, 2, 3):
+                    if outOfBudget():
+                        break
+                    if tour.orOpt(i + 1, segLength, allowReverse):
+                        iterations += 1
+                        improved = True
+
+        report = {
+            "travelBefore": before,
+            "travelAfter": tour.length(),
+            "iterations": iterations,
+            "seconds": time.perf_counter() - startTime,
         }
-        self.potSpacing = 30  # space between pot centers in mm
-        self.firstPotX = 10  # center of first pot in mm
-        self.firstPotY = 55  # center of pot 1 in mm
-        self.entryHeight = Z_HEIGHT + POT_HEIGHT + 10
-        self.innerHeight = Z_HEIGHT + 2
-        self.moves = []
-        self.color = DEFAULT_COLOR
+        return tour.strokes(strokes), report
+
+
+class _Tour:
+    """stroke order used by Optomise.improveTour, kept as the start and end point of each drawn stroke"""
+
+    EPSILON = 1e-9
+
+    def __init__(self, strokes):
+        self.n = len(strokes)
+        self.order = np.arange(self.n)
+        self.reversed = np.zeros(self.n, dtype=bool)
+        if isinstance(strokes, StrokeSet):
+            self.starts = strokes.starts.astype(np.float64)
+            self.ends = strokes.ends.astype(np.float64)
+        else:
+            self.starts = np.array(
+                [stroke[0][:2] for stroke in strokes], dtype=np.float64
+            ).reshape(-1, 2)
+            self.ends = np.array(
+                [stroke[-1][:2] for stroke in strokes], dtype=np.float64
+            ).reshape(-1, 2)
+        self._updateLinks()
+
+    def _updateLinks(self):
+        # links[p] is the travel from the stroke at position p to the one at p + 1
+        self.links = np.hypot(*(self.starts[1:] - self.ends[:-1]).T)
+
+    def length(self):
+        return float(self.links.sum())
+
+    def twoOpt(self, i):
+        """reverse the best run of strokes starting after position i, returns True if the tour got shorter"""
+        n = self.n
+        if i >= n - 1:
+            return False
+        j = np.arange(i + 1, n)
+        hasNext = j < n - 1
+        nxt = np.minimum(j + 1, n - 1)
+        added = np.hypot(*(self.ends[j] - self.ends[i]).T) + np.where(
+            hasNext, np.hypot(*(self.starts[nxt] - self.starts[i + 1]).T), 0.0
+        )
+        removed = self.links[i] + np.where(
+            hasNext, self.links[np.minimum(j, n - 2)], 0.0
+        )
+        delta = added - removed
+        best = int(np.argmin(delta))
+        if delta[best] >= -self.EPSILON:
+            return False
+        self._reverse(i + 1, int(j[best]) + 1)
+        return True
+
+    def orOpt(self, i, segLength, allowReverse):
+        """move the run of strokes at positions i..i+segLength-1 to where it is cheapest, returns True if the tour got shorter"""
+        n = self.n
+        last = i + segLength - 1
+        if i < 1 or last >= n:
+            return False
+        segStart, segEnd = self.starts[i], self.ends[last]
+        gain = self.links[i - 1]
+        if last < n - 1:
+            gain += self.links[last] - np.hypot(
+                *(self.starts[last + 1] - self.ends[i - 1])
+            )
+
+        # insert between k and k + 1, anywhere except inside or next to the run itself
+        k = np.concatenate([np.arange(0, i - 1), np.arange(last + 1, n)])
+        if len(k) == 0:
+            return False
+        hasNext = k < n - 1
+        nxt = np.minimum(k + 1, n - 1)
+        link = np.where(hasNext, self.links[np.minimum(k, n - 2)], 0.0)
+        forward = np.hypot(*(segStart - self.ends[k]).T) + np.where(
+            hasNext, np.hypot(*(self.starts[nxt] - segEnd).T), 0.0
+        )
+        delta = forward - link - gain
+        reverse = False
+        best = int(np.argmin(delta))
+        if allowReverse:
+            backward = np.hypot(*(segEnd - self.ends[k]).T) + np.where(
+                hasNext, np.hypot(*(self.starts[nxt] - segStart).T), 0.0
+            )
+            deltaReverse = backward - link - gain
+            bestReverse = int(np.argmin(deltaReverse))
+            if deltaReverse[bestReverse] < delta[best] - self.EPSILON:
+                best, reverse, delta = bestReverse, True, deltaReverse
+        if delta[best] >= -self.EPSILON:
+            return False
+        self._move(i, last + 1, int(k[best]), reverse)
+        return True
+
+    def _reverse(self, a, b):
+        # reverse positions a..b-1, drawing each of those strokes the other way
+        self.order[a:b] = self.order[a:b][::-1].copy()
+        self.reversed[a:b] = ~self.reversed[a:b][::-1]
+        starts = self.ends[a:b][::-1].copy()
+        self.ends[a:b] = self.starts[a:b][::-1]
+        self.starts[a:b] = starts
+        self._updateLinks()
+
+    def _move(self, a, b, k, reverse):
+        # move positions a..b-1 so they come straight after position k
+        segment = np.arange(a, b)
+        rest = np.concatenate([np.arange(0, a), np.arange(b, self.n)])
+        insertAt = int(np.searchsorted(rest, k)) + 1
+        if reverse:
+            segment = segment[::-1]
+        positions = np.concatenate([rest[:insertAt], segment, rest[insertAt:]])
+        starts, ends = self.starts[positions], self.ends[positions]
+        self.order = self.order[positions]
+        self.reversed = self.reversed[positions]
+        if reverse:
+            flipped = slice(insertAt, insertAt + len(segment))
+            self.reversed[flipped] = ~self.reversed[flipped]
+            starts[flipped], ends[flipped] = ends[flipped], starts[flipped].copy()
+        self.starts, self.ends = starts, ends
+        self._updateLinks()
+
+    def strokes(self, strokes):
+        if isinstance(strokes, StrokeSet):
+            return strokes.take(self.order, self.reversed)
+        return [
+            strokes[idx][::-1] if flip else strokes[idx]
+            for idx, flip in zip(self.order.tolist(), self.reversed.tolist())
+        ]
+
+
+class ColorPots:
+    def __init__(self, profile=None):
+        self.profile = profile or DEFAULT_PROFILE
+        self.pots = self.profile.pots
+        self.potSpacing = self.profile.potSpacing  # space between pot centers in mm
+        self.firstPotX = self.profile.firstPotX  # center of first pot in mm
+        self.firstPotY = self.profile.firstPotY  # center of pot 1 in mm
+        self.entryHeight = self.profile.potEntryHeight
+        self.innerHeight = self.profile.potInnerHeight
+        self.feedRate = self.profile.feedRate
+        self.moves = MoveBuffer()
+        self.color = self.profile.defaultColor
 
     def _potPos(self, color):
         return (
@@ -386,6 +1244,18 @@ class ColorPots:
             self.firstPotY,
         )
 
+    def getBlock(self, color=None):
+        """
+        The refill moves of getColor as a GcodeBlock, built once per color for each machine profile.
+        """
+        color = color or self.color
+        block = self.profile.cached(
+            ("refill", color),
+            lambda: GcodeBlock(self.getColor(color), name=f"refill {color}"),
+        )
+        self.color = color
+        return block
+
     def getColor(self, color):
         if not color:
             if not self.color:
@@ -396,32 +1266,67 @@ class ColorPots:
             if not color in self.pots:
                 raise Exception("Color not in pot list")
         self.color = color
-        moves = []
+        moves = MoveBuffer()
         x, y = self._potPos(color)
-        moves.append(
-            Move(x, y + 30, self.entryHeight, 0, FEED_RATE, immuneToLimits=True)
+        moves.add(
+            x,
+            y + 30,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_REFILL,
         )  # add 30 to avoid hitting the pot on the way up (as it move diagonally)
-        moves.append(Move(x, y, self.entryHeight, 0, FEED_RATE, immuneToLimits=True))
-        moves.append(Move(x, y, self.innerHeight, 0, FEED_RATE, immuneToLimits=True))
+        moves.add(
+            x,
+            y,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_REFILL,
+        )
+        moves.add(
+            x,
+            y,
+            self.innerHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_REFILL,
+        )
         # stir the brush up and down and around a bit
 
         for xin in [-4, 4, -4, 4]:
             for yin in [-4, 4]:
-                moves.append(
-                    Move(
-                        x + xin,
-                        y + yin,
-                        # self.innerHeight if yin % 2 == 1 else self.innerHeight + 1,
-                        self.innerHeight,
-                        0,
-                        FEED_RATE,
-                        immuneToLimits=True,
-                    )
+                moves.add(
+                    x + xin,
+                    y + yin,
+                    # self.innerHeight if yin % 2 == 1 else self.innerHeight + 1,
+                    self.innerHeight,
+                    0,
+                    self.feedRate,
+                    immuneToLimits=True,
+                    kind=KIND_REFILL,
                 )
         # return to the entry height
-        moves.append(Move(x, y, self.entryHeight, 0, FEED_RATE, immuneToLimits=True))
-        moves.append(
-            Move(x, y + 30, self.entryHeight, 0, FEED_RATE, immuneToLimits=True)
+        moves.add(
+            x,
+            y,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_REFILL,
+        )
+        moves.add(
+            x,
+            y + 30,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_REFILL,
         )
         # moves.append(
         #     Pause(x=x, y=y + 30, z=self.entryHeight, e=0, f=FEED_RATE)
@@ -430,45 +1335,53 @@ class ColorPots:
 
 
 class WashCycle:
-    def __init__(self):
-        self.color = DEFAULT_COLOR
-        self.potX = 70
-        self.potY = 55
-        self.dryX = 130
-        self.entryHeight = Z_HEIGHT + POT_HEIGHT + 10
-        self.innerHeight = Z_HEIGHT + 2
+    def __init__(self, profile=None):
+        self.profile = profile or DEFAULT_PROFILE
+        self.color = self.profile.defaultColor
+        self.potX = self.profile.washPotX
+        self.potY = self.profile.washPotY
+        self.dryX = self.profile.dryX
+        self.entryHeight = self.profile.potEntryHeight
+        self.innerHeight = self.profile.potInnerHeight
+        self.feedRate = self.profile.feedRate
+
+    def getBlock(self, cycle="wash"):
+        """
+        One of the cycles ("wash", "washCenterJiggle", "dryCycle") as a GcodeBlock,
+        built once for each machine profile.
+        """
+        return self.profile.cached(
+            ("wash", cycle), lambda: GcodeBlock(getattr(self, cycle)(), name=cycle)
+        )
 
     def washCenterJiggle(self):
-        moves = []
-        moves.append(
-            Move(
-                self.potX,
-                self.potY + 30,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves = MoveBuffer()
+        moves.add(
+            self.potX,
+            self.potY + 30,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )  # add 30 to avoid hitting the pot on the way up (as it move diagonally)
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.potX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.innerHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.potX,
+            self.potY,
+            self.innerHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )
         for i in range(30):
             if i % 2 == 0:
@@ -477,15 +1390,14 @@ class WashCycle:
                         x_move = -0.3
                     else:
                         x_move = 0.3
-                    moves.append(
-                        Move(
-                            self.potX + x_move,
-                            self.potY,
-                            self.innerHeight,
-                            0,
-                            FEED_RATE,
-                            immuneToLimits=True,
-                        )
+                    moves.add(
+                        self.potX + x_move,
+                        self.potY,
+                        self.innerHeight,
+                        0,
+                        self.feedRate,
+                        immuneToLimits=True,
+                        kind=KIND_WASH,
                     )
             else:
                 for y in range(100):
@@ -493,124 +1405,114 @@ class WashCycle:
                         y_move = -0.3
                     else:
                         y_move = 0.3
-                    moves.append(
-                        Move(
-                            self.potX,
-                            self.potY + y_move,
-                            self.innerHeight,
-                            0,
-                            FEED_RATE,
-                            immuneToLimits=True,
-                        )
-                    )
-            if i % 10 == 0:
-
-                moves.append(
-                    Move(
+                    moves.add(
                         self.potX,
-                        self.potY,
-                        self.innerHeight + 20,
+                        self.potY + y_move,
+                        self.innerHeight,
                         0,
-                        FEED_RATE,
+                        self.feedRate,
                         immuneToLimits=True,
+                        kind=KIND_WASH,
                     )
+            if i % 10 == 0:
+
+                moves.add(
+                    self.potX,
+                    self.potY,
+                    self.innerHeight + 20,
+                    0,
+                    self.feedRate,
+                    immuneToLimits=True,
+                    kind=KIND_WASH,
                 )
         moves.extend(self.dryCycle())
         return moves
 
     def dryCycle(self):
-        moves = []
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-                rapid=True,
-            )
+        moves = MoveBuffer()
+        moves.add(
+            self.potX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            rapid=True,
+            kind=KIND_WASH,
         )
         # move to the drying area
-        moves.append(
-            Move(
-                self.dryX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.dryX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )
-        for y in range(self.potY - 10, self.potY + 10, 4):
+        for y in np.arange(self.potY - 10, self.potY + 10, 4).tolist():
             for x in [self.dryX + 20, self.dryX - 20]:
-                moves.append(
-                    Move(
-                        x,
-                        y,
-                        self.innerHeight - 1,
-                        0,
-                        FEED_RATE,
-                        immuneToLimits=True,
-                        rapid=True,
-                    )
+                moves.add(
+                    x,
+                    y,
+                    self.innerHeight - 1,
+                    0,
+                    self.feedRate,
+                    immuneToLimits=True,
+                    rapid=True,
+                    kind=KIND_WASH,
                 )
                 # move the brush up a bit so you dont mash it so much
-                moves.append(
-                    Move(
-                        x,
-                        y,
-                        self.innerHeight,
-                        0,
-                        FEED_RATE,
-                        immuneToLimits=True,
-                    )
+                moves.add(
+                    x,
+                    y,
+                    self.innerHeight,
+                    0,
+                    self.feedRate,
+                    immuneToLimits=True,
+                    kind=KIND_WASH,
                 )
-        moves.append(
-            Move(
-                self.dryX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-                rapid=True,
-            )
+        moves.add(
+            self.dryX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            rapid=True,
+            kind=KIND_WASH,
         )
         return moves
 
     def wash(self):
-        moves = []
+        moves = MoveBuffer()
 
-        moves.append(
-            Move(
-                self.potX,
-                self.potY + 30,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.potX,
+            self.potY + 30,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )  # add 30 to avoid hitting the pot on the way up (as it move diagonally)
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.potX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.innerHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.potX,
+            self.potY,
+            self.innerHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )
         # find the coordinates for a path along the diameter of a circle radius = 7
         # the circle is centered at (x,y) = (self.potX, self.potY)
@@ -624,119 +1526,136 @@ class WashCycle:
         for x, y in coords:
             i += 1
             prevZ = self.innerHeight - 2 if i % 2 == 0 else self.innerHeight - 1
-            moves.append(
-                Move(
-                    x,
-                    y,
-                    prevZ,
-                    0,
-                    FEED_RATE,
-                    immuneToLimits=True,
-                    rapid=True,
-                )
-            )
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.innerHeight + 0.25 * (self.entryHeight - self.innerHeight),
+            moves.add(
+                x,
+                y,
+                prevZ,
                 0,
-                FEED_RATE,
+                self.feedRate,
                 immuneToLimits=True,
                 rapid=True,
+                kind=KIND_WASH,
             )
+        moves.add(
+            self.potX,
+            self.potY,
+            self.innerHeight + 0.25 * (self.entryHeight - self.innerHeight),
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            rapid=True,
+            kind=KIND_WASH,
         )
         # shake the brush in the x axis rapidly
 
         for i in range(100):
-            moves.append(
-                Move(
+            moves.add(
+                self.potX + 0.2 if i % 2 == 0 else self.potX - 0.2,
+                self.potY,
+                self.innerHeight,
+                0,
+                self.feedRate,
+                immuneToLimits=True,
+                rapid=True,
+                kind=KIND_WASH,
+            )
+            if i % 5 == 0:
+                moves.add(
                     self.potX + 0.2 if i % 2 == 0 else self.potX - 0.2,
                     self.potY,
-                    self.innerHeight,
+                    self.innerHeight - 2,
                     0,
-                    FEED_RATE,
+                    self.feedRate,
                     immuneToLimits=True,
                     rapid=True,
-                )
-            )
-            if i % 5 == 0:
-                moves.append(
-                    Move(
-                        self.potX + 0.2 if i % 2 == 0 else self.potX - 0.2,
-                        self.potY,
-                        self.innerHeight - 2,
-                        0,
-                        FEED_RATE,
-                        immuneToLimits=True,
-                        rapid=True,
-                    )
+                    kind=KIND_WASH,
                 )
 
         # return to the entry height
-        moves.append(
-            Move(
-                self.potX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-                rapid=True,
-            )
+        moves.add(
+            self.potX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            rapid=True,
+            kind=KIND_WASH,
         )
         # move to the drying area
-        moves.append(
-            Move(
-                self.dryX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-            )
+        moves.add(
+            self.dryX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            kind=KIND_WASH,
         )
-        for y in range(self.potY - 10, self.potY + 10):
+        for y in np.arange(self.potY - 10, self.potY + 10).tolist():
             for x in [self.dryX + 20, self.dryX - 20]:
-                moves.append(
-                    Move(
-                        x,
-                        y,
-                        self.innerHeight - 1,
-                        0,
-                        FEED_RATE,
-                        immuneToLimits=True,
-                        rapid=True,
-                    )
+                moves.add(
+                    x,
+                    y,
+                    self.innerHeight - 1,
+                    0,
+                    self.feedRate,
+                    immuneToLimits=True,
+                    rapid=True,
+                    kind=KIND_WASH,
                 )
                 # move the brush up a bit so you dont mash it so much
-                moves.append(
-                    Move(
-                        x,
-                        y,
-                        self.innerHeight,
-                        0,
-                        FEED_RATE,
-                        immuneToLimits=True,
-                    )
+                moves.add(
+                    x,
+                    y,
+                    self.innerHeight,
+                    0,
+                    self.feedRate,
+                    immuneToLimits=True,
+                    kind=KIND_WASH,
                 )
         # return to the entry height
-        moves.append(
-            Move(
-                self.dryX,
-                self.potY,
-                self.entryHeight,
-                0,
-                FEED_RATE,
-                immuneToLimits=True,
-                rapid=True,
-            )
+        moves.add(
+            self.dryX,
+            self.potY,
+            self.entryHeight,
+            0,
+            self.feedRate,
+            immuneToLimits=True,
+            rapid=True,
+            kind=KIND_WASH,
         )
         return moves
 
 
 # TODO:
-# Add length finder for path
 # styling for the pressure of brush
-# listener for bluetooth connection
 # brush changes
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python3 maker.py [image, strokes .json or .toolpath] [output file]
+    # a .toolpath output keeps the planned moves, a .toolpath input is written out as is
+    source = Path(
+        sys.argv[1] if len(sys.argv) > 1 else ROOT / "imageProcess" / "stickman_me.png"
+    )
+    output = Path(sys.argv[2] if len(sys.argv) > 2 else ROOT / "test.txt")
+    if source.suffix == toolpath.SUFFIX:
+        maker, moves = Maker.load(source)
+    else:
+        if source.suffix == ".json":
+            import json
+
+            with open(source) as r:
+                source = json.load(r)
+        preparer = Preparer(source)
+        moves = preparer.make()
+        maker = Maker(profile=preparer.profile)
+    if output.suffix == toolpath.SUFFIX:
+        maker.save(output, moves)
+    else:
+        with open(output, "w") as w:
+            maker.writeTo(w, moves)
+    print("DONE")
@@ -0,0 +1,503 @@
+import collections
+import math
+import os
+import re
+import select
+import threading
+import time
+import tty
+
+import instrument
+
+RX_BUFFER_SIZE = 128  # (bytes) Marlin's serial receive buffer
+BUFSIZE = 4  # Marlin's command queue, lines read but not executed yet
+BLOCK_BUFFER_SIZE = 16  # Marlin's planner, moves queued for the steppers
+OK_TIMEOUT = (
+    10  # (s) with no reply for this long the lines still waiting are sent again
+)
+RESEND_SETTLE = 0.1  # (s) quiet time after a resend before the lines are sent again
+HANDSHAKE_TRIES = 5
+
+_WORD = re.compile(r"([A-Z])(-?[\d.]+)")
+
+
+def checksum(text):
+    """Marlin's line checksum, the xor of every byte"""
+    value = 0
+    for byte in text.encode():
+        value ^= byte
+    return value
+
+
+def numbered(number, command):
+    """the line as it goes over the wire: line number, command and checksum"""
+    text = f"N{number} {command}"
+    return f"{text}*{checksum(text)}\n".encode()
+
+
+def openPort(device, baudrate=115200, timeout=0.01):
+    """open a serial port (or a pty) with pyserial, which is only needed for sending"""
+    import serial
+
+    return serial.Serial(device, baudrate=baudrate, timeout=timeout)
+
+
+class SenderError(Exception):
+    """raised when the controller stops answering"""
+
+
+class Sender:
+    def __init__(
+        self,
+        port,
+        rxBufferSize=RX_BUFFER_SIZE,
+        plannerSize=BLOCK_BUFFER_SIZE,
+        timeout=OK_TIMEOUT,
+        settle=RESEND_SETTLE,
+    ):
+        """
+        Stream G-code to a Marlin style controller with character counting flow control.
+
+        Rather than waiting for the "ok" of every line, lines are sent as long as all
+        of the ones not acknowledged yet fit in the controller's receive buffer, so the
+        next commands are already there when the planner takes a move. That keeps the
+        planner full through dense contours of tiny moves, where ping pong sending
+        can't keep up. Every line gets a line number and checksum, a "Resend: N" rewinds
+        to line N, and lines that get no reply within timeout are sent again.
+
+        Marlin empties its receive buffer whenever it asks for a resend, and every line
+        that was already on its way gets rejected with another resend. So after a
+        resend nothing is sent until those have all been rejected, or settle seconds
+        have gone by without a reply (the rest were thrown away), otherwise the lines
+        sent again could be thrown away with them.
+
+        If the controller has ADVANCED_OK ("ok N.. P.. B.."), the free planner blocks it
+        reports are used to count the times the planner ran dry mid job.
+
+        Parameters
+        ----------
+        port: serial.Serial|file like
+            anything with write(bytes), read(size) that returns b"" on a (short) timeout,
+            and in_waiting, e.g. openPort()
+        rxBufferSize: int
+            (bytes) the controller's receive buffer, RX_BUFFER_SIZE in Marlin's config
+        plannerSize: int
+            the controller's planner blocks, BLOCK_BUFFER_SIZE in Marlin's config
+        timeout: float
+            (s) how long to wait for a reply before sending the waiting lines again,
+            anything the controller says counts (Marlin's "busy:" keepalives during M0
+            or homing)
+        settle: float
+            (s) see above
+        """
+        self.port = port
+        self.rxBufferSize = rxBufferSize
+        self.plannerSize = plannerSize
+        self.timeout = timeout
+        self.settle = settle
+        self._received = b""
+        self._reset()
+
+    def _reset(self):
+        self.history = {}  # line number -> bytes sent, kept until acknowledged
+        self.inFlight = collections.deque()  # line numbers sent and not acknowledged
+        self.inFlightBytes = 0
+        self.nextNumber = 1  # the next line number to send
+        self.lastNumber = 0  # the last line number handed out
+        self.skipOk = False  # the next plain "ok" belongs to a rejected line
+        # sizes of lines sent before a resend, they can still be in the controller's
+        # buffer so they count against it until they're rejected or a resent line is done
+        self.ghosts = collections.deque()
+        self.rewoundTo = None
+        self.free = None  # free planner blocks from the last ADVANCED_OK reply
+        self.report = {
+            "lines": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+            "linesPerSecond": 0.0,
+            "resends": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "starvations": None,
+            "maxInFlightBytes": 0,
+        }
+
+    def _readLines(self, wait):
+        # replies that have arrived, waiting up to the port's timeout if wait is set
+        waiting = getattr(self.port, "in_waiting", 0)
+        if waiting or wait:
+            self._received += self.port.read(waiting or 1)
+        *lines, self._received = self._received.split(b"\n")
+        return [line.decode(errors="replace").strip() for line in lines]
+
+    def _write(self, number):
+        data = self.history[number]
+        self.port.write(data)
+        self.inFlight.append(number)
+        self.inFlightBytes += len(data)
+        self.report["bytes"] += len(data)
+        self.report["maxInFlightBytes"] = max(
+            self.report["maxInFlightBytes"], self.inFlightBytes
+        )
+
+    def _acknowledge(self):
+        number = self.inFlight.popleft()
+        data = self.history.pop(number)
+        self.inFlightBytes -= len(data)
+        if self.ghosts and number >= self.rewoundTo:
+            # the resent lines are through, so whatever was sent before them is too
+            self._releaseGhosts()
+        return data
+
+    def _releaseGhosts(self):
+        self.inFlightBytes -= sum(self.ghosts)
+        self.ghosts.clear()
+
+    def _rewind(self, number):
+        # send everything from line number again, the controller has dropped it
+        while self.inFlight and self.inFlight[-1] >= number:
+            dropped = self.inFlight.pop()
+            if dropped > number:
+                self.ghosts.appendleft(len(self.history[dropped]))
+            else:
+                self.inFlightBytes -= len(self.history[dropped])
+        self.nextNumber = number
+        self.rewoundTo = number
+        self.report["resends"] += 1
+
+    def _handle(self, line):
+        # the line a reply acknowledged, or None
+        if line.startswith("ok"):
+            if self.skipOk:
+                self.skipOk = False
+                return None
+            if not self.inFlight:
+                return None
+            words = dict(_WORD.findall(line[2:]))
+            self.free = int(float(words["P"])) if "P" in words else None
+            return self._acknowledge()
+        if line.startswith(("Resend:", "rs ")):
+            number = int(re.findall(r"\d+", line)[0])
+            self.skipOk = True
+            if number == self.rewoundTo and self.ghosts:
+                # a line that was already on its way when we rewound, rejected too
+                self.inFlightBytes -= self.ghosts.popleft()
+                return None
+            self._rewind(number)
+            return None
+        if line.startswith("Error"):
+            self.report["errors"] += 1
+        return None
+
+    def handshake(self):
+        """reset the controller's line numbers (M110), retrying while it boots"""
+        self._reset()
+        for _ in range(HANDSHAKE_TRIES):
+            self.inFlight.clear()
+            self.inFlightBytes = 0
+            self.history[0] = numbered(0, "M110 N0")
+            self._write(0)
+            if self._handshakeReply():
+                self._acknowledge()
+                return
+        raise SenderError("no reply from the controller")
+
+    def _handshakeReply(self):
+        # True once the M110 is acknowledged, False if it was rejected or nothing came back
+        rejected = False
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            for line in self._readLines(wait=True):
+                if line.startswith(("Error", "Resend:", "rs ")):
+                    rejected = True
+                elif line.startswith("ok"):
+                    return not rejected
+        return False
+
+    def stream(self, lines):
+        """
+        Send every G-code line (comments and blank lines are left out) and wait until
+        the controller has acknowledged all of them.
+
+        Returns
+        -------
+        dict
+            lines, bytes (sent, with resends), seconds, linesPerSecond, resends, errors,
+            timeouts, starvations (None without ADVANCED_OK) and maxInFlightBytes
+        """
+        self.handshake()
+        report = self.report
+        commands = (line.split(";")[0].strip() for line in lines)
+        commands = (command for command in commands if command)
+        exhausted = False
+        start = time.monotonic()
+        lastReply = start
+        while True:
+            # send while the unacknowledged lines fit in the receive buffer
+            while not self.ghosts:
+                if self.nextNumber > self.lastNumber:
+                    if exhausted:
+                        break
+                    command = next(commands, None)
+                    if command is None:
+                        exhausted = True
+                        break
+                    self.lastNumber += 1
+                    self.history[self.lastNumber] = numbered(self.lastNumber, command)
+                data = self.history[self.nextNumber]
+                if self.inFlight and self.inFlightBytes + len(data) > self.rxBufferSize:
+                    break
+                self._write(self.nextNumber)
+                self.nextNumber += 1
+            if exhausted and not self.inFlight and self.nextNumber > self.lastNumber:
+                break
+
+            replies = self._readLines(wait=True)
+            if replies:
+                lastReply = time.monotonic()
+            for reply in replies:
+                data = self._handle(reply)
+                if data is None:
+                    continue
+                report["lines"] += 1
+                if self.free is None:
+                    continue
+                # a move that found the planner empty: the machine had stopped for it
+                report["starvations"] = report["starvations"] or 0
+                if (
+                    self.free >= self.plannerSize - 1
+                    and data.split(b" ", 2)[1] in (b"G0", b"G1")
+                    and report["lines"] > self.plannerSize
+                    and not exhausted
+                ):
+                    report["starvations"] += 1
+            quiet = time.monotonic() - lastReply
+            if self.ghosts and quiet > self.settle:
+                self._releaseGhosts()
+            if self.inFlight and quiet > self.timeout:
+                # nothing came back, assume everything waiting was lost
+                report["timeouts"] += 1
+                self._releaseGhosts()
+                self._rewind(self.inFlight[0])
+                lastReply = time.monotonic()
+
+        report["seconds"] = time.monotonic() - start
+        report["linesPerSecond"] = report["lines"] / max(report["seconds"], 1e-9)
+        instrument.record("Sender.stream", report["seconds"])
+        for name in ("lines", "bytes", "resends", "timeouts"):
+            instrument.count("sender." + name, report[name])
+        if report["starvations"] is not None:
+            instrument.count("sender.starvations", report["starvations"])
+        return report
+
+    def streamMoves(self, moves, maker=None):
+        """stream the program Maker (a plain one if None) writes for moves"""
+        from maker import Maker
+
+        maker = maker or Maker()
+        return self.stream(maker.iterLines(moves))
+
+
+class FakeMarlin:
+    def __init__(
+        self,
+        rxBufferSize=RX_BUFFER_SIZE,
+        bufsize=BUFSIZE,
+        plannerSize=BLOCK_BUFFER_SIZE,
+        baudrate=115200,
+        latency=0.002,
+        timeScale=0.01,
+        errorEvery=None,
+    ):
+        """
+        A Marlin stand in on a pseudo terminal, to try the sender without a machine.
+
+        Open .device like a serial port. Bytes arrive at the baud rate into a receive
+        buffer of rxBufferSize bytes (anything more is lost, like a UART overrun),
+        whole lines move into a command queue of bufsize lines, and each command is
+        answered "ok N.. P.. B.." (ADVANCED_OK) once it has run, the replies take latency
+        seconds to get back (the controller's main loop and the USB adapter). G0 / G1 take a planner
+        block, the blocks are used up in real time times timeScale, so a move waits for
+        a free block as it would on the machine. Bad checksums and line numbers get an
+        Error and a Resend, errorEvery corrupts every n'th line once to try that out.
+
+        report has the lines run, resends, overruns (lost bytes) and starvations, the
+        times the planner ran empty and then got another move. executed lists every
+        command run, in order.
+        """
+        self.rxBufferSize = rxBufferSize
+        self.bufsize = bufsize
+        self.plannerSize = plannerSize
+        self.baudrate = baudrate
+        self.latency = latency
+        self.timeScale = timeScale
+        self.errorEvery = errorEvery
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        self.report = {"lines": 0, "resends": 0, "overruns": 0, "starvations": 0}
+        self.executed = []
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _send(self, text):
+        self._replies.append((time.monotonic() + self.latency, text + "\n"))
+
+    def _run(self):
+        self._replies = collections.deque()  # (when it gets to the sender, text)
+        wire = collections.deque()  # (arrival time, bytes) still on the wire
+        arrival = 0.0
+        rx = bytearray()
+        commands = collections.deque()  # (line number, command)
+        planner = collections.deque()  # seconds of each queued move
+        busyUntil = None  # when the move being run finishes
+        lastN = 0
+        corrupted = set()
+        position = {"X": 0.0, "Y": 0.0, "Z": 0.0}
+        feed = 1200.0
+        ranMoves = False
+
+        while self._running:
+            now = time.monotonic()
+            wakeups = [arrival] if wire else []
+            if self._replies:
+                wakeups.append(self._replies[0][0])
+            if busyUntil is not None:
+                wakeups.append(busyUntil)
+            wait = min([0.01] + [max(wake - now, 0) for wake in wakeups])
+            readable, _, _ = select.select([self.master], [], [], wait)
+            now = time.monotonic()
+            if readable:
+                data = os.read(self.master, 4096)
+                arrival = max(now, arrival) + len(data) * 10 / self.baudrate
+                wire.append((arrival, data))
+
+            replies = []
+            while self._replies and self._replies[0][0] <= now:
+                replies.append(self._replies.popleft()[1])
+            if replies:
+                os.write(self.master, "".join(replies).encode())
+
+            # bytes that have come in over the wire
+            while wire and wire[0][0] <= now:
+                data = wire.popleft()[1]
+                room = self.rxBufferSize - len(rx)
+                rx += data[:room]
+                self.report["overruns"] += max(len(data) - room, 0)
+
+            # whole lines into the command queue
+            while len(commands) < self.bufsize and b"\n" in rx:
+                line, _, rest = bytes(rx).partition(b"\n")
+                rx[:] = rest
+                text = line.decode(errors="replace").strip()
+                if not text:
+                    continue
+                number, command, error = self._parse(text, lastN, corrupted)
+                if error:
+                    self._send(f"Error:{error}, Last Line: {lastN}")
+                    rx.clear()  # Marlin empties the receive buffer
+                    self._send(f"Resend: {lastN + 1}")
+                    self._send("ok")
+                    self.report["resends"] += 1
+                    continue
+                if number is not None:
+                    lastN = number
+                commands.append((lastN, command))
+
+            # the planner runs its moves
+            while busyUntil is not None and busyUntil <= now:
+                planner.popleft()
+                busyUntil = busyUntil + planner[0] if planner else None
+
+            # run commands, a move needs a free planner block
+            while commands:
+                number, command = commands[0]
+                if command.split(" ", 1)[0] in ("G0", "G1"):
+                    if len(planner) >= self.plannerSize:
+                        break
+                    words = dict(_WORD.findall(command[2:]))
+                    feed = float(words.get("F", feed))
+                    distance = math.sqrt(
+                        sum(
+                            (float(words[axis]) - position[axis]) ** 2
+                            for axis in position
+                            if axis in words
+                        )
+                    )
+                    for axis in position:
+                        if axis in words:
+                            position[axis] = float(words[axis])
+                    seconds = distance / (feed / 60) * self.timeScale
+                    if not planner:
+                        if ranMoves:
+                            self.report["starvations"] += 1
+                        busyUntil = now + seconds
+                    planner.append(seconds)
+                    ranMoves = True
+                commands.popleft()
+                self.executed.append(command)
+                self.report["lines"] += 1
+                self._send(
+                    f"ok N{number} P{self.plannerSize - len(planner)}"
+                    f" B{self.bufsize - len(commands)}"
+                )
+
+    def _parse(self, text, lastN, corrupted):
+        # (line number or None, command, error or None), like Marlin's serial reader
+        if not text.startswith("N"):
+            return None, text, None
+        body, _, given = text.partition("*")
+        number = int(body[1:].split(" ", 1)[0])
+        command = body.split(" ", 1)[1] if " " in body else ""
+        if (
+            self.errorEvery
+            and number % self.errorEvery == 0
+            and number not in corrupted
+        ):
+            corrupted.add(number)
+            given = str((checksum(body) + 1) % 256)
+        if not given or int(given) != checksum(body):
+            return number, command, "checksum mismatch"
+        if number != lastN + 1 and not command.startswith("M110"):
+            return number, command, "Line Number is not Last Line Number+1"
+        if command.startswith("M110"):
+            words = dict(_WORD.findall(command[4:]))
+            number = int(float(words.get("N", number)))
+        return number, command, None
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    # python3 sender.py program.gcode (device [baudrate] | --fake)
+    program = sys.argv[1]
+    with open(program) as r:
+        lines = r.read().splitlines()
+    if len(sys.argv) < 3 or sys.argv[2] == "--fake":
+        with FakeMarlin() as marlin:
+            report = Sender(openPort(marlin.device)).stream(lines)
+            report["controller"] = marlin.report
+    else:
+        baudrate = int(sys.argv[3]) if len(sys.argv) > 3 else 115200
+        report = Sender(openPort(sys.argv[2], baudrate)).stream(lines)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,129 @@
+import math
+import numpy as np
+
+
+class StrokeIndex:
+    """
+    kd-tree over stroke endpoints, used to find the next stroke to draw.
+
+    Every stroke is indexed by its start point and, if ends are given, by its end
+    point as well (meaning the stroke would be drawn in reverse). Strokes can be
+    removed once they have been drawn, the tree is rebuilt over what is left once
+    half of its points are gone.
+
+    Parameters
+    ----------
+    starts: array like (n, 2)
+        first point of every stroke
+    ends: array like (n, 2) | None
+        last point of every stroke, only needed if strokes may be reversed
+    """
+
+    FIRST_K = 8  # neighbours asked for first, grows while they're all removed ones
+
+    def __init__(self, starts, ends=None):
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        self.count = len(starts)
+        if ends is not None:
+            ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+            points = np.concatenate([starts, ends])
+        else:
+            points = starts
+        self.reversible = ends is not None
+
+        # entry id = stroke index for starts, stroke index + count for ends. the tree
+        # holds every distinct point once (hatching and pixel contours share a lot of
+        # them) with its entries in tie break order, lowest stroke index then forwards
+        entries = np.arange(len(points))
+        unique, where = np.unique(points, axis=0, return_inverse=True)
+        where = where.reshape(-1)
+        order = np.lexsort((entries >= self.count, entries % max(self.count, 1), where))
+        bounds = np.flatnonzero(np.diff(where[order])) + 1
+        self.pointArray = unique
+        self.points = unique.tolist()
+        self.pointEntries = [part.tolist() for part in np.split(order, bounds)]
+        self.pointFirst = [0] * len(unique)
+        self.pointLeft = np.bincount(where, minlength=len(unique))
+        self.entryPoint = where.tolist()
+        self.entryAlive = np.ones(len(points), dtype=bool)
+        self.alive = len(starts)
+        self._build()
+
+    def _build(self):
+        # scipy is only imported once strokes actually need sorting
+        from scipy.spatial import cKDTree
+
+        self.treePoints = np.flatnonzero(self.pointLeft)
+        self.tree = cKDTree(self.pointArray[self.treePoints]) if self.alive else None
+        self.treeDead = 0
+
+    def __len__(self):
+        return self.alive
+
+    def remove(self, idx):
+        """remove a stroke (both of its endpoints) from the index"""
+        entries = [idx, idx + self.count] if self.reversible else [idx]
+        for entry in entries:
+            self.entryAlive[entry] = False
+            point = self.entryPoint[entry]
+            self.pointLeft[point] -= 1
+            if not self.pointLeft[point]:
+                self.treeDead += 1
+        self.alive -= 1
+        if self.treeDead * 2 > len(self.treePoints):
+            self._build()
+
+    def _firstEntry(self, point):
+        # lowest remaining entry of a point, skipping past the removed ones for good
+        entries = self.pointEntries[point]
+        first = self.pointFirst[point]
+        while not self.entryAlive[entries[first]]:
+            first += 1
+        self.pointFirst[point] = first
+        return entries[first]
+
+    def nearest(self, x, y):
+        """
+        Find the closest remaining stroke to the point (x, y).
+
+        Ties go to the lowest stroke index, then to drawing it forwards, the same
+        order a scan over every remaining stroke gives.
+
+        Returns
+        -------
+        (index, reversed, distance) or None if the index is empty
+        """
+        if self.alive == 0:
+            return None
+        size = len(self.treePoints)
+        k = self.FIRST_K
+        while True:
+            k = min(k, size)
+            dist, found = self.tree.query((x, y), k=k)
+            dist, found = np.atleast_1d(dist), np.atleast_1d(found)
+            alive = self.pointLeft[self.treePoints[found]] > 0
+            if alive.any():
+                break
+            k *= 4
+        # the tree's distances can be an ulp off the ones below, so gather everything
+        # about as close and pick from those
+        reach = float(dist[alive.argmax()]) * (1 + 1e-9) + 1e-9
+        if k == size or dist[-1] > reach:
+            candidates = found[dist <= reach]
+        else:
+            candidates = self.tree.query_ball_point((x, y), reach)
+        count = self.count
+        best = None
+        for point in self.treePoints[candidates].tolist():
+            if not self.pointLeft[point]:
+                continue
+            px, py = self.points[point]
+            dist = math.sqrt((px - x) ** 2 + (py - y) ** 2)
+            entry = self._firstEntry(point)
+            candidate = (
+                (dist, entry, False) if entry < count else (dist, entry - count, True)
+            )
+            if best is None or candidate < best:
+                best = candidate
+        dist, idx, reverse = best
+        return idx, reverse, dist
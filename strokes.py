@@ -0,0 +1,222 @@
+import numpy as np
+
+CORNER_ANGLE = np.pi / 3  # (rad) turns sharper than this between long segments are kept
+
+
+class StrokeSet:
+    """
+    Ragged set of strokes kept in one flat (n, 2) point array.
+
+    Stroke i is points[offsets[i]:offsets[i + 1]], indexing or iterating gives
+    (length, 2) views into the flat array so nothing is copied or boxed per point.
+
+    Parameters
+    ----------
+    points: array like (n, 2)
+        every point of every stroke, one stroke after another
+    offsets: array like (count + 1,)
+        where each stroke starts in points, the last value is len(points)
+    ids: array like (count,)|None
+        a label for every stroke that stays with it through take(), 0..count-1 if None
+    """
+
+    def __init__(self, points, offsets, ids=None):
+        self.points = np.asarray(points).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if len(self.offsets) == 0 or self.offsets[-1] != len(self.points):
+            raise ValueError("offsets don't match the number of points")
+        self.ids = np.arange(len(self.offsets) - 1) if ids is None else np.asarray(ids)
+        if len(self.ids) != len(self.offsets) - 1:
+            raise ValueError("ids don't match the number of strokes")
+
+    @classmethod
+    def fromContours(cls, contours):
+        """
+        Build from the list of (n, 1, 2) arrays cv2.findContours returns.
+
+        The contours are copied once into the flat array, with no per point work.
+        """
+        lengths = [len(contour) for contour in contours]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if not contours:
+            return cls(np.zeros((0, 2), dtype=np.int32), offsets)
+        points = np.concatenate([np.reshape(contour, (-1, 2)) for contour in contours])
+        return cls(points, offsets)
+
+    @classmethod
+    def fromList(cls, strokes):
+        """Build from [[[x,y],[x,y]],[[x,y],[x,y]]], extra values per point are dropped."""
+        arrays = [np.asarray(stroke) for stroke in strokes]
+        for array in arrays:
+            if array.ndim != 2 or array.shape[1] < 2:
+                raise ValueError("strokes must be lists of [x, y] points")
+        return cls.fromContours([array[:, :2] for array in arrays])
+
+    @classmethod
+    def fromArray(cls, array):
+        """Build from a (count, length, 2) array of equal length strokes without copying."""
+        count, length = array.shape[:2]
+        return cls(array.reshape(-1, 2), np.arange(count + 1) * length)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(np.arange(len(self))[i])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("stroke index out of range")
+        return self.points[self.offsets[i] : self.offsets[i + 1]]
+
+    def __iter__(self):
+        points = self.points
+        bounds = self.offsets.tolist()
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield points[start:end]
+
+    @property
+    def lengths(self):
+        """number of points in each stroke"""
+        return np.diff(self.offsets)
+
+    @property
+    def starts(self):
+        """(count, 2) first point of every stroke"""
+        return self.points[self.offsets[:-1]]
+
+    @property
+    def ends(self):
+        """(count, 2) last point of every stroke"""
+        return self.points[self.offsets[1:] - 1]
+
+    def take(self, order, reversed=None):
+        """
+        New set with the strokes in the given order, in one gather.
+
+        Parameters
+        ----------
+        order: array like of int
+            stroke indices to keep, in their new order
+        reversed: array like of bool | None
+            per entry of order, draw that stroke from its last point to its first
+        """
+        order = np.asarray(order, dtype=np.int64)
+        lengths = self.lengths[order]
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # position of every output point within its stroke
+        within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+        if reversed is not None:
+            flip = np.repeat(np.asarray(reversed, dtype=bool), lengths)
+            within = np.where(flip, np.repeat(lengths, lengths) - 1 - within, within)
+        source = np.repeat(self.offsets[:-1][order], lengths) + within
+        return StrokeSet(self.points[source], offsets, self.ids[order])
+
+    def tolist(self):
+        return [stroke.tolist() for stroke in self]
+
+    def resample(self, spacing, tolerance, minSpacing=0.0):
+        """
+        New set with the points spread evenly along each stroke, closer where it curves.
+
+        The gap between points is the chord that stays within tolerance of a circle with
+        the stroke's curvature (sqrt(8 * tolerance / curvature)), kept between minSpacing
+        and spacing. Curvature is the turning over about spacing of arc length, so pixel
+        staircases count as the line they follow. The ends of every stroke are kept, so
+        are corners: turns sharper than CORNER_ANGLE between segments at least
+        2 * minSpacing long. All of the strokes are done at once on the flat point array.
+
+        Parameters
+        ----------
+        spacing: float
+            largest gap between points, in the units of the points
+        tolerance: float
+            how far the new points may cut inside a curve
+        minSpacing: float
+            smallest gap between points
+        """
+        lengths = self.lengths
+        strokeOf = np.repeat(np.arange(len(self)), lengths)
+        isStart = np.zeros(len(self.points), dtype=bool)
+        isStart[self.offsets[:-1][lengths > 0]] = True
+        # repeated points have no direction, drop them
+        points = self.points.astype(np.float64)
+        keep = isStart.copy()
+        keep[1:] |= (points[1:] != points[:-1]).any(axis=1)
+        points, strokeOf, isStart = points[keep], strokeOf[keep], isStart[keep]
+        if len(points) == 0:
+            return StrokeSet(points, self.offsets * 0, self.ids)
+        lengths = np.bincount(strokeOf, minlength=len(self))
+        isEnd = np.append(isStart[1:], True)
+
+        # segment j joins point j to j + 1, the ones between strokes don't count
+        delta = np.diff(points, axis=0)
+        length = np.hypot(delta[:, 0], delta[:, 1])
+        inside = ~isStart[1:]
+        turn = np.zeros(len(points))
+        turn[1:-1] = np.diff(np.arctan2(delta[:, 1], delta[:, 0]))
+        turn = (turn + np.pi) % (2 * np.pi) - np.pi
+        turn[isStart | isEnd] = 0.0
+
+        # curvature at every point from the turning within spacing / 2 of it along
+        # its own stroke
+        arc = np.concatenate([[0.0], np.cumsum(np.where(inside, length, 0.0))])
+        strokeStart = np.flatnonzero(isStart)
+        strokeEnd = np.flatnonzero(isEnd)
+        within = np.cumsum(isStart) - 1
+        behind = np.maximum(arc - spacing / 2, arc[strokeStart][within])
+        ahead = np.minimum(arc + spacing / 2, arc[strokeEnd][within])
+        # half of a point's turn goes on the segment before it and half on the one
+        # after, so the last segment of a stroke doesn't look straight
+        turned = np.cumsum(turn) - turn / 2
+        turning = np.abs(np.interp(ahead, arc, turned) - np.interp(behind, arc, turned))
+        curvature = turning / np.maximum(ahead - behind, 1e-300)
+        with np.errstate(divide="ignore"):
+            step = np.sqrt(8 * tolerance / curvature)
+        step = np.clip(step, max(minSpacing, 1e-12), spacing)
+        # a segment is sampled as finely as either of its ends wants
+        cost = np.where(inside, length / np.minimum(step[:-1], step[1:]), 0.0)
+
+        # sections go from a stroke start or corner to the next one and get a whole
+        # number of steps, so every point is a whole number along one parameter for
+        # all of the strokes (with a step of 1 between strokes) and corners land on
+        # points
+        corner = (
+            (np.abs(turn) > CORNER_ANGLE)
+            & (np.append(np.inf, length) >= 2 * minSpacing)
+            & (np.append(length, np.inf) >= 2 * minSpacing)
+        )
+        bound = isStart | corner
+        section = np.cumsum(bound) - 1
+        count = section[-1] + 1
+        sectionCost = np.bincount(section[:-1], weights=cost, minlength=count)
+        steps = np.ceil(sectionCost - 1e-9).astype(np.int64)
+        hasSegments = np.bincount(section[:-1], weights=inside, minlength=count) > 0
+        steps = np.where(hasSegments, np.maximum(steps, 1), 0)
+        gap = np.zeros(count, dtype=np.int64)
+        gap[section[isEnd]] = 1
+        sectionStart = np.concatenate([[0], np.cumsum(steps + gap)[:-1]])
+
+        done = np.concatenate([[0.0], np.cumsum(cost)])
+        done -= done[np.flatnonzero(bound)][section]
+        fraction = done / np.maximum(sectionCost[section], 1e-300)
+        position = sectionStart[section] + fraction * steps[section]
+        # the section ends exactly, not up to rounding
+        position[bound] = sectionStart[section[bound]]
+        position[isEnd] = (sectionStart + steps)[section[isEnd]]
+
+        samples = np.arange(int(position[-1]) + 1, dtype=np.float64)
+        resampled = np.column_stack(
+            [
+                np.interp(samples, position, points[:, 0]),
+                np.interp(samples, position, points[:, 1]),
+            ]
+        )
+        newLengths = np.zeros(len(self), dtype=np.int64)
+        newLengths[lengths > 0] = position[strokeEnd] - position[strokeStart] + 1
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(newLengths, out=offsets[1:])
+        return StrokeSet(resampled, offsets, self.ids)
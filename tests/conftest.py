@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules live at the root of the repo, next to maker.py
+sys.path.insert(0, str(Path(__file__).parent.parent))
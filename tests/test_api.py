@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+import api
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+from maker import Maker, Preparer
+
+STROKES = [[[0, 0], [50, 40], [90, 10]], [[10, 80], [60, 85]]]
+
+
+@pytest.fixture
+def client():
+    api.app.config["TESTING"] = True
+    with api.app.test_client() as client:
+        yield client
+
+
+def finished(client, location):
+    job = api.jobs.get(location.rsplit("/", 1)[1])
+    assert job.wait(30)
+    return client.get(location).get_json()
+
+
+def test_job_is_queued_then_done_and_streams_its_program(client):
+    response = client.post("/jobs", json={"strokes": STROKES})
+    assert response.status_code == 202
+    assert response.get_json()["status"] in (QUEUED, RUNNING, DONE)
+    location = response.headers["Location"]
+    assert finished(client, location)["status"] == DONE
+
+    result = client.get(location + "/result")
+    assert result.status_code == 200
+    assert result.mimetype == "text/plain"
+    assert result.is_streamed
+    assert result.get_data(as_text=True) == Maker().dump(Preparer(STROKES).make())
+
+
+def test_submit_waits_for_the_program(client):
+    response = client.post("/submit", json=STROKES)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["commands"] == Maker().dump(Preparer(STROKES).make())
+    assert data["metrics"]
+
+
+def test_failed_job_returns_its_error(client):
+    response = client.post(
+        "/jobs", json={"strokes": STROKES, "colors": ["mauve", "red"]}
+    )
+    location = response.headers["Location"]
+    info = finished(client, location)
+    assert info["status"] == FAILED
+    result = client.get(location + "/result")
+    assert result.status_code == 422
+    assert "mauve" in result.get_json()["error"]
+    assert (
+        client.post(
+            "/submit", json={"strokes": STROKES, "colors": ["mauve"] * 2}
+        ).status_code
+        == 422
+    )
+
+
+def test_full_queue_asks_to_retry(client, monkeypatch):
+    monkeypatch.setattr(api, "jobs", JobQueue(workers=0, maxQueued=1))
+    assert client.post("/jobs", json=STROKES).status_code == 202
+    response = client.post("/jobs", json=STROKES)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(api.RETRY_AFTER)
+    # a job that hasn't run yet has no result
+    queued = next(iter(api.jobs.jobs))
+    assert client.get(f"/jobs/{queued}/result").status_code == 409
+
+
+@pytest.mark.parametrize("name", ["nope", "../machine"])
+def test_unknown_machine_is_a_bad_request(client, name):
+    response = client.post(f"/jobs?machine={name}", json=STROKES)
+    assert response.status_code == 400
+    assert "unknown machine" in response.get_json()["error"]
+    response = client.post("/jobs", json={"strokes": STROKES, "machine": name})
+    assert response.status_code == 400
+
+
+def test_bad_requests(client):
+    assert client.post("/jobs", json={"strokes": []}).status_code == 400
+    assert client.post("/jobs", data="not json").status_code == 400
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.get("/jobs/nope/result").status_code == 404
+
+
+def test_drawing_edit_only_reformats_the_strokes_it_touched(client):
+    rnd = np.random.default_rng(3)
+    strokes = [
+        np.round(
+            rnd.uniform(0, 500, size=2) + np.cumsum(rnd.normal(0, 8, (10, 2)), axis=0)
+        ).tolist()
+        for _ in range(20)
+    ]
+    strokes += [[[0, 0], [5, 5]], [[495, 495], [500, 500]]]  # the bounds
+    response = client.post("/drawings", json={"strokes": strokes})
+    assert response.status_code == 201
+    location = response.headers["Location"]
+
+    response = client.patch(
+        location, json={"add": [{"stroke": [[250, 250], [260, 262]]}]}
+    )
+    assert response.status_code == 200
+    data = response.get_json()
+    report = data["report"]
+    assert not report["refit"]
+    assert report["reformatted"] <= 6
+    assert set(data["segments"]) == set(map(str, report["repainted"]))
+    assert str(data["added"][0]) in data["segments"]
+
+    program = client.get(location + "/program").get_data(as_text=True)
+    drawing = api.drawings[location.rsplit("/", 1)[1]][1]
+    assert program == api.Maker().dump(drawing.make())
+
+    # growing past the bounds moves the drawing
+    response = client.patch(
+        location, json={"add": [{"stroke": [[600, 600], [610, 600]]}]}
+    )
+    assert response.get_json()["report"]["refit"]
+    assert client.delete(location).status_code in (200, 204)
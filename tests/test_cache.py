@@ -0,0 +1,96 @@
+import os
+
+import cv2
+import numpy as np
+
+from imageProcess.cache import ContourCache
+from imageProcess.processor import ContourFinder, Img
+
+
+def contours(rnd, count):
+    return [
+        rnd.integers(0, 1000, size=(int(rnd.integers(1, 50)), 1, 2)).astype(np.int32)
+        for _ in range(count)
+    ]
+
+
+def assertSameContours(got, expected):
+    assert len(got) == len(expected)
+    for a, b in zip(got, expected):
+        assert a.shape == b.shape
+        np.testing.assert_array_equal(a, b)
+
+
+def test_put_then_get(tmp_path):
+    cache = ContourCache(tmp_path / "cache")
+    rnd = np.random.default_rng(0)
+    key = cache.key(b"image", {"cannyLow": 100})
+    assert cache.get(key) is None
+    stored = contours(rnd, 20)
+    cache.put(key, stored)
+    assertSameContours(cache.get(key), stored)
+    cache.put(cache.key(b"empty", {}), [])
+    assert cache.get(cache.key(b"empty", {})) == []
+    assert (cache.hits, cache.misses) == (2, 1)
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hitRate"] == 2 / 3
+    # no temp files are left behind
+    assert (
+        sorted(path.suffix for path in (tmp_path / "cache").iterdir()) == [".npz"] * 2
+    )
+
+
+def test_key_follows_the_image_and_the_params(tmp_path):
+    cache = ContourCache(tmp_path)
+    key = cache.key(b"image", {"cannyLow": 100, "cannyHigh": 150})
+    assert key == cache.key(b"image", {"cannyHigh": 150, "cannyLow": 100})
+    assert key != cache.key(b"imagf", {"cannyLow": 100, "cannyHigh": 150})
+    assert key != cache.key(b"image", {"cannyLow": 101, "cannyHigh": 150})
+    assert key != cache.key(b"image", {"cannyLow": 100})
+
+
+def test_broken_entry_is_a_miss(tmp_path):
+    cache = ContourCache(tmp_path)
+    key = cache.key(b"image", {})
+    (tmp_path / f"{key}.npz").write_bytes(b"not a zip file")
+    assert cache.get(key) is None
+    assert cache.misses == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    rnd = np.random.default_rng(1)
+    cache = ContourCache(tmp_path)
+    # random points of the same count compress to about the same size
+    entries = [[rnd.integers(0, 1000, size=(500, 1, 2))] for _ in range(5)]
+    keys = [cache.key(bytes([i]), {}) for i in range(4)]
+    for age, key in enumerate(keys):
+        cache.put(key, entries[age])
+        os.utime(tmp_path / f"{key}.npz", (1000 + age, 1000 + age))
+    size = max(path.stat().st_size for path in tmp_path.glob("*.npz")) + 100
+    # reading the oldest one makes it the most recently used
+    assert cache.get(keys[0]) is not None
+    cache.maxBytes = 3 * size
+    cache.put(cache.key(b"new", {}), entries[4])
+    assert cache.evictions == 2
+    assert cache.get(keys[1]) is None and cache.get(keys[2]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[3]) is not None
+    assert cache.stats()["entries"] == 3
+
+
+def test_contour_finder_uses_the_cache(tmp_path):
+    image = np.zeros((60, 80, 3), dtype=np.uint8)
+    cv2.rectangle(image, (10, 10), (50, 40), (255, 255, 255), -1)
+    path = tmp_path / "square.png"
+    cv2.imwrite(str(path), image)
+    cache = ContourCache(tmp_path / "cache")
+
+    first = ContourFinder(Img(path), cache=cache).find()
+    assert (cache.hits, cache.misses) == (0, 1)
+    again = ContourFinder(Img(path), cache=cache).find()
+    assert (cache.hits, cache.misses) == (1, 1)
+    assertSameContours(again, first)
+    # other parameters are another entry
+    ContourFinder(Img(path), cache=cache, cannyLow=50).find()
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.stats()["entries"] == 2
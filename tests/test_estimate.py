@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+import pytest
+
+from estimate import _moveTimes, estimate, machineLimits
+from gcode import KIND_PAUSE, KIND_REFILL, KIND_WASH, MoveBuffer
+from machine import DEFAULT_PROFILE
+
+LIMITS = {
+    "maxAccel": {"X": 1000.0, "Y": 1000.0, "Z": 1000.0},
+    "maxFeed": {"X": 200.0, "Y": 200.0, "Z": 200.0},
+    "printAccel": 500.0,
+    "travelAccel": 500.0,
+    "jerk": {"X": 10.0, "Y": 10.0, "Z": 10.0},
+}
+
+
+def trapezoid(length, cruise, accel, v0, v1):
+    # seconds for one move from v0 to v1, reaching cruise speed or not
+    up = (cruise**2 - v0**2) / (2 * accel)
+    down = (cruise**2 - v1**2) / (2 * accel)
+    if up + down <= length:
+        return (
+            (cruise - v0) / accel
+            + (cruise - v1) / accel
+            + (length - up - down) / cruise
+        )
+    peak = math.sqrt((2 * accel * length + v0**2 + v1**2) / 2)
+    return (peak - v0) / accel + (peak - v1) / accel
+
+
+def singleMove(length, feed):
+    # one move along X from rest, the jerk lets it start and stop at 10 mm/s
+    return _moveTimes(
+        np.array([[length, 0.0, 0.0]]),
+        np.array([length]),
+        np.array([feed]),
+        np.array([True]),
+        LIMITS,
+    )[0]
+
+
+def test_move_reaching_full_speed_is_a_trapezoid():
+    assert singleMove(100, 50) == pytest.approx(trapezoid(100, 50, 500, 10, 10))
+    # 0.08 s up to speed and down again, 95.2 mm at 50 mm/s
+    assert singleMove(100, 50) == pytest.approx(0.16 + 95.2 / 50)
+
+
+def test_short_move_is_a_triangle():
+    peak = math.sqrt((2 * 500 * 1 + 10**2 + 10**2) / 2)
+    assert peak < 50
+    assert singleMove(1, 50) == pytest.approx(2 * (peak - 10) / 500)
+    assert singleMove(1, 50) == pytest.approx(trapezoid(1, 50, 500, 10, 10))
+
+
+def test_axis_feed_limit_caps_the_cruise_speed():
+    assert singleMove(1000, 1000) == pytest.approx(trapezoid(1000, 200, 500, 10, 10))
+
+
+def test_straight_line_corners_keep_their_speed():
+    # two moves in a row along X behave like one of both lengths
+    seconds = _moveTimes(
+        np.array([[50.0, 0, 0], [50.0, 0, 0]]),
+        np.array([50.0, 50.0]),
+        np.array([50.0, 50.0]),
+        np.array([True, False]),
+        LIMITS,
+    )
+    assert seconds.sum() == pytest.approx(trapezoid(100, 50, 500, 10, 10))
+
+
+def moves(rows):
+    buffer = MoveBuffer()
+    for row in rows:
+        buffer.add(**row)
+    return buffer
+
+
+def test_pause_stops_the_machine_and_adds_no_time():
+    limits = machineLimits()
+    accel = limits["travelAccel"]
+    jerk = limits["jerk"]["X"]
+    feed = 3000  # mm/min, 50 mm/s is under every limit
+    straight = estimate(moves([{"x": 50, "f": feed}, {"x": 100}]), start=(0, 0, 100))
+    paused = estimate(
+        moves([{"x": 50, "f": feed}, {"kind": KIND_PAUSE}, {"x": 100}]),
+        start=(0, 0, 100),
+    )
+    assert straight["seconds"] == pytest.approx(trapezoid(100, 50, accel, jerk, jerk))
+    # from rest to rest twice, waiting for the user isn't counted
+    assert paused["seconds"] == pytest.approx(2 * trapezoid(50, 50, accel, jerk, jerk))
+    assert paused["pauses"] == 1
+    assert paused["penUpDistance"] == straight["penUpDistance"] == 100
+
+
+def test_only_drawing_counts_as_pen_down():
+    z = DEFAULT_PROFILE.zHeight
+    rows = [
+        {"x": 0, "y": 0, "z": z, "f": 1200},
+        {"x": 30, "y": 40},
+        # dipping and wiping in the pots happens at the same height
+        {"x": 60, "y": 40, "kind": KIND_REFILL},
+        {"x": 60, "y": 70, "kind": KIND_WASH},
+        {"x": 80, "y": 70, "immuneToLimits": True},
+        {"x": 90, "y": 70},
+    ]
+    report = estimate(moves(rows), start=(0, 0, z))
+    assert report["penDownDistance"] == pytest.approx(50 + 10)
+    assert report["penUpDistance"] == pytest.approx(30 + 30 + 20)
+    assert report["refills"] == report["washes"] == 1
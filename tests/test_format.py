@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from gcode import GcodeBlock, Move, MoveBuffer, Pause, formatLines, formatMoves
+
+VALUES = [None, 0, 12, -19, 1500, 0.0, -19.0, 1500.0, 0.5, -0.25, 1 / 3, 1e-7, 123.456]
+
+
+def randomMoves(seed, count=300):
+    rnd = random.Random(seed)
+
+    def axis():
+        return rnd.choice([None, rnd.uniform(-500, 500), rnd.randint(-500, 500)])
+
+    moves = []
+    for _ in range(count):
+        kind = Pause if rnd.random() < 0.05 else Move
+        moves.append(
+            kind(
+                x=axis(),
+                y=axis(),
+                z=axis(),
+                e=rnd.choice(VALUES),
+                f=rnd.choice(VALUES),
+                rapid=rnd.random() < 0.5,
+            )
+        )
+    return moves
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_same_text_as_get_command(seed):
+    moves = randomMoves(seed)
+    assert formatMoves(moves) == "\n".join(move.getCommand() for move in moves)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_buffer_rows_format_like_the_moves_they_give_back(seed):
+    buffer = MoveBuffer.fromMoves(randomMoves(seed))
+    assert formatMoves(buffer) == "\n".join(move.getCommand() for move in buffer)
+
+
+def test_whole_floats_keep_their_point():
+    moves = [Move(x=1, y=2, e=-19.0, f=1500.0), Move(x=1, y=2, e=-19, f=1500)]
+    assert formatLines(moves).tolist() == [
+        Move(x=1, y=2, e=-19.0, f=1500.0).getCommand(),
+        "G1 X1.00 Y2.00 E-19 F1500 ",
+    ]
+    assert formatLines(moves)[0] == "G1 X1.00 Y2.00 E-19.0 F1500.0 "
+
+
+def test_blocks_are_written_as_they_are():
+    block = GcodeBlock(MoveBuffer.fromMoves(randomMoves(0, 5)), name="wash")
+    moves = [Move(x=1, y=2, f=1500), block, Move(x=3, y=4, f=1500.0)]
+    lines = formatLines(moves).tolist()
+    assert lines == [moves[0].getCommand(), block.text, moves[2].getCommand()]
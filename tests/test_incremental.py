@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from incremental import IncrementalPlanner
+from maker import Maker, Preparer
+from strokes import StrokeSet
+
+COLORS = ["red", "green", "blue"]
+
+
+def randomStrokes(rnd, count):
+    strokes = []
+    for _ in range(count):
+        start = rnd.uniform(0, 500, size=2)
+        steps = rnd.normal(0, 8, size=(int(rnd.integers(2, 30)), 2))
+        strokes.append(np.round(start + np.cumsum(steps, axis=0)).tolist())
+    return strokes
+
+
+def replanned(planner):
+    # Preparer painting the planner's current order from scratch
+    order = planner.order()
+
+    class FixedOrder(Preparer):
+        def planStrokes(self):
+            return [
+                (color, StrokeSet.fromList([planner.strokes[i] for i in ids]))
+                for color, ids in order
+            ]
+
+    first = planner.firstId
+    ids = [i for _, group in order for i in group]
+    strokes = [planner.strokes[first].tolist()] + [
+        planner.strokes[i].tolist() for i in ids if i != first
+    ]
+    return Maker(profile=planner.profile).dump(FixedOrder(strokes).make())
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("multiColor", [False, True])
+def test_edits_match_a_full_replan(seed, multiColor):
+    rnd = np.random.default_rng(seed)
+    strokes = randomStrokes(rnd, 60)
+    colors = [str(c) for c in rnd.choice(COLORS, len(strokes))] if multiColor else None
+    planner = IncrementalPlanner(strokes, colors=colors)
+    expected = Maker().dump(Preparer(strokes, colors=colors).make())
+    assert planner.program() == expected
+    for _ in range(15):
+        ids = list(planner.strokes)
+        edit = rnd.random()
+        color = str(rnd.choice(COLORS)) if multiColor else None
+        if edit < 0.4:
+            planner.add(randomStrokes(rnd, 1)[0], color)
+        elif edit < 0.7 and len(ids) > 1:
+            planner.remove(int(rnd.choice(ids)))
+        else:
+            strokeId = int(rnd.choice(ids))
+            planner.change(strokeId, planner.strokes[strokeId] + 1.5, color)
+        assert planner.program() == replanned(planner)
+
+
+def test_fixed_transform_only_repaints_the_edit():
+    strokes = randomStrokes(np.random.default_rng(9), 200)
+    planner = IncrementalPlanner(strokes, refit=False)
+    planner.program()
+    strokeId = list(planner.strokes)[100]
+    planner.change(strokeId, planner.strokes[strokeId] + 0.5)
+    program = planner.program()
+    assert strokeId in planner.report["repainted"]
+    assert not planner.report["refit"]
+    assert planner.report["reformatted"] < 10
+    assert program == Maker().dump(planner.make())
+
+
+def test_fixed_transform_refits_when_the_bounds_change():
+    strokes = randomStrokes(np.random.default_rng(4), 50)
+    planner = IncrementalPlanner(strokes, refit=False)
+    planner.program()
+    planner.add([[-100, -100], [-90, -95]])
+    program = planner.program()
+    assert planner.report["refit"]
+    assert planner.report["reformatted"] == len(planner.parts)
+    assert program == replanned(planner)
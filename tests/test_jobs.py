@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, QueueFull
+
+
+def test_job_goes_from_queued_to_done():
+    release = threading.Event()
+    started = threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        return 42
+
+    queue = JobQueue(workers=1, maxQueued=2)
+    running = queue.submit(work)
+    assert started.wait(5)
+    assert running.status == RUNNING
+    waiting = queue.submit(lambda: "next")
+    assert waiting.status == QUEUED
+    assert queue.queued() == 1
+    release.set()
+    assert running.wait(5) and waiting.wait(5)
+    assert (running.status, running.result) == (DONE, 42)
+    assert (waiting.status, waiting.result) == (DONE, "next")
+    info = running.toDict()
+    assert info["status"] == DONE and info["seconds"] >= 0
+    assert "metrics" in info and "error" not in info
+    assert queue.get(running.id) is running
+
+
+def test_failed_job_keeps_its_error():
+    def work():
+        raise ValueError("no strokes")
+
+    job = JobQueue(workers=1).submit(work)
+    assert job.wait(5)
+    assert job.status == FAILED
+    assert job.result is None
+    assert job.toDict()["error"] == "ValueError: no strokes"
+
+
+def test_full_queue_raises():
+    queue = JobQueue(workers=0, maxQueued=2)  # nothing takes the jobs
+    jobs = [queue.submit(lambda: None) for _ in range(2)]
+    with pytest.raises(QueueFull):
+        queue.submit(lambda: None)
+    assert [job.status for job in jobs] == [QUEUED, QUEUED]
+    assert queue.get("no such job") is None
+
+
+def test_old_finished_jobs_are_forgotten():
+    queue = JobQueue(workers=1, keepFinished=2)
+    jobs = []
+    for i in range(5):
+        jobs.append(queue.submit(lambda i=i: i))
+        assert jobs[-1].wait(5)
+    # the worker forgets after it has finished the job
+    queue.submit(lambda: None).wait(5)
+    queue.submit(lambda: None).wait(5)
+    assert queue.get(jobs[0].id) is None
@@ -0,0 +1,21 @@
+import pytest
+
+from machine import MachineProfile
+from maker import Maker, Preparer
+
+STROKES = [[[0, 0], [50, 40], [90, 10]], [[10, 80], [60, 85]]]
+
+
+def program(profile):
+    moves = Preparer(STROKES, colors=["red", "blue"], profile=profile).make()
+    return Maker(profile=profile).dump(moves)
+
+
+@pytest.mark.parametrize("washPotY", [55.0, 55.5])
+def test_float_wash_pot_position(washPotY):
+    # profiles from JSON / TOML can hold floats anywhere
+    text = program(MachineProfile(washPotY=washPotY))
+    if washPotY == 55.0:
+        assert text == program(MachineProfile())
+    else:
+        assert "Y55.50" in text
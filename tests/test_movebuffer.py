@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+from gcode import (
+    KIND_BLOCK,
+    KIND_MOVE,
+    KIND_PAUSE,
+    KIND_REFILL,
+    GcodeBlock,
+    Move,
+    MoveBuffer,
+    Pause,
+    formatMoves,
+)
+
+
+def block(name, x):
+    moves = MoveBuffer()
+    moves.add(x, 10, 50, f=1200, immuneToLimits=True, kind=KIND_REFILL)
+    moves.add(x, 10, 20, immuneToLimits=True, kind=KIND_REFILL)
+    return GcodeBlock(moves, name)
+
+
+def buffer(rows, blocks=()):
+    # rows of (x, y, kind), with a block row for every entry of blocks first
+    moves = MoveBuffer(capacity=1)
+    for each in blocks:
+        moves.addBlock(each)
+    for x, y, kind in rows:
+        moves.add(x, y, rapid=x > 5, immuneToLimits=y > 5, kind=kind)
+    return moves
+
+
+def test_columns_have_their_dtypes():
+    moves = buffer([(1, 2, KIND_MOVE)], [block("refill", 1)])
+    for name, dtype in MoveBuffer.COLUMNS.items():
+        assert getattr(moves, name).dtype == dtype
+        assert len(getattr(moves, name)) == 2
+    assert moves.block.tolist() == [0, -1]
+    assert moves.kind.tolist() == [KIND_BLOCK, KIND_MOVE]
+    # missing axes are NaN, whole e / f come back as ints
+    moves.add(x=1.5, e=2.0, f=1200.0)
+    assert np.isnan(moves.y[-1]) and np.isnan(moves.z[-1])
+    last = moves[-1]
+    assert (last.x, last.y, last.e, last.f) == (1.5, None, 2, 1200)
+    assert isinstance(last.f, int)
+
+
+def test_grows_past_its_capacity():
+    moves = MoveBuffer(capacity=2)
+    xs = np.arange(1000, dtype=np.float64)
+    for x in xs[:10]:
+        moves.add(x, -x)
+    moves.addColumns(x=xs[10:], y=-xs[10:], rapid=True)
+    assert len(moves) == 1000
+    assert moves.x.tolist() == xs.tolist()
+    assert moves.y.tolist() == (-xs).tolist()
+    assert moves.rapid.tolist() == [False] * 10 + [True] * 990
+    assert moves.nbytes == 1000 * sum(
+        np.dtype(dtype).itemsize for dtype in MoveBuffer.COLUMNS.values()
+    )
+
+
+def test_rows_come_back_as_moves_pauses_and_blocks():
+    refill = block("refill", 3)
+    moves = buffer([(1, 2, KIND_MOVE), (7, 8, KIND_PAUSE)], [refill])
+    assert moves[0] is refill
+    assert type(moves[1]) is Move and (moves[1].x, moves[1].rapid) == (1, False)
+    assert type(moves[2]) is Pause and moves[2].immuneToLimits
+    copy = MoveBuffer.fromMoves(moves.toMoves())
+    assert formatMoves(copy) == formatMoves(moves)
+    with pytest.raises(IndexError):
+        moves[3]
+
+
+def test_concatenate_renumbers_blocks():
+    first, second, third = block("a", 1), block("b", 2), block("c", 3)
+    one = buffer([(1, 1, KIND_MOVE)], [first, second])
+    two = buffer([(2, 2, KIND_MOVE)], [third, first])
+    # blocks listed but not used by any row are dropped
+    three = buffer([(3, 3, KIND_PAUSE)])
+    three.blocks.append(block("unused", 4))
+    joined = MoveBuffer.concatenate([one, two, three])
+    assert len(joined) == 7
+    assert [joined[i] for i in (0, 1, 3, 4)] == [first, second, third, first]
+    assert joined.blocks == [first, second, third]
+    assert joined.block.tolist() == [0, 1, -1, 2, 0, -1, -1]
+    assert formatMoves(joined) == "\n".join(
+        formatMoves(part) for part in (one, two, three)
+    )
+    # extend gives the same rows
+    extended = MoveBuffer()
+    for part in (one, two, three):
+        extended.extend(part)
+    assert extended.block.tolist() == joined.block.tolist()
+    assert extended.blocks == joined.blocks
+    assert len(MoveBuffer.concatenate([])) == 0
+
+
+def test_take_keeps_kind_and_immune():
+    refill = block("refill", 3)
+    moves = buffer(
+        [(1, 2, KIND_MOVE), (7, 8, KIND_PAUSE), (4, 9, KIND_REFILL)], [refill]
+    )
+    taken = moves.take(np.array([3, 0, 1, 3]))
+    assert taken.kind.tolist() == [KIND_REFILL, KIND_BLOCK, KIND_MOVE, KIND_REFILL]
+    assert taken.immune.tolist() == [True, True, False, True]
+    assert taken.rapid.tolist() == [False, False, False, False]
+    assert taken[1] is refill
+    assert moves[1:3].x.tolist() == [1, 7]
+    # the copy is its own
+    taken.x[0] = 100
+    assert moves.x[3] == 4
+
+
+def test_expand_puts_the_block_moves_in():
+    refill = block("refill", 3)
+    moves = buffer([(1, 2, KIND_MOVE)], [refill, refill])
+    expanded = moves.expand()
+    assert not expanded.blocks
+    assert expanded.kind.tolist() == [KIND_REFILL] * 4 + [KIND_MOVE]
+    assert expanded.immune.tolist() == [True] * 4 + [False]
+    assert formatMoves(expanded) == formatMoves(moves)
+    # a block's own moves can't be changed
+    with pytest.raises(ValueError):
+        refill.moves.x[0] = 5
+
+
+def test_from_columns_wraps_the_arrays():
+    columns = {
+        name: np.zeros(3, dtype=dtype) for name, dtype in MoveBuffer.COLUMNS.items()
+    }
+    columns["block"][:] = -1
+    columns["x"][:] = [1, 2, 3]
+    moves = MoveBuffer.fromColumns(columns)
+    assert np.shares_memory(moves.x, columns["x"])
+    columns["x"][0] = 9
+    assert moves[0].x == 9
+    columns["y"] = np.zeros(2)
+    with pytest.raises(ValueError):
+        MoveBuffer.fromColumns(columns)
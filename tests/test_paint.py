@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import maker
+from machine import MachineProfile
+from maker import Preparer
+
+
+class LoopPreparer(Preparer):
+    # the stroke by stroke painting _paint replaced
+    def _paint(self, strokes):
+        travel = 0
+        for stroke in strokes:
+            travel = self._paintStroke(stroke.tolist(), travel)
+
+
+def randomStrokes(rnd, count):
+    strokes = [[[0, 0], [60, 45]]]
+    for _ in range(count):
+        points = int(rnd.choice([1, 2, 3, 7, 8, 9, rnd.integers(1, 200)]))
+        shape = rnd.integers(3)
+        if shape == 0:
+            stroke = rnd.integers(0, 50, size=(points, 2))
+        elif shape == 1:
+            stroke = np.cumsum(rnd.normal(0, 5, size=(points, 2)), axis=0) + 20
+        else:
+            # repeated points, zero length steps
+            stroke = np.repeat(
+                rnd.integers(0, 30, size=(points // 2 + 1, 2)), 2, axis=0
+            )
+            stroke = stroke[:points]
+        strokes.append(stroke.tolist())
+    return strokes
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_same_moves_as_painting_stroke_by_stroke(seed, monkeypatch):
+    rnd = np.random.default_rng(seed)
+    strokes = randomStrokes(rnd, int(rnd.integers(1, 40)))
+    profile = MachineProfile(maxStrokeLength=float(rnd.choice([3, 7, 10, 37.5, 700])))
+    colors = None
+    if seed % 3 == 0:
+        colors = [str(c) for c in rnd.choice(["red", "green", "blue"], len(strokes))]
+    # small windows and probes take the slower branches
+    monkeypatch.setattr(maker, "BRUSH_PROBE", 1 if seed % 2 else 16)
+    monkeypatch.setattr(maker, "BRUSH_WINDOW", 2 if seed % 5 == 0 else 512)
+    painted = Preparer(strokes, colors=colors, profile=profile).make()
+    expected = LoopPreparer(strokes, colors=colors, profile=profile).make()
+    assert [block.name for block in painted.blocks] == [
+        block.name for block in expected.blocks
+    ]
+    for name in painted.COLUMNS:
+        np.testing.assert_array_equal(
+            getattr(painted, name), getattr(expected, name), err_msg=name
+        )
@@ -0,0 +1,218 @@
+import random
+
+import numpy as np
+import pytest
+
+from gcode import (
+    KIND_MOVE,
+    KIND_PAUSE,
+    _ParseState,
+    SetupCNC,
+    formatLines,
+    parseFile,
+    parseLines,
+    parseMoves,
+)
+from maker import Maker, Preparer
+
+ODD_LINES = [
+    "G91",
+    "G90",
+    "G28",
+    "G28 X",
+    "G92 X1 Y2",
+    "G92",
+    "M0",
+    "M84 X Y E",
+    "; a comment",
+    "",
+    "  ",
+    "G2 X1 Y1 I1",
+    "N3 G1 X1*7",
+    "g1 x5",
+    "G1X2Y3",
+    "G1 (inline) X4",
+]
+
+
+def randomProgram(rnd, count):
+    def number():
+        pick = rnd.random()
+        if pick < 0.3:
+            return str(rnd.randint(-500, 500))
+        if pick < 0.9:
+            return "%.*f" % (rnd.randint(0, 6), rnd.uniform(-300, 300))
+        return rnd.choice(
+            ["-.5", "+3", "0.", ".25", "-0.00", "1.2.3", "-", "12345678901234567"]
+        )
+
+    lines = []
+    for _ in range(count):
+        if rnd.random() < 0.05:
+            lines.append(rnd.choice(ODD_LINES))
+            continue
+        words = (
+            ["G" + rnd.choice(["0", "1", "00", "01"])] if rnd.random() < 0.95 else []
+        )
+        words += [
+            letter + number() for letter in rnd.sample("XYZEF", rnd.randint(0, 5))
+        ]
+        if rnd.random() < 0.2:
+            rnd.shuffle(words)
+        lines.append(" ".join(words) + rnd.choice(["", " ", " ;c 1 X2", "\t"]))
+    return lines
+
+
+def bulkRows(chunks):
+    # every row of the chunks as x, y, z, e, f, rapid, kind, origin, position, line,
+    # feed, relative
+    columns = [
+        np.column_stack(
+            [
+                chunk.moves.x,
+                chunk.moves.y,
+                chunk.moves.z,
+                chunk.moves.e,
+                chunk.moves.f,
+                chunk.moves.rapid,
+                chunk.moves.kind,
+                chunk.origin,
+                chunk.position,
+                chunk.lines,
+                chunk.feed,
+                chunk.relative,
+            ]
+        )
+        for chunk in chunks
+    ]
+    return np.vstack(columns) if columns else np.zeros((0, 16))
+
+
+def lineRows(lines):
+    # the same, read one line at a time with _ParseState.parseLine
+    state = _ParseState()
+    rows = []
+    for number, line in enumerate(lines, 1):
+        row = state.parseLine(line)
+        if row is not None:
+            rows.append(row + (number, state.feed, state.relative))
+    return np.array(rows, dtype=np.float64).reshape(-1, 16)
+
+
+def assertSameRows(got, expected):
+    assert got.shape == expected.shape
+    np.testing.assert_array_equal(got, expected)
+    # -0.0 and 0.0 format differently
+    same = np.isnan(expected) | (np.signbit(got) == np.signbit(expected))
+    assert same.all()
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("chunkRows", [1, 3, 16384])
+def test_bulk_parsing_matches_line_by_line(seed, chunkRows):
+    rnd = random.Random(seed)
+    lines = randomProgram(rnd, rnd.randint(1, 300))
+    chunks = list(parseLines(lines, chunkRows))
+    assertSameRows(bulkRows(chunks), lineRows(lines))
+    assert chunks[-1].lineCount == len(lines)
+
+
+def program():
+    strokes = [[[0, 0], [50, 40], [90, 10]], [[10, 80], [60, 85]], [[30, 30], [35, 90]]]
+    return Maker().dump(Preparer(strokes, colors=["red", "blue", "red"]).make())
+
+
+@pytest.mark.parametrize("chunkRows", [3, 16384])
+def test_format_moves_round_trip(chunkRows):
+    # the start and end commands are written by hand, every generated move has to
+    # parse back to the line it came from
+    lines = program().split("\n")
+    setup = SetupCNC()
+    handWritten = set(setup.start_commands + setup.end_commands)
+    rows = 0
+    for chunk in parseLines(lines, chunkRows):
+        generated = np.array(
+            [text not in handWritten for text in chunk.text.tolist()], dtype=bool
+        )
+        formatted = formatLines(chunk.moves)
+        assert (formatted[generated] == chunk.text[generated]).all()
+        assert chunk.text.tolist() == [lines[number - 1] for number in chunk.lines]
+        rows += generated.sum()
+    assert rows > 20
+    assert len(parseMoves("\n".join(lines))) == sum(map(len, parseLines(lines)))
+
+
+def test_parse_file_keeps_line_numbers(tmp_path):
+    lines = program().split("\n")
+    path = tmp_path / "program.gcode"
+    path.write_text("\n".join(lines) + "\n")
+    fromFile = bulkRows(parseFile(path, chunkRows=7))
+    assertSameRows(fromFile, bulkRows(parseLines(lines, 7)))
+
+
+def positions(lines):
+    chunk = next(parseLines(lines))
+    return chunk, chunk.position.tolist()
+
+
+def test_relative_moves():
+    chunk, position = positions(
+        ["G90", "G1 X10 Y10 Z5 F100", "G91", "G1 X1 Y-2", "G1 Z3", "G90", "G1 X0"]
+    )
+    assert position == [[10, 10, 5], [11, 8, 5], [11, 8, 8], [0, 8, 8]]
+    assert chunk.relative.tolist() == [False, True, True, False]
+    assert chunk.origin[1].tolist() == [10, 10, 5]
+    assert chunk.feed.tolist() == [100] * 4
+
+
+def test_set_position_and_homing():
+    chunk, position = positions(
+        [
+            "G1 X10 Y10 Z5",
+            "G92 X0",
+            "G1 Y20",
+            "G92",
+            "G1 Z1",
+            "G28 X",
+            "G1 Y3",
+            "G28",
+            "G1 X1",
+        ]
+    )
+    assert position[:3] == [[10, 10, 5], [0, 20, 5], [0, 0, 1]]
+    assert np.isnan(position[3][0]) and position[3][1:] == [3, 1]
+    assert np.isnan(position[4][1:]).all() and position[4][0] == 1
+    assert chunk.other == {"G92": 2, "G28": 2}
+    # the first move starts from nowhere
+    assert np.isnan(chunk.origin[0]).all()
+
+
+def test_relative_move_from_unknown_position_stays_unknown():
+    _, position = positions(
+        ["G91", "G1 X5", "G90", "G1 X1 Y1 Z1", "G28", "G91", "G1 X1"]
+    )
+    assert np.isnan(position[0]).all()
+    assert np.isnan(position[2]).all()
+
+
+def test_comments_line_numbers_and_checksums():
+    chunk = next(
+        parseLines(
+            [
+                "; only a comment",
+                "G1 X1 Y2 ; G1 X9",
+                "G1 (move) X3",
+                "N10 G1 X4*55",
+                "x5",
+                "G0 Y6",
+                "M0 ; stop",
+                "Z7",
+            ]
+        )
+    )
+    assert chunk.lines.tolist() == [2, 3, 4, 5, 6, 7, 8]
+    assert chunk.moves.kind.tolist() == [KIND_MOVE] * 5 + [KIND_PAUSE, KIND_MOVE]
+    assert chunk.position[:, 0].tolist()[:4] == [1, 3, 4, 5]
+    # a line of only axes repeats the last motion mode
+    assert chunk.moves.rapid.tolist() == [False] * 4 + [True, False, True]
+    assert chunk.position[-1].tolist() == [5, 6, 7]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from strokes import CORNER_ANGLE, StrokeSet
+
+
+def randomStrokes(rnd, count):
+    # smooth wandering strokes, some with a sharp corner, some short or a single point
+    strokes = []
+    for _ in range(count):
+        n = int(rnd.integers(1, 200))
+        heading = np.cumsum(rnd.normal(0, 0.05, n))
+        if n > 20 and rnd.random() < 0.5:
+            heading[n // 2 :] += rnd.choice([-1, 1]) * rnd.uniform(1.5, 2.5)
+        steps = np.column_stack([np.cos(heading), np.sin(heading)]) * rnd.uniform(
+            0.2, 1
+        )
+        strokes.append(rnd.uniform(0, 100, size=2) + np.cumsum(steps, axis=0))
+    return strokes
+
+
+def arcError(points, radius):
+    # furthest the circle gets from each chord between resampled points on it
+    angle = np.unwrap(np.arctan2(points[:, 1], points[:, 0]))
+    t = np.linspace(0, 1, 50)[:, None]
+    between = angle[:-1] + (angle[1:] - angle[:-1]) * t
+    curve = radius * np.stack([np.cos(between), np.sin(between)], axis=-1)
+    start, delta = points[:-1], np.diff(points, axis=0)
+    cross = delta[:, 0] * (curve[..., 1] - start[:, 1]) - delta[:, 1] * (
+        curve[..., 0] - start[:, 0]
+    )
+    return (np.abs(cross) / np.hypot(delta[:, 0], delta[:, 1])).max()
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("spacing, tolerance", [(2.0, 0.01), (5.0, 0.05), (10.0, 0.2)])
+def test_ends_and_corners_are_kept_and_gaps_stay_under_spacing(
+    seed, spacing, tolerance
+):
+    rnd = np.random.default_rng(seed)
+    strokes = StrokeSet.fromList(randomStrokes(rnd, 20))
+    resampled = strokes.resample(spacing, tolerance, minSpacing=0.1)
+    assert len(resampled) == len(strokes)
+    assert (resampled.ids == strokes.ids).all()
+    for stroke, new in zip(strokes, resampled):
+        np.testing.assert_allclose(new[0], stroke[0])
+        np.testing.assert_allclose(new[-1], stroke[-1])
+        gaps = np.hypot(*np.diff(new, axis=0).T)
+        assert (gaps <= spacing + 1e-9).all()
+        delta = np.diff(stroke, axis=0)
+        turn = np.diff(np.arctan2(delta[:, 1], delta[:, 0]))
+        turn = (turn + np.pi) % (2 * np.pi) - np.pi
+        for corner in np.flatnonzero(np.abs(turn) > CORNER_ANGLE) + 1:
+            assert np.hypot(*(new - stroke[corner]).T).min() < 1e-9
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("spacing, tolerance", [(2.0, 0.01), (5.0, 0.05), (10.0, 0.2)])
+def test_chord_error_stays_within_tolerance(seed, spacing, tolerance):
+    rnd = np.random.default_rng(seed)
+    radius = rnd.uniform(3, 100)
+    angle = np.linspace(0, rnd.uniform(1, 6), 20000)
+    arc = np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+    resampled = StrokeSet.fromList([arc]).resample(spacing, tolerance)[0]
+    # the input is a polyline, its own corners cost a hair of the tolerance
+    assert arcError(resampled, radius) <= tolerance * 1.01
+    # and it isn't sampled any finer than it needs to be
+    step = min(np.sqrt(8 * tolerance * radius), spacing)
+    assert len(resampled) <= np.ceil(radius * angle[-1] / step) + 2
+
+
+def test_pixel_staircase_counts_as_a_line():
+    steps = np.repeat(np.arange(50), 2)
+    staircase = np.column_stack([steps[1:], steps[:-1]])
+    # steps shorter than 2 * minSpacing aren't corners
+    resampled = StrokeSet.fromList([staircase]).resample(5.0, 0.05, minSpacing=1.0)[0]
+    gaps = np.hypot(*np.diff(resampled, axis=0).T)
+    assert gaps.max() <= 5.0 + 1e-9
+    # about the full spacing along its 98 steps, rather than a point on every corner
+    assert len(resampled) < len(staircase) / 3
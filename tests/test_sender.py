@@ -0,0 +1,64 @@
+import pytest
+
+from maker import Maker, Preparer
+from sender import FakeMarlin, Sender, checksum, numbered, openPort
+
+
+def program():
+    strokes = [
+        [[0, 0], [50, 40], [90, 10], [120, 60]],
+        [[10, 80], [60, 85], [62, 90]],
+        [[30, 30], [35, 90]],
+    ]
+    return (
+        Maker()
+        .dump(Preparer(strokes, colors=["red", "blue", "red"]).make())
+        .split("\n")
+    )
+
+
+def commands(lines):
+    commands = (line.split(";")[0].strip() for line in lines)
+    return [command for command in commands if command]
+
+
+def test_numbered_line_has_its_checksum():
+    line = numbered(12, "G1 X1.00")
+    body, _, given = line.decode().rstrip("\n").partition("*")
+    assert body == "N12 G1 X1.00"
+    assert int(given) == checksum(body)
+
+
+@pytest.mark.parametrize("errorEvery", [None, 7])
+def test_stream_runs_every_command_once_in_order(errorEvery):
+    lines = program()
+    with FakeMarlin(timeScale=0.001, errorEvery=errorEvery) as marlin:
+        port = openPort(marlin.device)
+        try:
+            report = Sender(port).stream(lines)
+        finally:
+            port.close()
+        executed = list(marlin.executed)
+        controller = dict(marlin.report)
+
+    sent = commands(lines)
+    # the handshake's M110 runs first, resent lines are not run twice
+    assert executed == ["M110 N0"] + sent
+    assert report["lines"] == len(sent)
+    assert controller["overruns"] == 0
+    if errorEvery:
+        assert report["resends"] > 0
+        assert report["errors"] > 0
+        assert controller["resends"] >= report["resends"]
+    else:
+        assert report["resends"] == report["errors"] == 0
+    assert report["timeouts"] == 0
+
+    assert report["seconds"] > 0
+    assert report["linesPerSecond"] == pytest.approx(
+        report["lines"] / report["seconds"]
+    )
+    assert report["bytes"] >= sum(len(numbered(1, command)) for command in sent)
+    assert 0 < report["maxInFlightBytes"] <= 128
+    # FakeMarlin answers with ADVANCED_OK, so planner starvations are counted
+    assert isinstance(report["starvations"], int) and report["starvations"] >= 0
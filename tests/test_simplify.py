@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from gcode import MoveBuffer, simplifyMoves
+
+
+def stroke(xs, ys):
+    moves = MoveBuffer()
+    moves.addColumns(x=np.asarray(xs, float), y=np.asarray(ys, float), z=0.0, f=1500)
+    return moves
+
+
+def segmentDistance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    along = (
+        0.0
+        if length == 0
+        else np.clip(((px - ax) * dx + (py - ay) * dy) / length, 0, 1)
+    )
+    return np.hypot(px - ax - along * dx, py - ay - along * dy)
+
+
+def test_back_tracking_stroke_keeps_its_tip():
+    simplified = simplifyMoves(stroke([0, 10, 20, 30, 40, 25, 10], [0] * 7), 0.1)
+    assert simplified.x.tolist() == [0, 40, 10]
+
+
+def test_stroke_that_returns_to_its_start():
+    simplified = simplifyMoves(stroke([0, 5, 10, 5, 0], [0, 0, 0, 0, 0]), 0.1)
+    assert simplified.x.tolist() == [0, 10, 0]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_dropped_points_stay_within_tolerance(seed):
+    rnd = np.random.default_rng(seed)
+    xs = np.cumsum(rnd.uniform(-2, 2, 200))
+    ys = np.cumsum(rnd.uniform(-2, 2, 200))
+    tolerance = 0.5
+    simplified = simplifyMoves(stroke(xs, ys), tolerance)
+    kept = [
+        int(np.flatnonzero((xs == x) & (ys == y))[0])
+        for x, y in zip(simplified.x, simplified.y)
+    ]
+    assert kept[0] == 0 and kept[-1] == len(xs) - 1
+    for first, last in zip(kept[:-1], kept[1:]):
+        for i in range(first + 1, last):
+            dist = segmentDistance(
+                xs[i], ys[i], xs[first], ys[first], xs[last], ys[last]
+            )
+            assert dist <= tolerance + 1e-9
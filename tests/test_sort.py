@@ -0,0 +1,66 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from maker import Optomise
+from strokes import StrokeSet
+
+
+def greedy(strokes, allowReverse=False):
+    # the original scan over every remaining stroke, ties to the first one found
+    left = list(range(1, len(strokes)))
+    ordered = [strokes[0]]
+    while left:
+        endX, endY = ordered[-1][-1]
+        best = None
+        for i in left:
+            for reverse in (False, True) if allowReverse else (False,):
+                stroke = strokes[i][::-1] if reverse else strokes[i]
+                dist = math.sqrt(
+                    (stroke[0][0] - endX) ** 2 + (stroke[0][1] - endY) ** 2
+                )
+                if best is None or dist < best[0]:
+                    best = (dist, i, stroke)
+        left.remove(best[1])
+        ordered.append(best[2])
+    return ordered
+
+
+def randomStrokes(seed, count, span):
+    rnd = random.Random(seed)
+    return [
+        [[rnd.randint(0, span), rnd.randint(0, span)] for _ in range(rnd.randint(1, 4))]
+        for _ in range(count)
+    ]
+
+
+def hatching(count, length=400, spacing=3):
+    # every end is far from the next start, so the nearest start is many cells away
+    return [[[0, i * spacing], [length, i * spacing]] for i in range(count)]
+
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("allowReverse", [False, True])
+def test_same_order_as_greedy(seed, allowReverse):
+    # small spans give lots of ties
+    span = [3, 10, 1000][seed % 3]
+    strokes = randomStrokes(seed, random.Random(seed).randint(1, 80), span)
+    expected = greedy(strokes, allowReverse)
+    assert Optomise.sortStrokes(strokes, allowReverse=allowReverse) == expected
+
+
+@pytest.mark.parametrize("allowReverse", [False, True])
+def test_same_order_on_hatching(allowReverse):
+    strokes = hatching(600)
+    random.Random(0).shuffle(strokes)
+    expected = greedy(strokes, allowReverse)
+    assert Optomise.sortStrokes(strokes, allowReverse=allowReverse) == expected
+
+
+def test_same_order_for_stroke_sets():
+    strokes = randomStrokes(1, 300, 50)
+    ordered = Optomise.sortStrokes(StrokeSet.fromList(strokes))
+    assert ordered.tolist() == greedy(strokes)
+    assert Optomise.sortStrokes(np.array(hatching(50))) == hatching(50)
@@ -0,0 +1,23 @@
+import numpy as np
+
+from maker import Maker, Preparer
+
+STROKES = [[[0, 0], [50, 40], [90, 10]], [[10, 80], [60, 85]], [[30, 30], [35, 90]]]
+
+
+def test_make_twice_plans_the_same_moves():
+    preparer = Preparer(STROKES)
+    first = Maker().dump(preparer.make())
+    assert Maker().dump(preparer.make()) == first
+
+
+def test_make_after_load_replans(tmp_path):
+    preparer = Preparer(STROKES)
+    expected = Maker().dump(preparer.make())
+    preparer.save(tmp_path / "job.toolpath")
+    loaded = Preparer.load(tmp_path / "job.toolpath")
+    assert Maker().dump(loaded.moves) == expected
+    moves = loaded.make()
+    assert len(moves) == len(preparer.moves)
+    assert Maker().dump(moves) == expected
+    np.testing.assert_array_equal(moves.x, preparer.moves.x)
@@ -0,0 +1,78 @@
+import pytest
+
+from gcode import SetupCNC, parseLines
+from machine import DEFAULT_PROFILE
+from maker import Maker, Preparer
+from validate import PROBLEMS, Validator, validate
+
+SETUP = SetupCNC(DEFAULT_PROFILE).start_commands
+START = SETUP + ["G1 X100.00 Y150.00 Z130.00 E0 F1200 "]
+# one program per problem, each breaking only that rule on its last line
+BAD = {
+    "belowBed": START + ["G1 X100.00 Y150.00 Z30.00 "],
+    "offBed": START + ["G1 X250.00 Y150.00 Z40.00 "],
+    "potClearance": START + ["G0 X40.00 Y55.00 Z70.00 "],
+    "noFeed": SETUP + ["G1 X100.00 Y150.00 Z60.00 "],
+    "feedLimit": START + ["G1 X150.00 Y150.00 Z130.00 F999999 "],
+}
+
+
+def found(report):
+    return {
+        name: problem["count"]
+        for name, problem in report["problems"].items()
+        if problem["count"]
+    }
+
+
+def program(**options):
+    strokes = [[[0, 0], [50, 40], [90, 10]], [[10, 80], [60, 85]], [[30, 30], [35, 90]]]
+    moves = Preparer(strokes, colors=["red", "blue", "red"]).make()
+    return Maker(**options).dump(moves)
+
+
+def test_every_problem_has_a_bad_program():
+    assert set(BAD) == set(PROBLEMS)
+
+
+@pytest.mark.parametrize("name", sorted(PROBLEMS))
+def test_bad_program_is_flagged(name):
+    lines = BAD[name]
+    validator = Validator()
+    for chunk in parseLines(lines):
+        validator.check(chunk)
+    report = validator.report()
+    assert found(report) == {name: 1}
+    assert report["problems"][name]["examples"][0]["line"] == len(lines)
+    assert report["roundTrip"]["mismatches"] == 0
+    assert not report["ok"]
+
+
+@pytest.mark.parametrize("chunkRows", [3, 16384])
+@pytest.mark.parametrize(
+    "options", [{}, {"compress": True}, {"compress": True, "tolerance": 0.1}]
+)
+def test_generated_program_is_ok(options, chunkRows):
+    report = validate(program(**options).split("\n"), chunkRows=chunkRows)
+    assert found(report) == {}
+    assert report["roundTrip"]["mismatches"] == 0
+    assert report["roundTrip"]["checked"] > 0
+    assert report["ok"]
+
+
+def test_validate_reads_files(tmp_path):
+    path = tmp_path / "program.gcode"
+    path.write_text(program())
+    assert validate(path)["ok"]
+    assert validate(str(path), chunkRows=5)["ok"]
+
+
+def test_edited_line_is_a_round_trip_mismatch():
+    lines = program().split("\n")
+    row = next(i for i, line in enumerate(lines) if line.startswith("G1 X"))
+    lines[row] = lines[row].replace(".", ",", 1)
+    report = validate(lines)
+    assert report["roundTrip"]["mismatches"] == 1
+    assert report["roundTrip"]["examples"][0]["line"] == row + 1
+    assert not report["ok"]
+    assert "roundTrip" not in validate(lines, roundTrip=False)
@@ -0,0 +1,180 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from gcode import GcodeBlock, MoveBuffer
+from machine import MachineProfile
+from strokes import StrokeSet
+
+SUFFIX = ".toolpath"
+MAGIC = b"PAINTTP\0"
+VERSION = 1
+ALIGN = 64  # (bytes) every array starts on a multiple of this
+_PREFIX = len(MAGIC) + 8  # magic, version and header length (two little endian uint32)
+
+
+class Toolpath:
+    """
+    What a toolpath file holds, see load().
+
+    Parameters
+    ----------
+    moves: MoveBuffer|None
+        the planned moves, refill / wash blocks included
+    strokes: StrokeSet|None
+        the strokes the moves were planned from
+    profile: MachineProfile|None
+        the machine the moves were planned for
+    meta: dict
+        anything else that was saved with them (json types)
+    """
+
+    def __init__(self, moves=None, strokes=None, profile=None, meta=None):
+        self.moves = moves
+        self.strokes = strokes
+        self.profile = profile
+        self.meta = meta or {}
+
+
+def save(path, moves=None, strokes=None, profile=None, meta=None):
+    """
+    Write moves and / or strokes to a binary toolpath file.
+
+    The file is MAGIC, the format VERSION and the length of a json header, the header,
+    then every array as raw little endian bytes starting on an ALIGN boundary, so
+    load() can map them straight from the file. The header lists each array's dtype,
+    shape and offset, the profile and meta. GcodeBlocks are stored as their moves,
+    one table for all of them.
+
+    Parameters
+    ----------
+    path: path
+    moves: MoveBuffer|None
+    strokes: StrokeSet|None
+    profile: MachineProfile|None
+    meta: dict|None
+        extra json values to keep with the toolpath
+    """
+    arrays = {}
+    header = {"version": VERSION, "arrays": {}, "blocks": []}
+    if strokes is not None:
+        arrays["strokes.points"] = strokes.points
+        arrays["strokes.offsets"] = strokes.offsets
+        arrays["strokes.ids"] = strokes.ids
+    if moves is not None:
+        for name in MoveBuffer.COLUMNS:
+            arrays["moves." + name] = getattr(moves, name)
+        if moves.blocks:
+            blockMoves = MoveBuffer.concatenate(block.moves for block in moves.blocks)
+            for name in MoveBuffer.COLUMNS:
+                arrays["blockMoves." + name] = getattr(blockMoves, name)
+            header["blocks"] = [
+                {"name": block.name, "rows": len(block)} for block in moves.blocks
+            ]
+    header["profile"] = profile.toDict() if profile is not None else None
+    header["meta"] = meta or {}
+
+    # the offsets go in the header, which has to be written first, so lay it out
+    # with space for them and grow the space until it fits
+    arrays = {
+        name: np.ascontiguousarray(
+            array, dtype=np.asarray(array).dtype.newbyteorder("<")
+        )
+        for name, array in arrays.items()
+    }
+    reserved = ALIGN
+    while True:
+        offset = _align(_PREFIX + reserved)
+        for name, array in arrays.items():
+            header["arrays"][name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _align(offset + array.nbytes)
+        text = json.dumps(header).encode()
+        if len(text) <= reserved:
+            break
+        reserved = _align(len(text))
+
+    with open(path, "wb") as w:
+        w.write(MAGIC)
+        w.write(np.array([VERSION, reserved], dtype="<u4").tobytes())
+        w.write(text.ljust(reserved))
+        for name, array in arrays.items():
+            w.seek(header["arrays"][name]["offset"])
+            array.tofile(w)
+        w.truncate(offset)
+
+
+def load(path, mmap=True):
+    """
+    Read a toolpath file written by save().
+
+    With mmap the arrays are read only np.memmap views of the file, nothing is copied
+    until the moves or strokes are changed, and processes that load the same file
+    share its pages. Files from a newer version of the format are refused.
+
+    Returns
+    -------
+    Toolpath
+    """
+    path = Path(path)
+    with open(path, "rb") as r:
+        prefix = r.read(_PREFIX)
+        if len(prefix) < _PREFIX or prefix[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a toolpath file")
+        version, length = np.frombuffer(prefix[len(MAGIC) :], dtype="<u4").tolist()
+        if version > VERSION:
+            raise ValueError(
+                f"{path} is toolpath version {version}, this reads up to {VERSION}"
+            )
+        header = json.loads(r.read(length))
+
+    def array(name):
+        spec = header["arrays"].get(name)
+        if spec is None:
+            return None
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        if mmap:
+            if 0 in shape:
+                return np.empty(shape, dtype=dtype)
+            return np.memmap(
+                path, dtype=dtype, mode="r", offset=spec["offset"], shape=shape
+            )
+        with open(path, "rb") as r:
+            r.seek(spec["offset"])
+            return np.fromfile(r, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+    strokes = None
+    if "strokes.points" in header["arrays"]:
+        strokes = StrokeSet(
+            array("strokes.points"), array("strokes.offsets"), array("strokes.ids")
+        )
+    moves = None
+    if "moves.x" in header["arrays"]:
+        blocks = []
+        if header["blocks"]:
+            blockMoves = MoveBuffer.fromColumns(
+                {name: array("blockMoves." + name) for name in MoveBuffer.COLUMNS}
+            )
+            start = 0
+            for block in header["blocks"]:
+                end = start + block["rows"]
+                blocks.append(GcodeBlock(blockMoves[start:end], name=block["name"]))
+                start = end
+        moves = MoveBuffer.fromColumns(
+            {name: array("moves." + name) for name in MoveBuffer.COLUMNS}, blocks
+        )
+    profile = header["profile"]
+    return Toolpath(
+        moves=moves,
+        strokes=strokes,
+        profile=MachineProfile.fromDict(profile) if profile is not None else None,
+        meta=header["meta"],
+    )
+
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
@@ -0,0 +1,279 @@
+from pathlib import Path
+
+import numpy as np
+
+from estimate import AXES, machineLimits
+from gcode import KIND_PAUSE, PARSE_CHUNK, SetupCNC, formatLines, parseFile, parseLines
+from machine import DEFAULT_PROFILE
+
+EXAMPLES = 10  # lines kept for every kind of problem in a report
+SLACK = 0.005  # (mm) coordinates are written with 2 decimals
+# (mm) how far WashCycle.dryCycle wipes the brush around the dry spot
+DRY_REACH = (20, 10)
+PROBLEMS = {
+    "belowBed": "moves below the height where the brush touches the bed",
+    "offBed": "brush down outside of the bed and the pots",
+    "potClearance": "moves over the pots lower than their entry height, outside a pot",
+    "noFeed": "moves before any feed rate was given, or with F <= 0",
+    "feedLimit": "moves faster than the M203 feed rate of an axis",
+}
+
+
+def _potZones(profile):
+    # where the brush may go down near the pots: (x, y, radius) circles for the color
+    # pots and the wash pot, the drying area as a box, and the box around all of them
+    radius = profile.potSpacing / 2
+    circles = [
+        (profile.firstPotX + position * profile.potSpacing, profile.firstPotY, radius)
+        for position in sorted(set(profile.pots.values()))
+    ]
+    circles.append((profile.washPotX, profile.washPotY, radius))
+    circles = np.array(circles, dtype=np.float64)
+    reachX, reachY = DRY_REACH
+    dry = (
+        profile.dryX - reachX,
+        profile.washPotY - reachY,
+        profile.dryX + reachX,
+        profile.washPotY + reachY,
+    )
+    area = (
+        min((circles[:, 0] - circles[:, 2]).min(), dry[0]),
+        min((circles[:, 1] - circles[:, 2]).min(), dry[1]),
+        max((circles[:, 0] + circles[:, 2]).max(), dry[2]),
+        max((circles[:, 1] + circles[:, 2]).max(), dry[3]),
+    )
+    return circles, dry, area
+
+
+def _zone(x, y, circles, dry):
+    # index of the pot (or len(circles) for the drying area) every point is in, -1 if none
+    zone = np.full(len(x), -1)
+    inDry = (
+        (x >= dry[0] - SLACK)
+        & (x <= dry[2] + SLACK)
+        & (y >= dry[1] - SLACK)
+        & (y <= dry[3] + SLACK)
+    )
+    zone[inDry] = len(circles)
+    for i, (cx, cy, radius) in reversed(list(enumerate(circles.tolist()))):
+        zone[np.hypot(x - cx, y - cy) <= radius + SLACK] = i
+    return zone
+
+
+def _crosses(start, end, box):
+    # whether each segment start -> end (x, y columns) passes through box, clipped
+    # Liang-Barsky style
+    low = np.zeros(len(start))
+    high = np.ones(len(start))
+    for axis, (lower, upper) in enumerate(((box[0], box[2]), (box[1], box[3]))):
+        delta = end[:, axis] - start[:, axis]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a = (lower - start[:, axis]) / delta
+            b = (upper - start[:, axis]) / delta
+        flat = delta == 0
+        inside = (start[:, axis] >= lower) & (start[:, axis] <= upper)
+        # parallel to this side: inside the slab all the way or never
+        a = np.where(flat, np.where(inside, -np.inf, np.inf), a)
+        b = np.where(flat, np.inf, b)
+        low = np.maximum(low, np.minimum(a, b))
+        high = np.minimum(high, np.maximum(a, b))
+    return low <= high
+
+
+def _code(line):
+    # a line without its comment and the spaces around it
+    return line.partition(";")[0].strip().upper()
+
+
+class Validator:
+    def __init__(self, profile=None, roundTrip=True, examples=EXAMPLES):
+        """
+        Checks a G-code program a ParsedMoves chunk at a time, so any size of program
+        is checked in bounded memory.
+
+        Looks for the mistakes that break a brush or ruin a painting: moves below the
+        bed, the brush on the paper outside of it, moves over the pots lower than
+        their entry height (unless the brush stays inside one pot or the drying
+        area), missing feed rates and feed rates over the M203 limits of the profile's
+        start G-code. With roundTrip, every row has to format back to the line it
+        was read from, which holds for everything formatMoves wrote, the profile's
+        start / end commands are left out.
+
+        Parameters
+        ----------
+        profile: MachineProfile|None
+            the machine the program is for, None for DEFAULT_PROFILE
+        roundTrip: bool
+            check that the rows format back to their lines
+        examples: int
+            lines kept as examples of each problem
+        """
+        self.profile = profile or DEFAULT_PROFILE
+        self.roundTrip = roundTrip
+        self.examples = examples
+        setup = self.profile.cached("setup", lambda: SetupCNC(self.profile))
+        self.setupCodes = {
+            _code(line) for line in setup.start_commands + setup.end_commands
+        }
+        limits = machineLimits(setup)
+        self.maxFeed = np.array([limits["maxFeed"][axis] for axis in AXES])
+        self.circles, self.dry, self.potArea = _potZones(self.profile)
+        self.lines = 0
+        self.moves = 0
+        self.pauses = 0
+        self.relative = 0
+        self.commands = {}
+        self.problems = {name: [0, []] for name in PROBLEMS}
+        self.checked = 0
+        self.mismatches = [0, []]
+
+    def _found(self, entry, chunk, mask):
+        rows = np.flatnonzero(mask)
+        entry[0] += len(rows)
+        for row in rows[: self.examples - len(entry[1])].tolist():
+            entry[1].append(
+                {"line": int(chunk.lines[row]), "text": str(chunk.text[row])}
+            )
+
+    def check(self, chunk):
+        """add the rows of one ParsedMoves to the report"""
+        self.lines = chunk.lineCount
+        for code, count in chunk.other.items():
+            self.commands[code] = self.commands.get(code, 0) + count
+        moving = chunk.moves.kind != KIND_PAUSE
+        self.moves += int(np.count_nonzero(moving))
+        self.pauses += len(chunk) - int(np.count_nonzero(moving))
+        self.relative += int(np.count_nonzero(chunk.relative))
+        profile = self.profile
+        origin, position = chunk.origin, chunk.position
+        x, y, z = position.T
+        with np.errstate(invalid="ignore"):
+            self._found(
+                self.problems["belowBed"], chunk, moving & (z < profile.zHeight - SLACK)
+            )
+            outside = (
+                (x < profile.minX - SLACK)
+                | (x > profile.maxX + SLACK)
+                | (y < profile.minY - SLACK)
+                | (y > profile.maxY + SLACK)
+            )
+            # the wash cycle scrubs the brush on the bottom of the wash pot
+            offBed = np.flatnonzero(moving & (z <= profile.zHeight + SLACK) & outside)
+            inPot = _zone(x[offBed], y[offBed], self.circles, self.dry) >= 0
+            mask = np.zeros(len(chunk), dtype=bool)
+            mask[offBed[~inPot]] = True
+            self._found(self.problems["offBed"], chunk, mask)
+            self._checkPots(chunk, moving, origin, position)
+            self._checkFeed(chunk, moving, origin, position)
+        if self.roundTrip:
+            self._checkRoundTrip(chunk)
+
+    def _checkPots(self, chunk, moving, origin, position):
+        # a move from an unknown place is only checked where it ends
+        known = ~np.isnan(origin).any(axis=1)
+        start = np.where(known[:, None], origin, position)
+        low = np.fmin(start[:, 2], position[:, 2]) < self.profile.potEntryHeight - SLACK
+        overPots = _crosses(start[:, :2], position[:, :2], self.potArea)
+        suspect = np.flatnonzero(moving & low & overPots)
+        # going down into a pot (or the drying area) and back up is what they're for
+        startZone = _zone(*start[suspect, :2].T, self.circles, self.dry)
+        endZone = _zone(*position[suspect, :2].T, self.circles, self.dry)
+        bad = np.zeros(len(chunk), dtype=bool)
+        bad[suspect] = (endZone < 0) | (startZone != endZone)
+        self._found(self.problems["potClearance"], chunk, bad)
+
+    def _checkFeed(self, chunk, moving, origin, position):
+        feed = chunk.feed / 60  # mm/s
+        self._found(
+            self.problems["noFeed"], chunk, moving & (np.isnan(feed) | (feed <= 0))
+        )
+        delta = np.abs(position - origin)
+        length = np.sqrt((delta**2).sum(axis=1))
+        with np.errstate(divide="ignore"):
+            axisSpeed = feed[:, None] * delta / length[:, None]
+        tooFast = (axisSpeed > self.maxFeed + 1e-9).any(axis=1)
+        # without a known start the move could go along any axis
+        unknown = np.isnan(length)
+        tooFast[unknown] = feed[unknown] > self.maxFeed.max() + 1e-9
+        self._found(self.problems["feedLimit"], chunk, moving & tooFast)
+
+    def _checkRoundTrip(self, chunk):
+        lines = formatLines(chunk.moves)
+        differ = np.flatnonzero((lines != chunk.text) & ~chunk.relative)
+        mismatch = np.zeros(len(chunk), dtype=bool)
+        for row in differ.tolist():
+            text = _code(chunk.text[row])
+            mismatch[row] = text != _code(lines[row]) and text not in self.setupCodes
+        self.checked += len(chunk) - int(np.count_nonzero(chunk.relative))
+        self._found(self.mismatches, chunk, mismatch)
+
+    def report(self):
+        """
+        Returns
+        -------
+        dict
+            lines, moves, pauses, relative (rows written in G91 mode), commands (code ->
+            count of the other commands), problems (name -> {count, examples}, see
+            PROBLEMS), roundTrip ({checked, mismatches, examples}, if it was asked for)
+            and ok, no problems and no mismatches
+        """
+        report = {
+            "lines": self.lines,
+            "moves": self.moves,
+            "pauses": self.pauses,
+            "relative": self.relative,
+            "commands": dict(self.commands),
+            "problems": {
+                name: {"count": count, "examples": list(examples)}
+                for name, (count, examples) in self.problems.items()
+            },
+        }
+        ok = not any(count for count, _ in self.problems.values())
+        if self.roundTrip:
+            report["roundTrip"] = {
+                "checked": self.checked,
+                "mismatches": self.mismatches[0],
+                "examples": list(self.mismatches[1]),
+            }
+            ok = ok and not self.mismatches[0]
+        report["ok"] = ok
+        return report
+
+
+def validate(program, profile=None, roundTrip=True, chunkRows=PARSE_CHUNK):
+    """
+    Check a G-code program with a Validator, reading it chunkRows lines at a time.
+
+    Parameters
+    ----------
+    program: str|Path|iterable of str
+        path of a G-code file, or its lines
+    profile, roundTrip:
+        as for Validator
+
+    Returns
+    -------
+    dict
+        Validator.report()
+    """
+    if isinstance(program, (str, Path)):
+        chunks = parseFile(program, chunkRows)
+    else:
+        chunks = parseLines(program, chunkRows)
+    validator = Validator(profile, roundTrip=roundTrip)
+    for chunk in chunks:
+        validator.check(chunk)
+    return validator.report()
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    from machine import MachineProfile
+
+    # python3 validate.py program.gcode [machine.json|machine.toml]
+    profile = MachineProfile.load(sys.argv[2]) if len(sys.argv) > 2 else None
+    report = validate(sys.argv[1], profile)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)